@@ -1,6 +1,7 @@
 from pymongo import MongoClient
 from datetime import datetime
 from config import MONGO_URI
+import changes
 
 # Connect to MongoDB
 client = MongoClient(MONGO_URI)
@@ -667,7 +668,9 @@ def add_pandals():
         db.pandals.create_index([("location", "2dsphere")])
         
         # Insert all pandals
-        result = db.pandals.insert_many(mumbai_pandals)
+        # Stamped like every other write, so /api/pandals/changes serves them
+        with changes.reserved(db, len(mumbai_pandals)) as first:
+            result = db.pandals.insert_many(changes.stamp_many(mumbai_pandals, first))
         print(f"Successfully added {len(result.inserted_ids)} pandals!")
         
         # Verify the count
@@ -0,0 +1,33 @@
+"""Admin gate for operational endpoints.
+
+A request is treated as coming from an admin when either
+
+  * the logged-in user's email is listed in ADMIN_EMAILS, or
+  * it carries an X-Admin-Token header equal to ADMIN_TOKEN
+
+Neither is configured by default, so the gate is closed until one is set.
+"""
+import hmac
+from functools import wraps
+
+from flask import current_app, jsonify, request
+from flask_login import current_user
+
+
+def is_admin():
+    token = current_app.config.get("ADMIN_TOKEN")
+    supplied = request.headers.get("X-Admin-Token")
+    if token and supplied and hmac.compare_digest(token, supplied):
+        return True
+    if current_user.is_authenticated:
+        return current_user.email in current_app.config.get("ADMIN_EMAILS", ())
+    return False
+
+
+def admin_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not is_admin():
+            return jsonify({"error": "Admin access required"}), 403
+        return view(*args, **kwargs)
+    return wrapper
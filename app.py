@@ -1,66 +1,229 @@
-from flask import Flask, render_template, redirect, url_for, request, jsonify, send_file, session
+from flask import Flask, render_template, redirect, url_for, request, jsonify, send_file, session, make_response, current_app
+from markupsafe import Markup
 from flask_pymongo import PyMongo
 from bson.objectid import ObjectId
+from werkzeug.local import LocalProxy
 import config
-from geopy.distance import geodesic
-from geopy.geocoders import Nominatim
-import folium
-from folium import plugins
 import tempfile
 import os
-import requests
+import time
+import hashlib
+import importlib
+from functools import lru_cache
 from datetime import datetime
 from flask_login import LoginManager, current_user, login_user, logout_user, login_required
-from oauthlib.oauth2 import WebApplicationClient
 import json
 from models.user import User
+import opening_hours
+import page_cache
+import assets
+import instrumentation
+import profiler
+import slowlog
+import leaderboard
+import columnar
+import changes
+import geofence
+import heatmap
+from admin import admin_required, is_admin
 
-app = Flask(__name__)
-app.config.from_object(config)
+# folium, geopy, oauthlib, requests, numpy (via neighbours) and httpx (via
+# upstream) are imported inside the functions that need them, so starting a
+# worker does not pay for modules most requests never touch.
 
-# Allow OAuth over HTTP for development
-os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
+# Extensions are bound to the app in create_app()
+login_manager = LoginManager()
+mongo = PyMongo()
+
+# Rendered page cache; set PAGE_CACHE_URL to a redis:// URL to share it between
+# workers, otherwise each worker keeps its own and invalidations go through Mongo
+cache = page_cache.PageCache()
+# Pandal card fragments, bounded separately (FRAGMENT_CACHE_SIZE) so a large
+# catalog's cards don't push pages out
+fragments = page_cache.PageCache(maxsize=page_cache.DEFAULT_FRAGMENT_MAXSIZE, name="FRAGMENT")
 
-# Set session configuration
-app.config['SESSION_COOKIE_SECURE'] = False  # Set to True in production
-app.config['SESSION_COOKIE_HTTPONLY'] = True
-app.config['PERMANENT_SESSION_LIFETIME'] = 3600  # 1 hour
+# Collections
+pandals = LocalProxy(lambda: mongo.db.pandals)
+users = LocalProxy(lambda: mongo.db.users)
+visits = LocalProxy(lambda: mongo.db.visits)
+ratings = LocalProxy(lambda: mongo.db.ratings)
+badges = LocalProxy(lambda: mongo.db.badges)
+recommendations = LocalProxy(lambda: mongo.db.recommendations)
 
-# OAuth 2.0 client setup
-client = WebApplicationClient(config.GOOGLE_CLIENT_ID)
+# Routes are collected here and registered on the app in create_app()
+_routes = []
 
-# Flask-Login setup
-login_manager = LoginManager()
-login_manager.init_app(app)
+def route(rule, **options):
+    def decorator(view):
+        _routes.append((rule, view, options))
+        return view
+    return decorator
+
+# Nominatim geocoder user agent
+NOMINATIM_USER_AGENT = "UtsavDarshan_" + datetime.now().strftime("%Y%m%d")
+
+@lru_cache(maxsize=None)
+def get_geolocator():
+    from geopy.geocoders import Nominatim
+    return Nominatim(user_agent=NOMINATIM_USER_AGENT)
+
+@lru_cache(maxsize=None)
+def get_oauth_client():
+    from oauthlib.oauth2 import WebApplicationClient
+    return WebApplicationClient(current_app.config["GOOGLE_CLIENT_ID"])
 
-# Initialize Nominatim geocoder with a custom user agent
-geolocator = Nominatim(user_agent="UtsavDarshan_" + datetime.now().strftime("%Y%m%d"))
+# User records by id, so logged-in page views don't hit users on every request.
+# Per process; callback() refreshes the entry when a profile is upserted.
+user_cache = page_cache.LRUBackend()
+SESSION_PROFILE_FIELDS = ("_id", "name", "email", "profile_pic")
+
+def cache_user(user_data):
+    user_cache.set(user_data["_id"], user_data, ttl=current_app.config.get("USER_CACHE_TTL", 300))
 
 @login_manager.user_loader
 def load_user(user_id):
-    user_data = users.find_one({"_id": user_id})
-    if not user_data:
-        return None
+    # With SESSION_USER_PROFILE the signed session cookie carries the profile
+    profile = session.get("user_profile")
+    if profile and profile.get("_id") == user_id:
+        return User(profile)
+    user_data = user_cache.get(user_id)
+    if user_data is None:
+        user_data = users.find_one({"_id": user_id})
+        if not user_data:
+            return None
+        cache_user(user_data)
     return User(user_data)
 
-# MongoDB connection
-app.config["MONGO_URI"] = config.MONGO_URI
-mongo = PyMongo(app)
+# Precomputed nearest-pandal table (see neighbours.py)
+@lru_cache(maxsize=None)
+def get_neighbour_index(directory):
+    import neighbours
+    return neighbours.NeighbourIndex(directory)
 
-# Collections
-pandals = mongo.db.pandals
-users = mongo.db.users
-visits = mongo.db.visits
-ratings = mongo.db.ratings
-badges = mongo.db.badges
+def refresh_neighbours(changed_ids=None, deleted_ids=()):
+    import neighbours
+    try:
+        neighbours.update_neighbours(pandals, current_app.config["NEIGHBOUR_DIR"],
+                                     changed_ids=changed_ids, deleted_ids=deleted_ids)
+    except Exception as e:
+        print(f"Failed to update neighbour table: {str(e)}")
+
+# Precomputed content-similarity table (see similar.py)
+@lru_cache(maxsize=None)
+def get_similar_index(directory):
+    import similar
+    return similar.SimilarIndex(directory)
+
+def refresh_similar(changed_ids=None, deleted_ids=()):
+    import similar
+    try:
+        similar.update_similar(pandals, current_app.config["SIMILAR_DIR"],
+                               changed_ids=changed_ids, deleted_ids=deleted_ids)
+    except Exception as e:
+        print(f"Failed to update similarity table: {str(e)}")
+
+# Local road router (see router.py); with ROAD_GRAPH set, routes and nearby
+# durations come from the graph file instead of the public OSRM server
+PUBLIC_OSRM_URL = "https://router.project-osrm.org/route/v1/driving"
+
+@lru_cache(maxsize=None)
+def get_road_graph(path):
+    import router
+    return router.RoadGraph.load(path)
+
+def routing_url():
+    """OSRM /route/v1/driving base URL for the directions code in the browser"""
+    if current_app.config.get("ROAD_GRAPH"):
+        return request.script_root + "/route/v1/driving"
+    return current_app.config.get("ROUTING_URL", PUBLIC_OSRM_URL)
+
+# Ward/taluka polygons (see boundaries.py); with AREA_BOUNDARIES set, a new
+# pandal's area comes from where its point falls rather than free text
+@lru_cache(maxsize=None)
+def get_area_index(path, name_property=None):
+    import boundaries
+    return boundaries.AreaIndex.from_geojson(path, name_property)
+
+def area_index():
+    path = current_app.config.get("AREA_BOUNDARIES")
+    return get_area_index(path, current_app.config.get("AREA_NAME_PROPERTY")) if path else None
+
+def assign_area(pandal):
+    areas = area_index()
+    if areas is not None:
+        areas.assign(pandal)
+    return pandal
+
+# Fields shown on an all_pandals.html card; a change to any of them re-renders it
+CARD_FIELDS = ("_id", "name", "area", "theme", "image", "location", "avg_rating", "review_count")
+card_stats = page_cache.FragmentStats()
+
+def render_pandal_cards(pandal_list):
+    """Render pandal cards, reusing cached fragments whose data is unchanged.
+
+    Returns the list of card HTML fragments and how many came from the cache.
+    """
+    cards = []
+    hits = 0
+    for p in pandal_list:
+        # One entry per pandal, "<version>\n<html>": a new version replaces the old
+        version = hashlib.md5(repr([p.get(f) for f in CARD_FIELDS]).encode("utf-8")).hexdigest()
+        key = f"card:{p['_id']}"
+        entry = fragments.get(key)
+        if entry is None or not entry.startswith(version + "\n"):
+            started = time.perf_counter()
+            html = render_template('_pandal_card.html', pandal=p)
+            card_stats.miss(time.perf_counter() - started)
+            fragments.set(key, version + "\n" + html, [f"pandal:{p['_id']}"])
+        else:
+            html = entry[len(version) + 1:]
+            card_stats.hit()
+            hits += 1
+        cards.append(Markup(html))
+    return cards, hits
+
+def on_pandals_saved(pandal_list):
+    """Bring derived data up to date after pandal inserts or updates.
+
+    models.Database calls it after its own writes too.
+    """
+    changed_ids = list({p["_id"]: None for p in pandal_list if p.get("_id") is not None})
+    refresh_neighbours(changed_ids)
+    refresh_similar(changed_ids)
+    tags = set()
+    for pandal in pandal_list:
+        tags.update(page_cache.pandal_tags(pandal))
+    cache.invalidate(tags)
+    fragments.invalidate(tags)
+    geofences.invalidate()
+    for pandal in pandal_list:
+        if pandal.get("_id") is not None:
+            board.update_pandal(str(pandal["_id"]), pandal)
+
+def on_pandal_saved(pandal):
+    on_pandals_saved([pandal])
+
+def on_pandals_deleted(pandal_list):
+    """Drop deleted pandals from derived data; models.Database calls it after a delete"""
+    deleted_ids = [p["_id"] for p in pandal_list]
+    refresh_neighbours([], deleted_ids)
+    refresh_similar([], deleted_ids)
+    tags = set()
+    for pandal in pandal_list:
+        tags.update(page_cache.pandal_tags(pandal))
+        board.remove_pandal(str(pandal["_id"]))
+    cache.invalidate(tags)
+    fragments.invalidate(tags)
+    geofences.invalidate()
 
 def get_google_provider_cfg():
+    import requests
     try:
-        return requests.get(config.GOOGLE_DISCOVERY_URL).json()
+        return requests.get(current_app.config["GOOGLE_DISCOVERY_URL"], hooks={"response": instrumentation.requests_hook}).json()
     except:
         return None
 
-@app.route("/login")
+@route("/login")
 def login():
     try:
         # Generate and store a new state parameter
@@ -76,7 +239,7 @@ def login():
         authorization_endpoint = google_provider_cfg["authorization_endpoint"]
 
         # Use library to construct the request for Google login
-        request_uri = client.prepare_request_uri(
+        request_uri = get_oauth_client().prepare_request_uri(
             authorization_endpoint,
             redirect_uri="http://localhost:5000/login/callback",
             scope=["openid", "email", "profile"],
@@ -86,8 +249,10 @@ def login():
     except Exception as e:
         return f"Failed to initiate login: {str(e)}", 500
 
-@app.route("/login/callback")
+@route("/login/callback")
 def callback():
+    import requests
+    client = get_oauth_client()
     try:
         # Get authorization code and state from Google
         code = request.args.get("code")
@@ -126,7 +291,8 @@ def callback():
             token_url,
             headers=headers,
             data=body,
-            auth=(config.GOOGLE_CLIENT_ID, config.GOOGLE_CLIENT_SECRET),
+            auth=(current_app.config["GOOGLE_CLIENT_ID"], current_app.config["GOOGLE_CLIENT_SECRET"]),
+            hooks={"response": instrumentation.requests_hook},
         )
         
         if not token_response.ok:
@@ -146,7 +312,7 @@ def callback():
     try:
         userinfo_endpoint = google_provider_cfg["userinfo_endpoint"]
         uri, headers, body = client.add_token(userinfo_endpoint)
-        userinfo_response = requests.get(uri, headers=headers, data=body)
+        userinfo_response = requests.get(uri, headers=headers, data=body, hooks={"response": instrumentation.requests_hook})
         if not userinfo_response.ok:
             session.clear()
             return f"Failed to get user info: {userinfo_response.json()}", 400
@@ -174,6 +340,10 @@ def callback():
             upsert=True
         )
 
+        cache_user(user_data)
+        if current_app.config.get("SESSION_USER_PROFILE"):
+            session["user_profile"] = {f: user_data[f] for f in SESSION_PROFILE_FIELDS}
+
         # Create user object for Flask-Login
         user = User(user_data)
 
@@ -185,20 +355,23 @@ def callback():
     else:
         return "User email not verified by Google.", 400
 
-@app.route("/logout")
+@route("/logout")
 @login_required
 def logout():
     logout_user()
+    session.pop("user_profile", None)
     return redirect(url_for("index"))
 
-@app.route('/')
+@route('/')
+@cache.cached(lambda: ["pandals"], vary_user=True)
 def index():
     # Get only 4 pandals for the homepage
     pandal_list = list(pandals.find().limit(4))
     return render_template('index.html', pandals=pandal_list)
 
-@app.route('/all-pandals')
+@route('/all-pandals')
 def all_pandals():
+    started = time.perf_counter()
     # Fetch all pandals and compute auxiliary data for filters and UI
     pandal_list = list(pandals.find())
 
@@ -206,29 +379,46 @@ def all_pandals():
     unique_areas = sorted({p.get('area') for p in pandal_list if p.get('area')})
     unique_themes = sorted({p.get('theme') for p in pandal_list if p.get('theme')})
 
-    # Attach rating summary if ratings collection present
+    # Attach rating summaries from a single aggregation over all ratings
+    rating_summary = {
+        r["_id"]: r for r in ratings.aggregate([
+            {"$group": {
+                "_id": "$pandal_id",
+                "avg": {"$avg": {"$toDouble": "$rating"}},
+                "count": {"$sum": 1}
+            }}
+        ])
+    }
     pandal_summaries = []
     for p in pandal_list:
-        pid = str(p.get('_id'))
-        rating_docs = list(ratings.find({"pandal_id": pid}))
-        avg_rating = None
-        review_count = 0
-        if rating_docs:
-            review_count = len(rating_docs)
-            avg_rating = round(sum([float(r.get('rating', 0)) for r in rating_docs]) / review_count, 1)
+        summary = rating_summary.get(str(p.get('_id')))
         p_copy = dict(p)
-        p_copy['avg_rating'] = avg_rating
-        p_copy['review_count'] = review_count
+        p_copy['avg_rating'] = round(summary["avg"], 1) if summary and summary["avg"] is not None else None
+        p_copy['review_count'] = summary["count"] if summary else 0
         pandal_summaries.append(p_copy)
 
-    return render_template(
+    cards, card_hits = render_pandal_cards(pandal_summaries)
+    response = make_response(render_template(
         'all_pandals.html',
         pandals=pandal_summaries,
+        cards=cards,
         areas=unique_areas,
         themes=unique_themes
+    ))
+    elapsed = time.perf_counter() - started
+    card_stats.page(elapsed)
+    response.headers["Server-Timing"] = (
+        f'render;dur={elapsed * 1000:.1f}, '
+        f'cards;desc="{card_hits}/{len(cards)} cached"'
     )
+    return response
+
+@route('/api/stats/all-pandals')
+def all_pandals_stats():
+    return jsonify(card_stats.snapshot())
 
-@app.route('/locations')
+@route('/locations')
+@cache.cached(lambda: ["pandals"])
 def locations():
     # Get unique areas (talukas) from pandals collection
     pipeline = [
@@ -239,26 +429,40 @@ def locations():
     talukas = [{"name": area["_id"]} for area in areas if area["_id"]]
     return render_template('locations.html', talukas=talukas)
 
-@app.route('/taluka/<taluka_name>')
+@route('/taluka/<taluka_name>')
+@cache.cached(lambda taluka_name: [f"area:{taluka_name}"])
 def taluka_pandals(taluka_name):
     # Get pandals for the specified taluka
     pandal_list = list(pandals.find({"area": taluka_name}))
     if not pandal_list:
         return redirect(url_for('locations'))
+    for p in pandal_list:
+        # taluka.html passes the list through tojson
+        p['_id'] = str(p['_id'])
     taluka = {"name": taluka_name, "pandals": pandal_list}
     return render_template('taluka.html', taluka=taluka)
 
-@app.route('/pandal/<pandal_id>')
+@route('/pandal/<pandal_id>')
 def pandal_detail(pandal_id):
     try:
         pandal = pandals.find_one({"_id": ObjectId(pandal_id)})
         if not pandal:
             return redirect(url_for('index'))
-        return render_template('pandal.html', pandal=pandal)
+        nearby = get_neighbour_index(current_app.config["NEIGHBOUR_DIR"]).nearby(pandal_id, limit=5)
+        similar = get_similar_index(current_app.config["SIMILAR_DIR"]).similar(pandal_id, limit=5)
+        return render_template('pandal.html', pandal=pandal, nearby=nearby, similar=similar)
     except:
         return redirect(url_for('index'))
 
-@app.route('/feedback', methods=['POST'])
+@route('/api/pandals/<pandal_id>/similar')
+def api_similar_pandals(pandal_id):
+    try:
+        limit = int(request.args.get('limit', 8))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    return jsonify(get_similar_index(current_app.config["SIMILAR_DIR"]).similar(pandal_id, limit=limit))
+
+@route('/feedback', methods=['POST'])
 @login_required
 def feedback():
     if request.method == 'POST':
@@ -271,7 +475,7 @@ def feedback():
         mongo.db.feedback.insert_one(feedback_data)
         return redirect(url_for('index'))
 
-@app.route('/register_pandal', methods=['GET', 'POST'])
+@route('/register_pandal', methods=['GET', 'POST'])
 @login_required
 def register_pandal():
     if request.method == 'POST':
@@ -279,7 +483,7 @@ def register_pandal():
         
         # Try to geocode the address using Nominatim
         try:
-            location = geolocator.geocode(address)
+            location = get_geolocator().geocode(address)
             if location:
                 lat = location.latitude
                 lon = location.longitude
@@ -308,27 +512,79 @@ def register_pandal():
             "closing_time": request.form.get('closing_time', '22:00'),
             "created_at": mongo.db.command('serverStatus')['localTime']
         }
-        pandals.insert_one(new_pandal)
+        new_pandal.update(opening_hours.hours_fields(new_pandal["opening_time"], new_pandal["closing_time"]))
+        assign_area(new_pandal)
+        with changes.reserved(mongo.db) as seq:
+            new_pandal.update(changes.stamp(seq, created=True))
+            pandals.insert_one(new_pandal)
+        heatmap.pandals_changed(mongo.db, [(None, new_pandal)])
+        on_pandal_saved(new_pandal)
         return redirect(url_for('index'))
     return render_template('register_pandal.html')
 
 # API Endpoints
-@app.route('/api/pandals', methods=['GET'])
+def pandal_row(p):
+    """A pandal as listed by /api/pandals"""
+    return {
+        "id": str(p["_id"]),
+        "name": p.get("name"),
+        "theme": p.get("theme"),
+        "idol_type": p.get("idol_type"),
+        "area": p.get("area"),
+        "lat": p["location"]["coordinates"][1] if "location" in p else None,
+        "lon": p["location"]["coordinates"][0] if "location" in p else None
+    }
+
+@route('/api/pandals', methods=['GET'])
 def api_get_pandals():
-    results = []
-    for p in pandals.find():
-        results.append({
-            "id": str(p["_id"]),
-            "name": p.get("name"),
-            "theme": p.get("theme"),
-            "idol_type": p.get("idol_type"),
-            "area": p.get("area"),
-            "lat": p["location"]["coordinates"][1] if "location" in p else None,
-            "lon": p["location"]["coordinates"][0] if "location" in p else None
-        })
-    return jsonify(results)
+    try:
+        open_at = opening_hours.parse_open_at(request.args.get("open_at"))
+        output = columnar.negotiate(request.args.get("format"), request.accept_mimetypes)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    query = opening_hours.open_at_filter(open_at) if open_at is not None else {}
+
+    results = [pandal_row(p) for p in pandals.find(query)]
+    if output == "json":
+        response = jsonify(results)
+    elif output == "columnar":
+        response = jsonify(columnar.encode_columns(results))
+        response.mimetype = columnar.COLUMNAR_MIMETYPE
+    else:
+        response = make_response(columnar.pack(columnar.encode_columns(results)))
+        response.mimetype = columnar.MSGPACK_MIMETYPES[0]
+    response.vary.add("Accept")
+    return response
 
-@app.route('/api/pandals/<pandal_id>', methods=['GET'])
+@route('/api/pandals/changes', methods=['GET'])
+def api_pandal_changes():
+    """Inserts, updates and deletes after ?since=<token>&epoch=<epoch>, in order.
+
+    "reset": true means the client's catalog is from another epoch and must
+    be dropped; the page then starts from the beginning.
+    """
+    try:
+        since = changes.parse_token(request.args.get('since'))
+        limit = int(request.args.get('limit', changes.DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({"error": "since must be a sync token and limit an integer"}), 400
+    # Pandals inserted outside the app's write paths get stamped here
+    changes.backfill_change_seq(mongo.db)
+    epoch, since, reset = changes.resume(mongo.db, since, request.args.get('epoch'))
+    page, next_token, has_more = changes.changes_since(mongo.db, since, limit)
+    return jsonify({
+        "epoch": epoch,
+        "reset": reset,
+        "changes": [
+            {"seq": seq, "op": op, "id": payload} if op == "delete"
+            else {"seq": seq, "op": op, "id": str(payload["_id"]), "pandal": pandal_row(payload)}
+            for seq, op, payload in page
+        ],
+        "next": str(next_token),
+        "has_more": has_more,
+    })
+
+@route('/api/pandals/<pandal_id>', methods=['GET'])
 def api_get_pandal(pandal_id):
     try:
         pandal = pandals.find_one({"_id": ObjectId(pandal_id)})
@@ -351,11 +607,11 @@ def api_get_pandal(pandal_id):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/pandals', methods=['POST'])
+@route('/api/pandals', methods=['POST'])
 @login_required
 def add_pandal():
     data = request.json
-    pandal_id = pandals.insert_one({
+    new_pandal = {
         "name": data["name"],
         "theme": data["theme"],
         "idol_type": data["idol_type"],
@@ -366,44 +622,132 @@ def add_pandal():
             "coordinates": [data["lon"], data["lat"]]
         },
         "created_at": mongo.db.command('serverStatus')['localTime']
-    }).inserted_id
+    }
+    assign_area(new_pandal)
+    with changes.reserved(mongo.db) as seq:
+        new_pandal.update(changes.stamp(seq, created=True))
+        pandal_id = pandals.insert_one(new_pandal).inserted_id
+    heatmap.pandals_changed(mongo.db, [(None, new_pandal)])
+    on_pandal_saved(new_pandal)
     return jsonify({"id": str(pandal_id)})
 
-@app.route('/api/pandals/nearby', methods=['GET'])
+@route('/api/pandals/bulk', methods=['POST'])
+@admin_required
+def bulk_pandals():
+    """NDJSON upserts/patches (see bulk.py); returns a per-line report"""
+    import bulk
+    areas = area_index()
+    results = []
+    batch = []
+    batch_keys = set()
+
+    def flush():
+        batch_results, touched = bulk.apply_batch(mongo.db, batch, areas)
+        results.extend(batch_results)
+        if touched:
+            on_pandals_saved(touched)
+        batch.clear()
+        batch_keys.clear()
+
+    for number, line in enumerate(request.stream, 1):
+        if not line.strip():
+            continue
+        try:
+            op, key, fields = bulk.parse_record(line)
+        except ValueError as e:
+            results.append({"line": number, "status": "error", "error": str(e)})
+            continue
+        # Unordered writes to the same pandal must land in separate batches
+        if bulk.key_of(key) in batch_keys:
+            flush()
+        batch.append((number, op, key, fields))
+        batch_keys.add(bulk.key_of(key))
+        if len(batch) >= bulk.BATCH_SIZE:
+            flush()
+    if batch:
+        flush()
+
+    results.sort(key=lambda r: r["line"])
+    summary = {status: 0 for status in ("inserted", "updated", "error")}
+    for r in results:
+        summary[r["status"]] += 1
+    return jsonify({"summary": summary, "results": results})
+
+@route('/route/v1/<profile>/<coordinates>', methods=['GET'])
+def osrm_route(profile, coordinates):
+    """OSRM-compatible route service backed by ROAD_GRAPH; every profile drives"""
+    import router
+
+    graph_path = current_app.config.get("ROAD_GRAPH")
+    if not graph_path:
+        return jsonify({"code": "InvalidService", "message": "No road graph configured"}), 404
+    try:
+        points = router.parse_coordinates(coordinates)
+    except ValueError as e:
+        return jsonify({"code": "InvalidQuery", "message": str(e)}), 400
+    body = get_road_graph(graph_path).route(
+        points,
+        overview=request.args.get("overview", "simplified"),
+        geometries=request.args.get("geometries", "polyline"),
+        radius=current_app.config.get("ROUTE_SNAP_RADIUS_M", 1000))
+    return jsonify(body), 200 if body["code"] == "Ok" else 400
+
+def run_upstream(fetch, *args):
+    """Call the coroutine function `fetch` from a sync view and wait for it.
+
+    Keep only the httpx fan-out in `fetch`. Under asgi.py it is awaited on
+    the server's event loop, while Mongo, CPU and file work stays on the
+    request's own thread, where it blocks nobody else.
+    """
+    return current_app.async_to_sync(fetch)(*args)
+
+@route('/api/pandals/nearby', methods=['GET'])
 def get_nearby_pandals():
+    from geopy.distance import geodesic
+    import upstream
+
     lat = float(request.args.get("lat"))
     lon = float(request.args.get("lon"))
     radius = int(request.args.get("radius", 2000))  # meters
     user_location = (lat, lon)
+    try:
+        open_at = opening_hours.parse_open_at(request.args.get("open_at"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    nearby = pandals.find({
+    query = {
         "location": {
             "$nearSphere": {
                 "$geometry": {"type": "Point", "coordinates": [lon, lat]},
                 "$maxDistance": radius
             }
         }
-    })
+    }
+    if open_at is not None:
+        query.update(opening_hours.open_at_filter(open_at))
+    nearby = list(pandals.find(query))
+
+    graph_path = current_app.config.get("ROAD_GRAPH")
+    if graph_path:
+        # One search on the local road graph reaches every pandal
+        durations = get_road_graph(graph_path).durations(
+            (lon, lat), [p["location"]["coordinates"][:2] for p in nearby],
+            current_app.config.get("ROUTE_SNAP_RADIUS_M", 1000))
+    else:
+        # Fetch estimated durations from OSRM concurrently
+        async def fetch_durations(origin, destinations):
+            async with upstream.client() as http:
+                return await upstream.gather_limited(
+                    [upstream.osrm_duration(http, origin, d) for d in destinations],
+                    upstream.OSRM_CONCURRENCY
+                )
+        durations = run_upstream(fetch_durations, (lon, lat), [p["location"]["coordinates"] for p in nearby])
 
     results = []
-    for p in nearby:
+    for p, seconds in zip(nearby, durations):
         pandal_location = (p["location"]["coordinates"][1], p["location"]["coordinates"][0])
         distance = geodesic(user_location, pandal_location).kilometers
-        
-        # Get estimated duration using OSRM
-        try:
-            osrm_url = f"https://router.project-osrm.org/route/v1/driving/{lon},{lat};{p['location']['coordinates'][0]},{p['location']['coordinates'][1]}?overview=false"
-            response = requests.get(osrm_url)
-            if response.status_code == 200:
-                route_data = response.json()
-                if route_data['routes']:
-                    duration = f"{int(route_data['routes'][0]['duration'] / 60)} mins"
-                else:
-                    duration = None
-            else:
-                duration = None
-        except:
-            duration = None
+        duration = f"{int(seconds / 60)} mins" if seconds is not None else None
 
         results.append({
             "id": str(p["_id"]),
@@ -416,8 +760,12 @@ def get_nearby_pandals():
 
     return jsonify(results)
 
-@app.route('/map/pandal/<pandal_id>')
+@route('/map/pandal/<pandal_id>')
 def get_pandal_map(pandal_id):
+    import folium
+    from folium import plugins
+    import upstream
+
     try:
         pandal = pandals.find_one({"_id": ObjectId(pandal_id)})
         if not pandal:
@@ -437,7 +785,6 @@ def get_pandal_map(pandal_id):
         ).add_to(pandal_map)
 
         # Add nearby amenities using Overpass API
-        overpass_url = "http://overpass-api.de/api/interpreter"
         overpass_query = f"""
         [out:json][timeout:25];
         (
@@ -450,26 +797,27 @@ def get_pandal_map(pandal_id):
         out skel qt;
         """
         
-        response = requests.post(overpass_url, data={"data": overpass_query})
-        if response.status_code == 200:
-            data = response.json()
-            for element in data.get('elements', []):
-                if 'lat' in element and 'lon' in element:
-                    place_type = element.get('tags', {}).get('amenity')
-                    name = element.get('tags', {}).get('name', 'Unnamed')
-                    
-                    # Choose icon color based on place type
-                    icon_color = {
-                        'hospital': 'green',
-                        'police': 'blue',
-                        'restaurant': 'orange'
-                    }.get(place_type, 'gray')
-
-                    folium.Marker(
-                        [element['lat'], element['lon']],
-                        popup=f"<b>{name}</b><br>Type: {place_type}",
-                        icon=folium.Icon(color=icon_color, icon='info-sign')
-                    ).add_to(pandal_map)
+        async def fetch_elements(query):
+            async with upstream.client(timeout=30) as http:
+                return await upstream.overpass_elements(http, query)
+        elements = run_upstream(fetch_elements, overpass_query)
+        for element in elements:
+            if 'lat' in element and 'lon' in element:
+                place_type = element.get('tags', {}).get('amenity')
+                name = element.get('tags', {}).get('name', 'Unnamed')
+                
+                # Choose icon color based on place type
+                icon_color = {
+                    'hospital': 'green',
+                    'police': 'blue',
+                    'restaurant': 'orange'
+                }.get(place_type, 'gray')
+
+                folium.Marker(
+                    [element['lat'], element['lon']],
+                    popup=f"<b>{name}</b><br>Type: {place_type}",
+                    icon=folium.Icon(color=icon_color, icon='info-sign')
+                ).add_to(pandal_map)
 
         # Add fullscreen option
         plugins.Fullscreen().add_to(pandal_map)
@@ -491,34 +839,141 @@ def get_pandal_map(pandal_id):
     except Exception as e:
         return str(e), 500
 
-@app.route('/api/geocode', methods=['POST'])
+@route('/api/geocode', methods=['POST'])
 def geocode_address():
+    import upstream
+
     try:
         address = request.json.get('address')
         if not address:
             return jsonify({"error": "Address is required"}), 400
 
         # Use Nominatim for geocoding
-        location = geolocator.geocode(address)
+        async def fetch_location(address):
+            async with upstream.client(user_agent=NOMINATIM_USER_AGENT) as http:
+                return await upstream.nominatim_geocode(http, address)
+        location = run_upstream(fetch_location, address)
         if location:
-            return jsonify({
-                "lat": location.latitude,
-                "lon": location.longitude,
-                "formatted_address": location.address
-            })
+            return jsonify(location)
         else:
             return jsonify({"error": "Location not found"}), 404
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/pandals/<pandal_id>/ratings', methods=['GET', 'POST'])
+# Top-rated boards, kept in memory (see leaderboard.py)
+board = leaderboard.Leaderboard()
+
+def get_leaderboard():
+    if board.is_stale(current_app.config.get("LEADERBOARD_REBUILD_SECONDS", 600)):
+        board.rebuild(pandals, ratings)
+    return board
+
+def on_rating_saved(pandal_id, rating_value, created_at=None):
+    """Update the heatmap, and the leaderboard if this worker has built it (or is building it)"""
+    heatmap.rating_recorded(mongo.db, pandal_id, rating_value)
+    if board.built_at is None and not board.rebuilding:
+        return
+    try:
+        value = float(rating_value)
+    except (TypeError, ValueError):
+        return
+    pandal = None
+    if pandal_id not in board:
+        pandal = pandals.find_one({"_id": leaderboard.pandal_object_id(pandal_id)}, {"name": 1, "area": 1, "theme": 1})
+    board.add_rating(pandal_id, value, pandal, created_at)
+
+@route('/api/heatmap')
+def api_heatmap():
+    """Aggregated cells for a map view: ?zoom=13&bbox=minLon,minLat,maxLon,maxLat"""
+    try:
+        zoom = int(request.args.get('zoom', heatmap.BASE_ZOOM))
+        bbox = heatmap.parse_bbox(request.args.get('bbox'))
+    except ValueError as e:
+        return jsonify({"error": str(e) or "zoom must be an integer"}), 400
+    return jsonify(heatmap.cells(mongo.db, zoom, bbox))
+
+@route('/api/leaderboard')
+def api_leaderboard():
+    try:
+        limit = min(int(request.args.get('limit', leaderboard.DEFAULT_LIMIT)), leaderboard.MAX_LIMIT)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    rows = get_leaderboard().top(request.args.get('area'), request.args.get('theme'), limit)
+    return jsonify(rows)
+
+@route('/admin/leaderboard/rebuild', methods=['POST'])
+@admin_required
+def admin_rebuild_leaderboard():
+    return jsonify(board.rebuild(pandals, ratings))
+
+def rebuild_leaderboard_command():
+    """Rebuild the top-rated leaderboard from the ratings collection"""
+    print(board.rebuild(pandals, ratings))
+    for row in board.top(limit=10):
+        print(f"{row['score']:.3f}  {row['count']:>6}  {row['name']}")
+
+@route('/api/me/recommendations')
+@login_required
+def api_my_recommendations():
+    """Precomputed by recommender.py; users without history get the leaderboard"""
+    try:
+        limit = int(request.args.get('limit', 10))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    doc = recommendations.find_one({"_id": current_user.get_id()})
+    if doc and doc.get("items"):
+        return jsonify({"source": "collaborative", "items": doc["items"][:limit]})
+    items = [{"pandal_id": row["pandal_id"], "name": row["name"], "score": row["score"]}
+             for row in get_leaderboard().top(limit=limit)]
+    return jsonify({"source": "popular", "items": items})
+
+# Pandal geofences for location pings (see geofence.py)
+geofences = geofence.GeofenceIndex()
+
+@route('/api/location-pings', methods=['POST'])
+def location_pings():
+    """Batch of {user_id, lat, lon, ts} pings -> enter/exit events.
+
+    Users post their own pings (user_id is taken from the session); an
+    admin token may post pings for any user, e.g. from a push gateway.
+    """
+    admin = is_admin()
+    if not admin and not current_user.is_authenticated:
+        return jsonify({"error": "Login required"}), 401
+    data = request.get_json(silent=True) or {}
+    pings = data.get("pings")
+    if not isinstance(pings, list):
+        return jsonify({"error": "Expected {\"pings\": [...]}"}), 400
+
+    parsed = []
+    rejected = []
+    for i, ping in enumerate(pings):
+        try:
+            parsed.append(geofence.parse_ping(ping, None if admin else current_user.get_id()))
+        except ValueError as e:
+            rejected.append({"index": i, "error": str(e)})
+    if geofences.is_stale(current_app.config.get("GEOFENCE_REBUILD_SECONDS", 300)):
+        geofences.build(pandals)
+    events = geofences.process_batch(parsed)
+    return jsonify({"processed": len(parsed), "rejected": rejected, "events": events})
+
+@route('/api/pandals/<pandal_id>/ratings', methods=['GET', 'POST'])
 def api_pandal_ratings(pandal_id):
     if request.method == 'GET':
-        rating_list = list(ratings.find({"pandal_id": pandal_id}))
+        import reviews
+        try:
+            limit = int(request.args.get('limit', reviews.DEFAULT_PAGE_SIZE))
+            rating_list, next_cursor = reviews.rating_page(
+                ratings, pandal_id, request.args.get('cursor'), limit)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         for rating in rating_list:
             rating['_id'] = str(rating['_id'])
-        return jsonify(rating_list)
+        response = {"ratings": rating_list, "next_cursor": next_cursor}
+        if request.args.get('summary') == '1':
+            response["summary"] = reviews.rating_summary(ratings, pandal_id)
+        return jsonify(response)
     elif request.method == 'POST':
         if not current_user.is_authenticated:
             return jsonify({"error": "Login required"}), 401
@@ -538,6 +993,7 @@ def api_pandal_ratings(pandal_id):
             "created_at": mongo.db.command('serverStatus')['localTime']
         }
         result = ratings.insert_one(rating_data)
+        on_rating_saved(pandal_id, rating_value, rating_data["created_at"])
         return jsonify({"success": True, "id": str(result.inserted_id)})
         rating_list = list(ratings.find({"pandal_id": pandal_id}))
         for rating in rating_list:
@@ -562,5 +1018,56 @@ def api_pandal_ratings(pandal_id):
         result = ratings.insert_one(rating_data)
         return jsonify({"success": True, "id": str(result.inserted_id)})
 
+def warm_up(app):
+    """Preload lazily imported modules and page caches before taking traffic"""
+    for name in app.config.get("WARM_UP_MODULES", ("neighbours", "upstream", "geopy.distance")):
+        importlib.import_module(name)
+    client = app.test_client()
+    for path in app.config.get("WARM_UP_PATHS", ("/", "/locations", "/all-pandals")):
+        try:
+            client.get(path)
+        except Exception as e:
+            print(f"Warm-up request to {path} failed: {str(e)}")
+
+def create_app(config_object=config):
+    app = Flask(__name__)
+    app.config.from_object(config_object)
+
+    # Allow OAuth over HTTP for development
+    os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
+
+    # Set session configuration
+    app.config['SESSION_COOKIE_SECURE'] = False  # Set to True in production
+    app.config['SESSION_COOKIE_HTTPONLY'] = True
+    app.config['PERMANENT_SESSION_LIFETIME'] = 3600  # 1 hour
+
+    app.config.setdefault("NEIGHBOUR_DIR", os.path.join(app.root_path, "instance", "neighbours"))
+    app.config.setdefault("SIMILAR_DIR", os.path.join(app.root_path, "instance", "similar"))
+
+    login_manager.init_app(app)
+    user_cache.maxsize = app.config.get("USER_CACHE_SIZE", 1024)
+    board.prior_weight = app.config.get("LEADERBOARD_PRIOR_WEIGHT", leaderboard.DEFAULT_PRIOR_WEIGHT)
+    geofences.radius_m = app.config.get("GEOFENCE_RADIUS_M", geofence.DEFAULT_RADIUS_M)
+    mongo.init_app(app, event_listeners=[instrumentation.mongo_listener, slowlog.slow_queries])
+    cache.init_app(app, LocalProxy(lambda: mongo.db.page_cache_invalidations))
+    # Card keys carry no version, so other workers need no broadcast to drop old ones
+    fragments.init_app(app)
+    assets.init_app(app)
+    instrumentation.init_app(app)
+    profiler.init_app(app)
+    slowlog.init_app(app, mongo.cx)
+
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+    # models.Database calls these after its own writes
+    app.extensions["pandal_hooks"] = {"saved": on_pandals_saved, "deleted": on_pandals_deleted}
+    app.add_template_global(routing_url)
+    app.cli.command("rebuild-leaderboard")(rebuild_leaderboard_command)
+
+    # Set WARM_UP = True to preload caches before the worker accepts requests
+    if app.config.get("WARM_UP"):
+        warm_up(app)
+    return app
+
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
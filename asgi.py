@@ -0,0 +1,54 @@
+"""ASGI entry point, e.g.
+
+    uvicorn asgi:app --workers 4
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker -w 4
+
+Each request runs the Flask app on its own thread, so Mongo queries,
+CPU work and template or folium rendering block only that request. The
+views hand just their upstream calls (see upstream.py) to
+app.run_upstream, which awaits them on the server's event loop instead
+of a private per-request loop. A thread that is waiting on OSRM,
+Overpass or Nominatim is therefore idle, and one worker can hold many
+such requests open at once. Views must not be `async def`: Flask would
+run the whole view, blocking calls included, on the event loop. ASGI_CONCURRENCY (default 100) caps the
+requests, and so the threads, in flight per worker. Size --workers for
+CPU (about one per core) rather than for upstream latency, as you would
+with gunicorn sync workers.
+
+wsgi.py stays the entry point for plain WSGI servers.
+"""
+import asyncio
+import os
+
+from asgiref.sync import ThreadSensitiveContext
+from asgiref.wsgi import WsgiToAsgi
+
+from app import create_app
+
+DEFAULT_CONCURRENCY = 100
+
+
+class FlaskAsgi(WsgiToAsgi):
+    def __init__(self, wsgi_application, concurrency=DEFAULT_CONCURRENCY):
+        super().__init__(wsgi_application)
+        self.concurrency = concurrency
+        self._slots = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        async with self._slots:
+            # Without a context, WsgiToAsgi runs every request on one shared thread
+            async with ThreadSensitiveContext():
+                await super().__call__(scope, receive, send)
+
+
+app = FlaskAsgi(create_app(), int(os.environ.get("ASGI_CONCURRENCY", DEFAULT_CONCURRENCY)))
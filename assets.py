@@ -0,0 +1,121 @@
+"""Fingerprinted, minified and precompressed static assets.
+
+`python assets.py` minifies static/js/*.js and static/css/*.css, names
+each output after a hash of its content and writes .gz and .br siblings
+into static/dist, plus a manifest mapping "js/maps.js" to its current
+fingerprinted name.
+
+Templates call asset_url('js/maps.js'). Once a manifest exists this
+points at /assets/<fingerprinted name>, which is served with a one-year
+immutable Cache-Control and the precompressed variant the client
+accepts. Without a manifest it falls back to the plain static URL.
+
+A rebuild leaves earlier outputs in place, and /assets/ serves any
+fingerprinted file in the build directory, not only the current
+manifest's. Pages and caches that still reference an old fingerprint
+keep resolving after a rebuild and restart.
+"""
+import glob
+import gzip
+import hashlib
+import json
+import os
+import re
+
+from flask import abort, request, send_from_directory, url_for
+
+ASSET_PATTERNS = ("js/*.js", "css/*.css")
+MANIFEST_FILE = "manifest.json"
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+FINGERPRINTED = re.compile(r"^(?:js|css)/[\w.-]+\.[0-9a-f]{12}\.(?:js|css)$")
+
+# Preferred first
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def minify(filename, text):
+    import rcssmin
+    import rjsmin
+
+    if filename.endswith(".js"):
+        return rjsmin.jsmin(text)
+    if filename.endswith(".css"):
+        return rcssmin.cssmin(text)
+    return text
+
+
+def _mimetype(filename):
+    if filename.endswith(".js"):
+        return "text/javascript"
+    if filename.endswith(".css"):
+        return "text/css"
+    return None
+
+
+def build_assets(static_dir, out_dir):
+    """Write fingerprinted, compressed copies of every asset and the manifest"""
+    import brotli
+
+    manifest = {}
+    for pattern in ASSET_PATTERNS:
+        for src in sorted(glob.glob(os.path.join(static_dir, pattern))):
+            name = os.path.relpath(src, static_dir).replace(os.sep, "/")
+            with open(src, encoding="utf-8") as f:
+                data = minify(name, f.read()).encode("utf-8")
+
+            root, ext = os.path.splitext(name)
+            fingerprinted = f"{root}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+            dest = os.path.join(out_dir, fingerprinted)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            with open(dest, "wb") as f:
+                f.write(data)
+            with open(dest + ".gz", "wb") as f:
+                # mtime=0 keeps the output byte-for-byte reproducible
+                f.write(gzip.compress(data, compresslevel=9, mtime=0))
+            with open(dest + ".br", "wb") as f:
+                f.write(brotli.compress(data, quality=11))
+            manifest[name] = fingerprinted
+
+    with open(os.path.join(out_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def init_app(app):
+    out_dir = app.config.setdefault("ASSETS_DIR", os.path.join(app.static_folder, "dist"))
+    try:
+        with open(os.path.join(out_dir, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    def asset_url(filename):
+        fingerprinted = manifest.get(filename)
+        if fingerprinted is None:
+            return url_for("static", filename=filename)
+        return url_for("asset", filename=fingerprinted)
+
+    def asset(filename):
+        if not FINGERPRINTED.match(filename) or not os.path.isfile(os.path.join(out_dir, filename)):
+            abort(404)
+        response = None
+        for encoding, suffix in ENCODINGS:
+            if encoding in request.accept_encodings and os.path.exists(os.path.join(out_dir, filename + suffix)):
+                response = send_from_directory(out_dir, filename + suffix, mimetype=_mimetype(filename))
+                response.headers["Content-Encoding"] = encoding
+                break
+        if response is None:
+            response = send_from_directory(out_dir, filename)
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE
+        response.vary.add("Accept-Encoding")
+        return response
+
+    app.add_url_rule("/assets/<path:filename>", "asset", asset)
+    app.add_template_global(asset_url)
+
+
+if __name__ == "__main__":
+    here = os.path.dirname(os.path.abspath(__file__))
+    result = build_assets(os.path.join(here, "static"), os.path.join(here, "static", "dist"))
+    for source, target in result.items():
+        print(f"{source} -> {target}")
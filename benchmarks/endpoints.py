@@ -0,0 +1,359 @@
+"""Endpoint micro-benchmarks.
+
+Seeds a database with a configurable number of pandals and ratings,
+points OSRM, Overpass and Nominatim at local stub servers, then drives
+the app through Flask's test client and records per endpoint:
+
+  latency percentiles (ms), Mongo operations per request and peak
+  Python allocations per request (tracemalloc, measured in a separate
+  pass so it does not skew the timings)
+
+    python -m benchmarks.endpoints --pandals 2000 --save bench.json
+    python -m benchmarks.endpoints --baseline bench.json
+
+By default the database is mongomock, with the operators it lacks
+filled in by benchmarks/mongomock_compat.py. Pass --mongo-uri
+mongodb://localhost:27017 to use a local mongod; its operations are
+counted with a pymongo CommandListener.
+
+The rendered-page cache is off so every iteration measures a real
+render; pass --page-cache to measure cache hits instead.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from datetime import datetime, timedelta
+
+from benchmarks import mongomock_compat
+from benchmarks.stubs import start_stubs
+
+AREAS = ["Lalbaug", "Parel", "Dadar", "Matunga", "Girgaon", "Andheri", "Chembur", "Thane", "Borivali", "Kurla"]
+THEMES = ["Traditional", "Eco-friendly", "Social Message", "Heritage", "Modern", "Cultural"]
+IDOL_TYPES = ["Clay", "Eco-friendly", "Temporary", "Shadu"]
+# Greater Mumbai bounding box
+LAT_RANGE = (18.90, 19.30)
+LON_RANGE = (72.80, 73.00)
+
+IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "endSessions", "buildInfo", "saslStart", "saslContinue"}
+
+
+class OperationCounter:
+    def __init__(self):
+        self.count = 0
+
+
+def _command_listener(counter):
+    from pymongo import monitoring
+
+    class Listener(monitoring.CommandListener):
+        def started(self, event):
+            if event.command_name not in IGNORED_COMMANDS:
+                counter.count += 1
+
+        def succeeded(self, event):
+            pass
+
+        def failed(self, event):
+            pass
+
+    return Listener()
+
+
+class CountingCollection:
+    """mongomock has no command monitoring, so count collection calls instead"""
+
+    OPERATIONS = {
+        "find", "find_one", "aggregate", "count_documents", "distinct", "insert_one",
+        "insert_many", "update_one", "update_many", "delete_one", "delete_many",
+        "bulk_write", "find_one_and_update", "create_index",
+    }
+
+    def __init__(self, collection, counter):
+        self._collection = collection
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name not in self.OPERATIONS:
+            return attr
+        if name == "find":
+            def attr(*args, **kwargs):
+                return mongomock_compat.near_sphere_find(self._collection, *args, **kwargs)
+
+        def counted(*args, **kwargs):
+            self._counter.count += 1
+            return attr(*args, **kwargs)
+        return counted
+
+
+class CountingDatabase:
+    def __init__(self, db, counter):
+        self._db = db
+        self._counter = counter
+
+    def __getattr__(self, name):
+        if name == "command":
+            self._counter.count += 1
+            return self._db.command
+        return CountingCollection(getattr(self._db, name), self._counter)
+
+    def __getitem__(self, name):
+        return CountingCollection(self._db[name], self._counter)
+
+
+def connect(mongo_uri, counter):
+    if mongo_uri:
+        import pymongo
+        client = pymongo.MongoClient(mongo_uri, event_listeners=[_command_listener(counter)])
+        return client, client.utsavdarshan_bench, "mongod"
+    import mongomock
+    mongomock_compat.install()
+    client = mongomock.MongoClient()
+    return client, CountingDatabase(client.utsavdarshan_bench, counter), "mongomock"
+
+
+def seed(db, pandal_count, ratings_per_pandal, rng):
+    import opening_hours
+
+    for name in ("pandals", "ratings", "users", "visits"):
+        db[name].delete_many({})
+
+    docs = []
+    for i in range(pandal_count):
+        opening = f"{rng.randint(5, 9):02d}:00"
+        closing = f"{rng.choice([21, 22, 23, 0, 1, 2]):02d}:00"
+        doc = {
+            "name": f"Pandal {i}",
+            "description": "Benchmark pandal",
+            "area": rng.choice(AREAS),
+            "theme": rng.choice(THEMES),
+            "idol_type": rng.choice(IDOL_TYPES),
+            "address": f"{i} Benchmark Road, Mumbai",
+            "location": {"type": "Point", "coordinates": [rng.uniform(*LON_RANGE), rng.uniform(*LAT_RANGE)]},
+            "opening_time": opening,
+            "closing_time": closing,
+        }
+        doc.update(opening_hours.hours_fields(opening, closing))
+        docs.append(doc)
+    if docs:
+        db.pandals.insert_many(docs)
+
+    ratings = []
+    for doc in docs:
+        for j in range(ratings_per_pandal):
+            ratings.append({
+                "user_id": f"user{rng.randint(0, 999)}",
+                "pandal_id": str(doc["_id"]),
+                "rating": rng.randint(1, 5),
+                "comment": "Benchmark review",
+                "created_at": datetime.utcnow() - timedelta(minutes=j),
+            })
+    if ratings:
+        db.ratings.insert_many(ratings)
+
+    try:
+        db.pandals.create_index([("location", "2dsphere")])
+        db.ratings.create_index([("pandal_id", 1)])
+    except Exception:
+        pass
+    return docs
+
+
+def make_config(neighbour_dir, page_cache):
+    try:
+        import config
+    except ImportError:
+        # No deployment config here; give the app the settings it reads
+        config = types.ModuleType("config")
+        sys.modules["config"] = config
+
+    class BenchConfig:
+        MONGO_URI = getattr(config, "MONGO_URI", "mongodb://localhost:27017/utsavdarshan_bench")
+        SECRET_KEY = "benchmark"
+        GOOGLE_CLIENT_ID = "benchmark"
+        GOOGLE_CLIENT_SECRET = "benchmark"
+        GOOGLE_DISCOVERY_URL = "http://127.0.0.1:9/"
+        NEIGHBOUR_DIR = neighbour_dir
+        PAGE_CACHE_SIZE = 2048 if page_cache else 0
+        FRAGMENT_CACHE_SIZE = 8192 if page_cache else 0
+
+    for name, value in vars(BenchConfig).items():
+        if name.isupper() and not hasattr(config, name):
+            setattr(config, name, value)
+    return BenchConfig
+
+
+def endpoints(docs, rng):
+    sample = rng.choice(docs)
+    pid = str(sample["_id"])
+    lon, lat = sample["location"]["coordinates"]
+    return [
+        ("GET /", "GET", "/", None),
+        ("GET /all-pandals", "GET", "/all-pandals", None),
+        ("GET /locations", "GET", "/locations", None),
+        ("GET /taluka/<area>", "GET", f"/taluka/{sample['area']}", None),
+        ("GET /pandal/<id>", "GET", f"/pandal/{pid}", None),
+        ("GET /api/pandals", "GET", "/api/pandals", None),
+        ("GET /api/pandals?open_at", "GET", "/api/pandals?open_at=01:00", None),
+        ("GET /api/pandals/<id>", "GET", f"/api/pandals/{pid}", None),
+        ("GET /api/pandals/<id>/ratings", "GET", f"/api/pandals/{pid}/ratings", None),
+        ("GET /api/pandals/nearby", "GET", f"/api/pandals/nearby?lat={lat}&lon={lon}&radius=2000", None),
+        ("POST /api/geocode", "POST", "/api/geocode", {"address": "Lalbaug, Mumbai"}),
+        ("GET /map/pandal/<id>", "GET", f"/map/pandal/{pid}", None),
+    ]
+
+
+def _request(client, method, path, body):
+    if method == "POST":
+        return client.post(path, json=body)
+    return client.get(path)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(client, counter, method, path, body, iterations, warmup, alloc_iterations):
+    errors = 0
+    for _ in range(warmup):
+        _request(client, method, path, body)
+
+    timings = []
+    start_count = counter.count
+    for _ in range(iterations):
+        started = time.perf_counter()
+        response = _request(client, method, path, body)
+        timings.append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            errors += 1
+    operations = (counter.count - start_count) / iterations if iterations else 0
+
+    peaks = []
+    tracemalloc.start()
+    for _ in range(alloc_iterations):
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        _request(client, method, path, body)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - baseline)
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        "iterations": iterations,
+        "errors": errors,
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p90_ms": round(percentile(timings, 90), 3),
+        "p99_ms": round(percentile(timings, 99), 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+        "mongo_ops_per_request": round(operations, 2),
+        "alloc_peak_kb": round(statistics.median(peaks) / 1024, 1) if peaks else None,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Latency regressions beyond `tolerance` and any growth in Mongo operations"""
+    regressions = []
+    for name, current in results["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if not previous:
+            continue
+        for metric in ("p50_ms", "p90_ms"):
+            if previous.get(metric) and current[metric] > previous[metric] * (1 + tolerance):
+                regressions.append((name, metric, previous[metric], current[metric]))
+        if current["mongo_ops_per_request"] > previous.get("mongo_ops_per_request", float("inf")):
+            regressions.append((name, "mongo_ops_per_request",
+                                previous["mongo_ops_per_request"], current["mongo_ops_per_request"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark app endpoints against local stand-ins")
+    parser.add_argument("--pandals", type=int, default=500)
+    parser.add_argument("--ratings-per-pandal", type=int, default=5)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--alloc-iterations", type=int, default=5)
+    parser.add_argument("--upstream-delay", type=float, default=0.0, help="seconds each stub waits")
+    parser.add_argument("--mongo-uri", help="use a local mongod instead of mongomock")
+    parser.add_argument("--page-cache", action="store_true", help="serve pages from the rendered-page cache")
+    parser.add_argument("--only", nargs="*", help="endpoint names to run")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare against saved results")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    stubs = start_stubs(delay=args.upstream_delay)
+    os.environ["OSRM_URL"] = stubs["osrm"].url + "/route/v1/driving"
+    os.environ["OVERPASS_URL"] = stubs["overpass"].url + "/api/interpreter"
+    os.environ["NOMINATIM_URL"] = stubs["nominatim"].url + "/search"
+
+    neighbour_dir = tempfile.mkdtemp(prefix="utsav-bench-")
+    bench_config = make_config(neighbour_dir, args.page_cache)
+
+    import app as app_module
+    import neighbours
+
+    counter = OperationCounter()
+    client, db, backend = connect(args.mongo_uri, counter)
+    flask_app = app_module.create_app(bench_config)
+    app_module.mongo.cx = client
+    app_module.mongo.db = db
+
+    rng = random.Random(args.seed)
+    docs = seed(db, args.pandals, args.ratings_per_pandal, rng)
+    neighbours.build_neighbours(db.pandals, neighbour_dir)
+
+    test_client = flask_app.test_client()
+    results = {
+        "meta": {
+            "backend": backend,
+            "pandals": args.pandals,
+            "ratings_per_pandal": args.ratings_per_pandal,
+            "iterations": args.iterations,
+            "upstream_delay": args.upstream_delay,
+            "page_cache": args.page_cache,
+            "python": platform.python_version(),
+        },
+        "endpoints": {},
+    }
+    for name, method, path, body in endpoints(docs, rng):
+        if args.only and name not in args.only:
+            continue
+        results["endpoints"][name] = measure(
+            test_client, counter, method, path, body,
+            args.iterations, args.warmup, args.alloc_iterations)
+        r = results["endpoints"][name]
+        print(f"{name:32} p50 {r['p50_ms']:9.2f} ms  p90 {r['p90_ms']:9.2f} ms  "
+              f"mongo {r['mongo_ops_per_request']:6.2f}/req  alloc {r['alloc_peak_kb']} KiB"
+              + (f"  errors {r['errors']}" if r["errors"] else ""))
+
+    for stub in stubs.values():
+        stub.stop()
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for name, metric, previous, current in regressions:
+            print(f"REGRESSION {name} {metric}: {previous} -> {current}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
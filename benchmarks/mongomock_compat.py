@@ -0,0 +1,81 @@
+"""Fill the mongomock gaps the benchmarked endpoints run into.
+
+mongomock has no $toDouble or $round aggregation operators and no
+$nearSphere query, and its bulk builder rejects the `sort` argument that
+pymongo 4.11+ passes. install() patches the first and last in place.
+near_sphere_find() answers a $nearSphere find in Python: it returns the
+matching documents sorted by great-circle distance, as mongod would.
+"""
+import math
+
+EARTH_RADIUS_M = 6371008.8
+
+_installed = False
+
+
+def install():
+    global _installed
+    if _installed:
+        return
+    import mongomock.aggregate as aggregate
+    import mongomock.collection as collection
+
+    parse = aggregate._Parser.parse
+
+    def patched_parse(self, expression):
+        if isinstance(expression, dict) and "$toDouble" in expression:
+            value = self.parse(expression["$toDouble"])
+            return float(value) if value is not None else None
+        if isinstance(expression, dict) and "$round" in expression:
+            value, places = expression["$round"]
+            value = self.parse(value)
+            return None if value is None else round(value, places)
+        return parse(self, expression)
+
+    aggregate._Parser.parse = patched_parse
+
+    for name in ("add_replace", "add_update"):
+        original = getattr(collection.BulkOperationBuilder, name)
+
+        def without_sort(self, *args, _original=original, **kwargs):
+            kwargs.pop("sort", None)
+            return _original(self, *args, **kwargs)
+
+        setattr(collection.BulkOperationBuilder, name, without_sort)
+    _installed = True
+
+
+def _near_sphere(filter):
+    for field, condition in (filter or {}).items():
+        if isinstance(condition, dict) and "$nearSphere" in condition:
+            return field, condition["$nearSphere"]
+    return None, None
+
+
+def _distance_m(lon1, lat1, lon2, lat2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(1.0, a)))
+
+
+def near_sphere_find(collection, filter=None, *args, **kwargs):
+    """collection.find() that also understands one $nearSphere condition"""
+    field, near = _near_sphere(filter)
+    if field is None:
+        return collection.find(filter, *args, **kwargs)
+    rest = {k: v for k, v in filter.items() if k != field}
+    lon, lat = near["$geometry"]["coordinates"][:2]
+    max_distance = near.get("$maxDistance", math.inf)
+    found = []
+    for doc in collection.find(rest, *args, **kwargs):
+        point = doc
+        for part in field.split("."):
+            point = (point or {}).get(part)
+        coordinates = (point or {}).get("coordinates")
+        if not coordinates:
+            continue
+        distance = _distance_m(lon, lat, coordinates[0], coordinates[1])
+        if distance <= max_distance:
+            found.append((distance, doc))
+    found.sort(key=lambda item: item[0])
+    return [doc for _, doc in found]
@@ -0,0 +1,72 @@
+"""Local stand-ins for OSRM, Overpass and Nominatim.
+
+Each stub is a ThreadingHTTPServer on an ephemeral port returning a
+fixed, well-formed response after an optional delay, so benchmarks
+exercise the app's own code rather than the public services.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _handler(body, delay):
+    payload = json.dumps(body).encode("utf-8")
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                self.rfile.read(length)
+            if delay:
+                time.sleep(delay)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        do_GET = _reply
+        do_POST = _reply
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class StubServer:
+    def __init__(self, body, delay=0.0):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(body, delay))
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def start_stubs(delay=0.0, amenities=20):
+    """Start all stubs and return {name: StubServer}"""
+    elements = [
+        {"type": "node", "id": i, "lat": 19.0 + i * 0.0005, "lon": 72.84 + i * 0.0005,
+         "tags": {"amenity": ("hospital", "police", "restaurant")[i % 3], "name": f"Place {i}"}}
+        for i in range(amenities)
+    ]
+    stubs = {
+        "osrm": StubServer({"code": "Ok", "routes": [{"duration": 600.0, "distance": 4200.0}]}, delay),
+        "overpass": StubServer({"elements": elements}, delay),
+        "nominatim": StubServer([{"lat": "18.9977", "lon": "72.8376", "display_name": "Lalbaug, Mumbai"}], delay),
+    }
+    for stub in stubs.values():
+        stub.start()
+    return stubs
@@ -0,0 +1,233 @@
+"""Offline area assignment from ward/taluka boundary polygons.
+
+AREA_BOUNDARIES points at a GeoJSON FeatureCollection of Polygon or
+MultiPolygon features. Each feature's name comes from the first of
+NAME_PROPERTIES it has. Pandals whose point falls inside a polygon get
+that name as their `area`; where polygons overlap, the first in the
+file wins. Points outside every polygon keep the area they were given.
+
+The polygons are rasterised onto a lat/lon grid once, at load time:
+
+  * a cell that no polygon edge touches, with its centre inside one
+    polygon, answers the lookup directly
+  * a cell an edge touches keeps the polygons whose edges touch it, plus
+    any polygon that wholly contains it, and an even-odd ray cast against
+    those polygons decides
+
+Most lookups therefore cost one array read, and the rest test a handful
+of polygons, without any network call. `python boundaries.py` re-assigns
+the area of every stored pandal, e.g. after the boundary file changed.
+"""
+import json
+import math
+
+import numpy as np
+
+NAME_PROPERTIES = ("name", "ward", "ward_name", "taluka", "area")
+GRID_DEGREES = 0.005
+# The grid gets coarser for large boundary files so it stays this small
+MAX_CELLS = 1_000_000
+CHUNK_ELEMENTS = 4_000_000
+BOUNDARY = -2
+OUTSIDE = -1
+
+
+def _rings(geometry):
+    if geometry["type"] == "Polygon":
+        return list(geometry["coordinates"])
+    if geometry["type"] == "MultiPolygon":
+        return [ring for polygon in geometry["coordinates"] for ring in polygon]
+    raise ValueError(f"Unsupported boundary geometry {geometry['type']}")
+
+
+def _edges(rings):
+    """(x1, y1, x2, y2) arrays of every ring edge, closing open rings"""
+    parts = []
+    for ring in rings:
+        points = np.asarray(ring, dtype=np.float64)[:, :2]
+        if len(points) < 3:
+            continue
+        if not np.array_equal(points[0], points[-1]):
+            points = np.vstack((points, points[:1]))
+        parts.append(np.hstack((points[:-1], points[1:])))
+    return np.vstack(parts).T
+
+
+def _contains(edges, lon, lat):
+    """Even-odd ray cast; holes and multipolygon parts need no special case"""
+    x1, y1, x2, y2 = edges
+    crosses = (y1 > lat) != (y2 > lat)
+    if not crosses.any():
+        return False
+    x1, y1, x2, y2 = x1[crosses], y1[crosses], x2[crosses], y2[crosses]
+    x = x1 + (lat - y1) * (x2 - x1) / (y2 - y1)
+    return np.count_nonzero(x > lon) % 2 == 1
+
+
+def _contains_many(edges, lon, lat):
+    """_contains for arrays of points, in chunks of about CHUNK_ELEMENTS"""
+    x1, y1, x2, y2 = (e[:, None] for e in edges)
+    inside = np.empty(len(lon), dtype=bool)
+    step = max(1, CHUNK_ELEMENTS // len(edges[0]))
+    for start in range(0, len(lon), step):
+        px, py = lon[start:start + step], lat[start:start + step]
+        crosses = (y1 > py) != (y2 > py)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+        inside[start:start + step] = np.count_nonzero(crosses & (x > px), axis=0) % 2 == 1
+    return inside
+
+
+class AreaIndex:
+    def __init__(self, names, polygons, cell_degrees=GRID_DEGREES):
+        self.names = names
+        self.polygons = polygons  # edge arrays, same order as names
+        xs = np.concatenate([p[0] for p in polygons] + [p[2] for p in polygons])
+        ys = np.concatenate([p[1] for p in polygons] + [p[3] for p in polygons])
+        self.min_lon, self.min_lat = float(xs.min()), float(ys.min())
+        span = max(float(xs.max()) - self.min_lon, float(ys.max()) - self.min_lat, cell_degrees)
+        self.size = max(cell_degrees, span / math.sqrt(MAX_CELLS))
+        self.rows = int((float(ys.max()) - self.min_lat) / self.size) + 1
+        self.cols = int((float(xs.max()) - self.min_lon) / self.size) + 1
+        self.cells = np.full((self.rows, self.cols), OUTSIDE, dtype=np.int32)
+        self.candidates = {}
+        self._rasterise()
+
+    @classmethod
+    def from_geojson(cls, path, name_property=None, cell_degrees=GRID_DEGREES):
+        with open(path) as f:
+            collection = json.load(f)
+        names, polygons = [], []
+        for feature in collection.get("features", []):
+            properties = feature.get("properties") or {}
+            keys = (name_property,) if name_property else NAME_PROPERTIES
+            name = next((properties[k] for k in keys if properties.get(k)), None)
+            if name is None or not feature.get("geometry"):
+                continue
+            edges = _edges(_rings(feature["geometry"]))
+            if edges.size:
+                names.append(str(name).strip())
+                polygons.append(edges)
+        if not polygons:
+            raise ValueError(f"No named polygons in {path}")
+        return cls(names, polygons, cell_degrees)
+
+    def _cell(self, lon, lat):
+        return int((lat - self.min_lat) // self.size), int((lon - self.min_lon) // self.size)
+
+    def _rasterise(self):
+        for index, (x1, y1, x2, y2) in enumerate(self.polygons):
+            # Cells touched by an edge (its bounding box, so a superset)
+            r0 = ((np.minimum(y1, y2) - self.min_lat) // self.size).astype(int)
+            r1 = ((np.maximum(y1, y2) - self.min_lat) // self.size).astype(int)
+            c0 = ((np.minimum(x1, x2) - self.min_lon) // self.size).astype(int)
+            c1 = ((np.maximum(x1, x2) - self.min_lon) // self.size).astype(int)
+            touched = set()
+            for a, b, c, d in zip(r0.tolist(), r1.tolist(), c0.tolist(), c1.tolist()):
+                for row in range(a, min(b, self.rows - 1) + 1):
+                    for col in range(c, min(d, self.cols - 1) + 1):
+                        touched.add((row, col))
+            for cell in touched:
+                candidates = self.candidates.setdefault(cell, [])
+                if self.cells[cell] >= 0:
+                    # Inside an earlier polygon that this one overlaps
+                    candidates.append(int(self.cells[cell]))
+                candidates.append(index)
+                self.cells[cell] = BOUNDARY
+
+            # Untouched cells in the polygon's bbox are wholly in or out of it.
+            # Free ones inside become this polygon's; boundary cells of
+            # earlier polygons (e.g. a ward inside this taluka) inside it
+            # add it as a candidate. Cells an earlier polygon owns outright
+            # keep answering with that one, as overlapping polygons do.
+            rows = np.arange(r0.min(), r1.max() + 1)
+            cols = np.arange(c0.min(), c1.max() + 1)
+            grid_rows, grid_cols = np.meshgrid(rows, cols, indexing="ij")
+            state = self.cells[grid_rows, grid_cols]
+            test = (state == OUTSIDE) | (state == BOUNDARY)
+            grid_rows, grid_cols, state = grid_rows[test], grid_cols[test], state[test]
+            if grid_rows.size:
+                lat = self.min_lat + (grid_rows + 0.5) * self.size
+                lon = self.min_lon + (grid_cols + 0.5) * self.size
+                inside = _contains_many(self.polygons[index], lon, lat)
+                free = inside & (state == OUTSIDE)
+                self.cells[grid_rows[free], grid_cols[free]] = index
+                shared = inside & (state == BOUNDARY)
+                for cell in zip(grid_rows[shared].tolist(), grid_cols[shared].tolist()):
+                    if cell not in touched:
+                        self.candidates[cell].append(index)
+
+    def area_at(self, lon, lat):
+        """Name of the polygon containing (lon, lat), or None"""
+        row, col = self._cell(lon, lat)
+        if not (0 <= row < self.rows and 0 <= col < self.cols):
+            return None
+        state = int(self.cells[row, col])
+        if state >= 0:
+            return self.names[state]
+        if state == BOUNDARY:
+            for index in self.candidates[(row, col)]:
+                if _contains(self.polygons[index], lon, lat):
+                    return self.names[index]
+        return None
+
+    def assign(self, pandal):
+        """Set `area` from the pandal's point; GeoJSON features get properties.area"""
+        if "geometry" in pandal:
+            coordinates = (pandal.get("geometry") or {}).get("coordinates")
+            target = pandal.setdefault("properties", {})
+        else:
+            coordinates = (pandal.get("location") or {}).get("coordinates")
+            target = pandal
+        if coordinates:
+            area = self.area_at(float(coordinates[0]), float(coordinates[1]))
+            if area is not None:
+                target["area"] = area
+        return pandal
+
+
+def backfill_areas(db, areas, batch_size=1000):
+    """Re-assign `area` on every stored pandal; returns how many changed"""
+    import changes
+    from pymongo import UpdateOne
+
+    updated = []
+    # GeoJSON-shaped pandals keep theirs under properties, as assign() does
+    for p in db.pandals.find({"$or": [{"location": {"$exists": True}}, {"geometry": {"$exists": True}}]},
+                             {"area": 1, "location": 1, "geometry": 1, "properties.area": 1}):
+        if "geometry" in p:
+            coordinates = (p.get("geometry") or {}).get("coordinates")
+            field, current = "properties.area", (p.get("properties") or {}).get("area")
+        else:
+            coordinates = (p.get("location") or {}).get("coordinates")
+            field, current = "area", p.get("area")
+        area = areas.area_at(float(coordinates[0]), float(coordinates[1])) if coordinates else None
+        if area is not None and area != current:
+            updated.append((p["_id"], field, area))
+    for start in range(0, len(updated), batch_size):
+        chunk = updated[start:start + batch_size]
+        with changes.reserved(db, len(chunk)) as first_seq:
+            db.pandals.bulk_write([
+                UpdateOne({"_id": pandal_id}, {"$set": dict(changes.stamp(first_seq + offset), **{field: area})})
+                for offset, (pandal_id, field, area) in enumerate(chunk)
+            ], ordered=False)
+    return {"updated": len(updated)}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import pymongo
+    import config
+
+    parser = argparse.ArgumentParser(description="Assign pandal areas from boundary polygons")
+    parser.add_argument("boundaries", nargs="?", default=getattr(config, "AREA_BOUNDARIES", None))
+    parser.add_argument("--name-property", default=getattr(config, "AREA_NAME_PROPERTY", None))
+    args = parser.parse_args()
+    if not args.boundaries:
+        parser.error("pass a boundary GeoJSON file or set AREA_BOUNDARIES")
+
+    areas = AreaIndex.from_geojson(args.boundaries, args.name_property)
+    db = pymongo.MongoClient(config.MONGO_URI).utsavdarshan
+    result = backfill_areas(db, areas)
+    print(f"Loaded {len(areas.names)} areas; updated {result['updated']} pandals")
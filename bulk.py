@@ -0,0 +1,164 @@
+"""Bulk pandal upserts and patches from NDJSON.
+
+Each line of the request body is one record:
+
+  {"op": "upsert", "permit_id": "MCGM-1042", "pandal": {"name": ..., "area": ..., "lat": ..., "lon": ...}}
+  {"op": "patch", "id": "<pandal _id>", "set": {"opening_time": "07:00", "closing_time": "23:00"}}
+
+A record names its pandal by "id" (the _id) or "permit_id". Lines are
+validated as they are read. Valid records are applied in unordered
+bulk_write batches of BATCH_SIZE, with one lookup per batch to tell
+inserts from updates and to find patches that match nothing. Every line
+gets an entry in the report, so a single bad record doesn't stop the run.
+"""
+import datetime
+import json
+
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+import changes
+import heatmap
+import opening_hours
+
+BATCH_SIZE = 500
+STRING_FIELDS = ("name", "theme", "idol_type", "area", "address", "description", "image",
+                 "opening_time", "closing_time")
+REQUIRED_FOR_UPSERT = ("name", "area", "lat", "lon")
+
+
+def _fields(data, partial):
+    """Validate pandal fields and convert them to the stored document shape"""
+    if not isinstance(data, dict) or not data:
+        raise ValueError("pandal fields must be a non-empty object")
+    unknown = set(data) - set(STRING_FIELDS) - {"lat", "lon"}
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(sorted(unknown))}")
+    if not partial:
+        missing = [f for f in REQUIRED_FOR_UPSERT if data.get(f) in (None, "")]
+        if missing:
+            raise ValueError(f"missing fields: {', '.join(missing)}")
+
+    fields = {}
+    for name in STRING_FIELDS:
+        if name in data:
+            if not isinstance(data[name], str):
+                raise ValueError(f"{name} must be a string")
+            fields[name] = data[name].strip()
+    if ("lat" in data) != ("lon" in data):
+        raise ValueError("lat and lon must be given together")
+    if "lat" in data:
+        lat, lon = data["lat"], data["lon"]
+        if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in (lat, lon)):
+            raise ValueError("lat and lon must be numbers")
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError("lat/lon out of range")
+        fields["location"] = {"type": "Point", "coordinates": [float(lon), float(lat)]}
+    if ("opening_time" in fields) != ("closing_time" in fields):
+        raise ValueError("opening_time and closing_time must be given together")
+    if "opening_time" in fields:
+        hours = opening_hours.hours_fields(fields["opening_time"], fields["closing_time"])
+        if not hours:
+            raise ValueError("opening_time and closing_time must be HH:MM")
+        fields.update(hours)
+    return fields
+
+
+def parse_record(line):
+    """Return (op, key filter, fields) for one NDJSON line or raise ValueError"""
+    try:
+        record = json.loads(line)
+    except ValueError:
+        raise ValueError("not valid JSON")
+    if not isinstance(record, dict):
+        raise ValueError("record must be an object")
+    op = record.get("op")
+    if op not in ("upsert", "patch"):
+        raise ValueError('op must be "upsert" or "patch"')
+    if record.get("id"):
+        try:
+            key = {"_id": ObjectId(record["id"])}
+        except (InvalidId, TypeError):
+            raise ValueError("id is not a valid pandal id")
+    elif isinstance(record.get("permit_id"), str) and record["permit_id"].strip():
+        key = {"permit_id": record["permit_id"].strip()}
+    else:
+        raise ValueError("record needs an id or permit_id")
+    if op == "upsert":
+        fields = _fields(record.get("pandal"), partial=False)
+        if "permit_id" in key:
+            fields["permit_id"] = key["permit_id"]
+    else:
+        fields = _fields(record.get("set"), partial=True)
+    return op, key, fields
+
+
+def key_of(key):
+    return ("_id", key["_id"]) if "_id" in key else ("permit_id", key["permit_id"])
+
+
+def apply_batch(db, batch, areas=None):
+    """Apply [(line, op, key, fields)]; returns (results, touched documents).
+
+    `touched` holds the previous and new version of every written pandal,
+    which is what cache invalidation needs. With a boundaries.AreaIndex as
+    `areas`, records that set a location get their area from it.
+    """
+    ids = [key["_id"] for _, _, key, _ in batch if "_id" in key]
+    permits = [key["permit_id"] for _, _, key, _ in batch if "permit_id" in key]
+    existing = {}
+    for p in db.pandals.find({"$or": [{"_id": {"$in": ids}}, {"permit_id": {"$in": permits}}]}):
+        existing[("_id", p["_id"])] = p
+        if p.get("permit_id"):
+            existing[("permit_id", p["permit_id"])] = p
+
+    results = []
+    operations = []
+    pending = []  # (result, key, fields) per operation, same order as operations
+    touched = []
+    with changes.reserved(db, len(batch)) as first_seq:
+        now = datetime.datetime.utcnow()
+        for offset, (line, op, key, fields) in enumerate(batch):
+            current = existing.get(key_of(key))
+            if op == "patch" and current is None:
+                results.append({"line": line, "status": "error", "error": "no pandal matches this record"})
+                continue
+            if areas is not None and "location" in fields:
+                areas.assign(fields)
+            stamp = changes.stamp(first_seq + offset)
+            update = {"$set": dict(fields, change_seq=stamp["change_seq"], updated_at=stamp["updated_at"])}
+            if current is None:
+                update["$setOnInsert"] = {"created_seq": stamp["change_seq"], "created_at": now}
+            result = {"line": line, "status": "updated" if current is not None else "inserted"}
+            if current is not None:
+                result["id"] = str(current["_id"])
+                touched.append(current)
+            results.append(result)
+            operations.append(UpdateOne(key, update, upsert=(op == "upsert")))
+            pending.append((result, key, fields, current))
+
+        upserted, failed = {}, {}
+        if operations:
+            try:
+                upserted = db.pandals.bulk_write(operations, ordered=False).upserted_ids
+            except BulkWriteError as e:
+                upserted = {u["index"]: u["_id"] for u in e.details.get("upserted", [])}
+                failed = {err["index"]: err.get("errmsg", "write failed") for err in e.details.get("writeErrors", [])}
+
+    if operations:
+        moved = []
+        for index, (result, key, fields, current) in enumerate(pending):
+            if index in failed:
+                result.update(status="error", error=failed[index])
+                result.pop("id", None)
+                continue
+            if index in upserted:
+                result["id"] = str(upserted[index])
+            merged = dict(current or {}, **fields)
+            merged["_id"] = upserted.get(index, (current or {}).get("_id"))
+            touched.append(merged)
+            moved.append((current, merged))
+        heatmap.pandals_changed(db, moved)
+    return results, touched
@@ -0,0 +1,166 @@
+"""Change sequence for delta sync of the pandal catalog.
+
+Every pandal write takes the next number from a single counter document
+and stores it with the pandal:
+
+  change_seq   sequence number of the latest write
+  created_seq  sequence number of the insert
+  updated_at   time of the latest write
+
+A delete leaves a tombstone {_id, change_seq, deleted_at} in
+pandal_tombstones. Both collections are indexed on change_seq. So
+"everything after token N" is two range scans merged in sequence order,
+and the sync token is just the last sequence number a client has
+applied.
+
+Writers commit in whatever order they finish, not in sequence order, so
+a page must not run past a number that is reserved but not yet written:
+a client would skip it for good. Every write therefore happens inside
+reserved(), which leaves a marker in pandal_change_pending until the
+write is done, and changes_since() stops below the oldest marker.
+
+The counter document also holds an epoch, a random id made when the
+counter is created. A database that was dropped and re-seeded gets a new
+one, so resume() can tell a client that its token (and everything it
+cached) belongs to another catalog and it has to start over.
+"""
+import contextlib
+import datetime
+import uuid
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+COUNTER_ID = "pandal_changes"
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+# A marker this old belongs to a writer that died before cleaning up
+PENDING_TIMEOUT = datetime.timedelta(minutes=5)
+
+
+def _last_seq(db):
+    counter = db.counters.find_one({"_id": COUNTER_ID}, {"seq": 1})
+    return counter["seq"] if counter else 0
+
+
+def _counter(db):
+    """The counter document, given an epoch if it has none yet"""
+    counter = db.counters.find_one({"_id": COUNTER_ID})
+    if counter is None or "epoch" not in counter:
+        try:
+            db.counters.update_one(
+                {"_id": COUNTER_ID, "epoch": {"$exists": False}},
+                {"$set": {"epoch": uuid.uuid4().hex}, "$setOnInsert": {"seq": 0}}, upsert=True)
+        except DuplicateKeyError:
+            pass  # another request set it first
+        counter = db.counters.find_one({"_id": COUNTER_ID})
+    return counter
+
+
+@contextlib.contextmanager
+def reserved(db, count=1):
+    """Allocate `count` consecutive sequence numbers; yields the first.
+
+    Make the writes that use them inside the block.
+    """
+    # The marker goes in before the counter moves, so a reader that
+    # misses it also read the counter before this reservation
+    marker = db.pandal_change_pending.insert_one(
+        {"floor": _last_seq(db), "at": datetime.datetime.utcnow()}).inserted_id
+    try:
+        counter = db.counters.find_one_and_update(
+            {"_id": COUNTER_ID}, {"$inc": {"seq": count}},
+            upsert=True, return_document=ReturnDocument.AFTER)
+        yield counter["seq"] - count + 1
+    finally:
+        db.pandal_change_pending.delete_one({"_id": marker})
+
+
+def watermark(db):
+    """Highest sequence number below which every write has committed"""
+    last = _last_seq(db)
+    oldest = db.pandal_change_pending.find_one(
+        {"at": {"$gte": datetime.datetime.utcnow() - PENDING_TIMEOUT}}, sort=[("floor", 1)])
+    if oldest is not None:
+        last = min(last, oldest["floor"])
+    return last
+
+
+def stamp(seq, created=False):
+    """Fields to $set (or include in an insert) for one pandal write"""
+    fields = {"change_seq": seq, "updated_at": datetime.datetime.utcnow()}
+    if created:
+        fields["created_seq"] = seq
+    return fields
+
+
+def stamp_many(documents, first):
+    """Stamp a batch of new documents in place from reserved(db, len(documents))"""
+    for offset, document in enumerate(documents):
+        document.update(stamp(first + offset, created=True))
+    return documents
+
+
+def record_delete(db, pandal_id, seq):
+    db.pandal_tombstones.replace_one(
+        {"_id": pandal_id},
+        {"change_seq": seq, "deleted_at": datetime.datetime.utcnow()},
+        upsert=True)
+    return seq
+
+
+def resume(db, since, epoch=None):
+    """(current epoch, token to continue from, whether the client must start over).
+
+    A token from another epoch, or past the last sequence number handed out,
+    came from a catalog that no longer exists; the client restarts from 0.
+    """
+    counter = _counter(db)
+    if (epoch and epoch != counter["epoch"]) or since > counter.get("seq", 0):
+        return counter["epoch"], 0, True
+    return counter["epoch"], since, False
+
+
+def parse_token(value):
+    """Sync token from ?since=; raises ValueError when malformed"""
+    if not value:
+        return 0
+    token = int(value)
+    if token < 0:
+        raise ValueError
+    return token
+
+
+def changes_since(db, since, limit=DEFAULT_LIMIT):
+    """Return ([(seq, "insert"|"update"|"delete", doc or id)], next_token, has_more)"""
+    limit = max(1, min(limit, MAX_LIMIT))
+    safe = watermark(db)
+    if safe <= since:
+        return [], since, False
+    query = {"change_seq": {"$gt": since, "$lte": safe}}
+    written = [
+        (p["change_seq"], "insert" if p.get("created_seq", 0) > since else "update", p)
+        for p in db.pandals.find(query).sort("change_seq", 1).limit(limit + 1)
+    ]
+    deleted = [
+        (t["change_seq"], "delete", t["_id"])
+        for t in db.pandal_tombstones.find(query).sort("change_seq", 1).limit(limit + 1)
+    ]
+    merged = sorted(written + deleted, key=lambda change: change[0])
+    page = merged[:limit]
+    next_token = page[-1][0] if page else since
+    return page, next_token, len(merged) > limit
+
+
+def backfill_change_seq(db):
+    """Stamp pandals written without a change sequence (legacy rows, seed scripts).
+
+    Cheap when there are none: one lookup on the change_seq index.
+    """
+    legacy = [p["_id"] for p in db.pandals.find({"change_seq": None}, {"_id": 1})]
+    if not legacy:
+        return {"updated": 0}
+    with reserved(db, len(legacy)) as first:
+        for offset, pandal_id in enumerate(legacy):
+            db.pandals.update_one({"_id": pandal_id}, {"$set": stamp(first + offset, created=True)})
+    return {"updated": len(legacy)}
@@ -0,0 +1,114 @@
+"""Cold-start report: import time, app creation and first-request latency.
+
+Each run starts a fresh interpreter with -X importtime, imports app,
+calls create_app() and issues one request per path through the test
+client. Medians over the runs are printed as JSON and can be saved and
+compared against a previous report:
+
+    python coldstart.py --runs 5 --save coldstart.json
+    python coldstart.py --baseline coldstart.json --tolerance 0.25
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROBE = r"""
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+flask_app = app.create_app()
+created = time.perf_counter()
+client = flask_app.test_client()
+requests = {}
+for path in sys.argv[1:]:
+    t = time.perf_counter()
+    try:
+        status = client.get(path).status_code
+    except Exception as e:
+        status = repr(e)
+    requests[path] = {"ms": (time.perf_counter() - t) * 1000, "status": status}
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "create_app_ms": (created - imported) * 1000,
+    "requests": requests,
+}))
+"""
+
+
+def _parse_importtime(stderr, top):
+    """Return the `top` slowest modules by cumulative import time (ms)"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(cumulative) / 1000))
+    modules.sort(key=lambda m: m[1], reverse=True)
+    return [{"module": name, "ms": round(ms, 1)} for name, ms in modules[:top]]
+
+
+def run_once(paths, top):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE, *paths],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, check=True,
+    )
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report["slowest_imports"] = _parse_importtime(result.stderr, top)
+    return report
+
+
+def summarize(runs):
+    summary = {
+        "runs": len(runs),
+        "import_ms": round(statistics.median(r["import_ms"] for r in runs), 1),
+        "create_app_ms": round(statistics.median(r["create_app_ms"] for r in runs), 1),
+        "first_request_ms": {},
+        "slowest_imports": runs[-1]["slowest_imports"],
+    }
+    for path in runs[0]["requests"]:
+        summary["first_request_ms"][path] = round(
+            statistics.median(r["requests"][path]["ms"] for r in runs), 1)
+    return summary
+
+
+def compare(summary, baseline, tolerance):
+    """List metrics that are slower than baseline by more than `tolerance`"""
+    regressions = []
+    pairs = [("import_ms", summary["import_ms"], baseline.get("import_ms")),
+             ("create_app_ms", summary["create_app_ms"], baseline.get("create_app_ms"))]
+    for path, ms in summary["first_request_ms"].items():
+        pairs.append((f"first_request_ms {path}", ms, baseline.get("first_request_ms", {}).get(path)))
+    for name, current, previous in pairs:
+        if previous and current > previous * (1 + tolerance):
+            regressions.append({"metric": name, "baseline": previous, "current": current})
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure worker cold-start cost")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--paths", nargs="*", default=["/", "/all-pandals"])
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    parser.add_argument("--save", help="write the report to this JSON file")
+    parser.add_argument("--baseline", help="compare against a saved report")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    summary = summarize([run_once(args.paths, args.top) for _ in range(args.runs)])
+    print(json.dumps(summary, indent=2))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(summary, json.load(f), args.tolerance)
+        for r in regressions:
+            print(f"REGRESSION {r['metric']}: {r['baseline']} -> {r['current']} ms")
+        sys.exit(1 if regressions else 0)
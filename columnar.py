@@ -0,0 +1,84 @@
+"""Compact encodings of the /api/pandals catalog.
+
+The default response is a list of objects, one per pandal, which repeats
+every key and every theme/area/idol_type string. The columnar form holds
+one array per field instead. The repetitive string fields are
+dictionary-encoded as a list of distinct values plus an integer code per
+pandal:
+
+  {"format": "columnar-v1", "count": 2,
+   "id": ["...", "..."], "name": ["...", "..."],
+   "theme": {"values": ["Eco", "Classic"], "codes": [0, 0]},
+   ...
+   "lat": [19.0, 19.1], "lon": [72.8, 72.9]}
+
+A missing value has code -1 (or null in id/name/lat/lon). The same
+structure can be sent as MessagePack.
+"""
+COLUMNAR_MIMETYPE = "application/vnd.utsav.columnar+json"
+MSGPACK_MIMETYPES = ("application/msgpack", "application/x-msgpack")
+FORMATS = ("json", "columnar", "msgpack")
+DICTIONARY_FIELDS = ("theme", "area", "idol_type")
+PLAIN_FIELDS = ("id", "name")
+COORDINATE_PLACES = 6
+
+
+def negotiate(format_arg, accept):
+    """Pick a format from ?format= or, failing that, the Accept header.
+
+    Raises ValueError for an unknown ?format= value.
+    """
+    if format_arg:
+        if format_arg not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        return format_arg
+    best = accept.best_match(("application/json", COLUMNAR_MIMETYPE) + MSGPACK_MIMETYPES,
+                             default="application/json")
+    if best == COLUMNAR_MIMETYPE:
+        return "columnar"
+    if best in MSGPACK_MIMETYPES:
+        return "msgpack"
+    return "json"
+
+
+def encode_columns(rows):
+    """Columnar, dictionary-encoded form of the /api/pandals rows"""
+    columns = {"format": "columnar-v1", "count": len(rows)}
+    for field in PLAIN_FIELDS:
+        columns[field] = [row.get(field) for row in rows]
+    for field in DICTIONARY_FIELDS:
+        values = []
+        lookup = {}
+        codes = []
+        for row in rows:
+            value = row.get(field)
+            if value is None:
+                codes.append(-1)
+                continue
+            code = lookup.get(value)
+            if code is None:
+                code = lookup[value] = len(values)
+                values.append(value)
+            codes.append(code)
+        columns[field] = {"values": values, "codes": codes}
+    for field in ("lat", "lon"):
+        columns[field] = [None if row.get(field) is None else round(row[field], COORDINATE_PLACES)
+                          for row in rows]
+    return columns
+
+
+def decode_columns(columns):
+    """Inverse of encode_columns, for clients and tests"""
+    rows = []
+    for i in range(columns["count"]):
+        row = {field: columns[field][i] for field in PLAIN_FIELDS + ("lat", "lon")}
+        for field in DICTIONARY_FIELDS:
+            code = columns[field]["codes"][i]
+            row[field] = None if code < 0 else columns[field]["values"][code]
+        rows.append(row)
+    return rows
+
+
+def pack(columns):
+    import msgpack
+    return msgpack.packb(columns, use_bin_type=True)
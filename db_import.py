@@ -1,6 +1,15 @@
 import json
 import pymongo
 import config
+import opening_hours
+import changes
+import heatmap
+import boundaries
+
+def load_area_index():
+    """Boundary polygons from config.AREA_BOUNDARIES, or None when unset"""
+    path = getattr(config, "AREA_BOUNDARIES", None)
+    return boundaries.AreaIndex.from_geojson(path, getattr(config, "AREA_NAME_PROPERTY", None)) if path else None
 
 def import_geojson_data(file_path):
     """Import GeoJSON data from file into MongoDB"""
@@ -25,7 +34,14 @@ def import_geojson_data(file_path):
     
     # Import features into MongoDB
     if features:
-        result = db.pandals.insert_many(features)
+        # Areas come from the boundary polygons when they are configured
+        areas = load_area_index()
+        if areas is not None:
+            for feature in features:
+                areas.assign(feature)
+        with changes.reserved(db, len(features)) as first:
+            result = db.pandals.insert_many(changes.stamp_many(features, first))
+        heatmap.pandals_changed(db, [(None, f) for f in features])
         print(f"Imported {len(result.inserted_ids)} pandal records into MongoDB")
         
         # Create geospatial index for location field
@@ -47,11 +63,46 @@ def setup_collections():
     print("Creating geospatial index on pandals collection...")
     db.pandals.create_index([("location", pymongo.GEOSPHERE)])
     
+    # Normalize opening hours and index them for "open at" queries
+    print("Indexing pandal opening hours...")
+    result = opening_hours.backfill_opening_hours(db.pandals)
+    print(f"Normalized opening hours on {result['updated']} pandals")
+    db.pandals.create_index([("open_minutes", pymongo.ASCENDING), ("close_minutes", pymongo.ASCENDING)])
+    # The past-midnight branch of open_at_filter only constrains close_minutes;
+    # without its own index that $or branch, and so the whole query, is a COLLSCAN
+    db.pandals.create_index([("close_minutes", pymongo.ASCENDING)])
+    
+    # Sequence numbers for /api/pandals/changes
+    print("Indexing pandal change sequence...")
+    result = changes.backfill_change_seq(db)
+    print(f"Stamped {result['updated']} pandals with a change sequence")
+    db.pandals.create_index([("change_seq", pymongo.ASCENDING)])
+    db.pandal_tombstones.create_index([("change_seq", pymongo.ASCENDING)])
+    db.pandal_change_pending.create_index([("floor", pymongo.ASCENDING)])
+    # Page cache invalidations shared between workers (see page_cache.py)
+    db.page_cache_invalidations.create_index([("at", pymongo.ASCENDING)], expireAfterSeconds=3600)
+    # Bulk reconciliation matches pandals by their city permit number
+    db.pandals.create_index([("permit_id", pymongo.ASCENDING)], unique=True,
+                            partialFilterExpression={"permit_id": {"$exists": True}})
+    
+    # Re-assign areas from the boundary polygons
+    areas = load_area_index()
+    if areas is not None:
+        print("Assigning pandal areas from boundary polygons...")
+        result = boundaries.backfill_areas(db, areas)
+        print(f"Updated the area of {result['updated']} pandals")
+    db.pandals.create_index([("area", pymongo.ASCENDING)])
+    
+    # Heatmap cells, rebuilt so they cover pandals imported by other tools
+    print("Rebuilding heatmap cells...")
+    result = heatmap.rebuild(db)
+    print(f"Wrote {result['cells']} heatmap cells")
+    
     # Create indexes for other collections
     print("Creating indexes for other collections...")
     db.visits.create_index([("user_id", pymongo.ASCENDING)])
     db.visits.create_index([("pandal_id", pymongo.ASCENDING)])
-    db.ratings.create_index([("pandal_id", pymongo.ASCENDING)])
+    db.ratings.create_index([("pandal_id", pymongo.ASCENDING), ("created_at", pymongo.DESCENDING), ("_id", pymongo.DESCENDING)])
     db.ratings.create_index([("user_id", pymongo.ASCENDING)])
     
     print("All indexes created successfully")
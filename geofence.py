@@ -0,0 +1,143 @@
+"""Enter/exit detection for location pings against pandal geofences.
+
+Every located pandal gets a circular fence of GEOFENCE_RADIUS_M metres
+(or its own `geofence_m`). Each fence is registered in every cell of a
+GRID_DEGREES lat/lon grid that its bounding box touches. A ping then
+looks up one dict cell and measures an equirectangular distance to the
+few fences there, with no database query.
+
+Per user we keep only the last ping's own timestamp, when we received
+it, and the tuple of fence numbers they are inside. A ping yields "enter" for fences newly containing it and
+"exit" for fences it has left by more than EXIT_FACTOR times the radius.
+The margin stops a user standing on the boundary from flapping. Pings
+older than the user's last one (by their `ts`) are ignored. Users we
+have not heard from for STATE_TTL seconds of server time are forgotten,
+whatever clock their device keeps.
+
+State is per process: with several workers, route a user's pings to the
+same one.
+"""
+import math
+import threading
+import time
+
+DEFAULT_RADIUS_M = 150
+GRID_DEGREES = 0.005
+EXIT_FACTOR = 1.2
+STATE_TTL = 2 * 3600
+SWEEP_INTERVAL = 60
+METRES_PER_DEGREE = 111_320.0
+
+
+def _cell(lat, lon):
+    return (math.floor(lat / GRID_DEGREES), math.floor(lon / GRID_DEGREES))
+
+
+class GeofenceIndex:
+    def __init__(self, radius_m=DEFAULT_RADIUS_M):
+        self.radius_m = radius_m
+        self.built_at = None
+        self._fences = []  # (pandal id, name, lat, lon, cos(lat), radius m)
+        self._grid = {}  # cell -> tuple of fence numbers
+        self._users = {}  # user id -> (last ping ts, received at, tuple of fence numbers inside)
+        self._last_sweep = time.monotonic()
+        self._lock = threading.Lock()
+
+    def build(self, pandals):
+        fences = []
+        grid = {}
+        for p in pandals.find({"location.coordinates": {"$exists": True}},
+                              {"name": 1, "location.coordinates": 1, "geofence_m": 1}):
+            lon, lat = (float(v) for v in p["location"]["coordinates"][:2])
+            radius = float(p.get("geofence_m") or self.radius_m)
+            number = len(fences)
+            fences.append((str(p["_id"]), p.get("name"), lat, lon, math.cos(math.radians(lat)), radius))
+            # Register under every cell the exit radius can reach
+            reach = radius * EXIT_FACTOR / METRES_PER_DEGREE
+            lon_reach = reach / max(math.cos(math.radians(lat)), 0.01)
+            low = _cell(lat - reach, lon - lon_reach)
+            high = _cell(lat + reach, lon + lon_reach)
+            for row in range(low[0], high[0] + 1):
+                for col in range(low[1], high[1] + 1):
+                    grid.setdefault((row, col), []).append(number)
+        with self._lock:
+            # Fence numbers change on rebuild, so carry state over by pandal id
+            old_ids = [f[0] for f in self._fences]
+            new_numbers = {f[0]: n for n, f in enumerate(fences)}
+            for user, (ts, seen, inside) in list(self._users.items()):
+                self._users[user] = (ts, seen, tuple(new_numbers[old_ids[n]] for n in inside
+                                               if old_ids[n] in new_numbers))
+            self._fences = fences
+            self._grid = {cell: tuple(numbers) for cell, numbers in grid.items()}
+            self.built_at = time.monotonic()
+        return {"fences": len(fences), "cells": len(grid)}
+
+    def is_stale(self, max_age):
+        return self.built_at is None or time.monotonic() - self.built_at > max_age
+
+    def invalidate(self):
+        self.built_at = None
+
+    def _distance_m(self, fence, lat, lon):
+        _, _, f_lat, f_lon, f_cos, _ = fence
+        dy = (lat - f_lat) * METRES_PER_DEGREE
+        dx = (lon - f_lon) * METRES_PER_DEGREE * f_cos
+        return math.sqrt(dx * dx + dy * dy)
+
+    def process(self, user_id, lat, lon, ts, now=None):
+        """Return [(event, fence)] for one ping; event is "enter" or "exit" """
+        last_ts, _, inside = self._users.get(user_id, (None, None, ()))
+        if last_ts is not None and ts < last_ts:
+            return []
+        events = []
+        still_inside = []
+        for number in inside:
+            fence = self._fences[number]
+            if self._distance_m(fence, lat, lon) > fence[5] * EXIT_FACTOR:
+                events.append(("exit", fence))
+            else:
+                still_inside.append(number)
+        for number in self._grid.get(_cell(lat, lon), ()):
+            if number not in still_inside:
+                fence = self._fences[number]
+                if self._distance_m(fence, lat, lon) <= fence[5]:
+                    events.append(("enter", fence))
+                    still_inside.append(number)
+        self._users[user_id] = (ts, time.monotonic() if now is None else now, tuple(still_inside))
+        return events
+
+    def process_batch(self, pings):
+        """Process [(user_id, lat, lon, ts)] in timestamp order; returns event dicts"""
+        events = []
+        with self._lock:
+            # Client timestamps only order the pings; expiry runs on our clock
+            now = time.monotonic()
+            for user_id, lat, lon, ts in sorted(pings, key=lambda ping: ping[3]):
+                for event, fence in self.process(user_id, lat, lon, ts, now):
+                    events.append({"user_id": user_id, "event": event, "pandal_id": fence[0],
+                                   "name": fence[1], "ts": ts})
+            if now - self._last_sweep > SWEEP_INTERVAL:
+                self._users = {user: state for user, state in self._users.items()
+                               if now - state[1] < STATE_TTL}
+                self._last_sweep = now
+        return events
+
+
+def parse_ping(ping, default_user=None):
+    """(user_id, lat, lon, ts) from a ping object; ts is Unix seconds.
+
+    Raises ValueError if the ping is invalid.
+    """
+    if not isinstance(ping, dict):
+        raise ValueError("ping must be an object")
+    user_id = default_user if default_user is not None else ping.get("user_id")
+    if not user_id:
+        raise ValueError("ping needs a user_id")
+    try:
+        lat, lon = float(ping["lat"]), float(ping["lon"])
+        ts = float(ping.get("ts") or time.time())
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("ping needs numeric lat, lon and ts")
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError("lat/lon out of range")
+    return str(user_id), lat, lon, ts
@@ -0,0 +1,218 @@
+"""Multi-resolution grid aggregates for map heatmaps.
+
+Pandal counts, visit counts and rating sums are kept per square lat/lon
+cell at each size in LEVELS, in the heatmap_cells collection:
+
+  {_id: "2:1900:7280", level: 2, row: 1900, col: 7280, lat, lon,
+   pandals, visits, rating_sum, rating_count}
+
+Writes keep them current with $inc upserts, one bulk_write per event
+across all levels. /api/heatmap reads one level for a bbox through the
+(level, row, col) index. `python heatmap.py` rebuilds everything from
+pandals, visits and ratings, e.g. after pandals were deleted in bulk.
+"""
+import math
+
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+
+# Cell size in degrees; level 0 is coarsest (~4.4 km), level 4 ~280 m
+LEVELS = (0.04, 0.02, 0.01, 0.005, 0.0025)
+# Map zoom at which level 0 is used; each zoom step above picks the next level
+BASE_ZOOM = 11
+MAX_CELLS = 2500
+WRITE_BATCH = 1000
+
+
+def level_for(zoom, bbox):
+    """Finest level at or below `zoom` whose bbox covers at most MAX_CELLS"""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    level = max(0, min(len(LEVELS) - 1, int(zoom) - BASE_ZOOM))
+    while level > 0:
+        size = LEVELS[level]
+        if ((max_lat - min_lat) / size + 1) * ((max_lon - min_lon) / size + 1) <= MAX_CELLS:
+            break
+        level -= 1
+    return level
+
+
+def _cell(level, lat, lon):
+    size = LEVELS[level]
+    return math.floor(lat / size), math.floor(lon / size)
+
+
+def _coordinates(pandal):
+    coordinates = ((pandal or {}).get("location") or {}).get("coordinates")
+    if not coordinates:
+        return None
+    return float(coordinates[1]), float(coordinates[0])
+
+
+def _updates(lat, lon, inc):
+    operations = []
+    for level, size in enumerate(LEVELS):
+        row, col = _cell(level, lat, lon)
+        operations.append(UpdateOne(
+            {"_id": f"{level}:{row}:{col}"},
+            {"$inc": inc,
+             "$setOnInsert": {"level": level, "row": row, "col": col,
+                              "lat": (row + 0.5) * size, "lon": (col + 0.5) * size}},
+            upsert=True))
+    return operations
+
+
+def _apply(db, operations):
+    if operations:
+        db.heatmap_cells.bulk_write(operations, ordered=False)
+
+
+def _pandal_point(db, pandal_id):
+    try:
+        key = ObjectId(pandal_id)
+    except (InvalidId, TypeError):
+        key = pandal_id
+    return _coordinates(db.pandals.find_one({"_id": key}, {"location": 1}))
+
+
+def _activity(db, pandal_ids=None):
+    """{str(pandal id): {"visits", "rating_sum", "rating_count"}} for pandals that have any.
+
+    All pandals when pandal_ids is None. pandal_id is a string from the app
+    and an ObjectId from models.Database, so both forms are summed.
+    """
+    match = {}
+    if pandal_ids is not None:
+        keys = []
+        for pandal_id in pandal_ids:
+            keys.append(str(pandal_id))
+            try:
+                keys.append(ObjectId(pandal_id))
+            except (InvalidId, TypeError):
+                pass
+        if not keys:
+            return {}
+        match = {"pandal_id": {"$in": keys}}
+    totals = {}
+    for r in db.visits.aggregate([
+            {"$match": match},
+            {"$group": {"_id": "$pandal_id", "count": {"$sum": 1}}}]):
+        totals.setdefault(str(r["_id"]), {"visits": 0, "rating_sum": 0.0, "rating_count": 0})["visits"] += r["count"]
+    for r in db.ratings.aggregate([
+            {"$match": dict(match, rating={"$ne": None})},
+            {"$group": {"_id": "$pandal_id", "sum": {"$sum": {"$toDouble": "$rating"}}, "count": {"$sum": 1}}}]):
+        total = totals.setdefault(str(r["_id"]), {"visits": 0, "rating_sum": 0.0, "rating_count": 0})
+        total["rating_sum"] += r["sum"]
+        total["rating_count"] += r["count"]
+    return totals
+
+
+def pandals_changed(db, changes):
+    """Apply [(old pandal or None, new pandal or None)] location changes.
+
+    A pandal's visits and ratings move with it, as rebuild() would count them.
+    """
+    moves = []
+    for old, new in changes:
+        before, after = _coordinates(old), _coordinates(new)
+        if before != after:
+            moves.append((old, new, before, after))
+    # New pandals have no visits or ratings yet
+    activity = _activity(db, [(old or {}).get("_id") for old, _, _, _ in moves if old is not None])
+    operations = []
+    for old, new, before, after in moves:
+        pandal_id = (old or new or {}).get("_id")
+        totals = activity.get(str(pandal_id), {}) if old is not None else {}
+        inc = dict(totals, pandals=1)
+        if before:
+            operations += _updates(*before, {field: -value for field, value in inc.items()})
+        if after:
+            operations += _updates(*after, inc)
+    _apply(db, operations)
+
+
+def visit_recorded(db, pandal_id):
+    point = _pandal_point(db, pandal_id)
+    if point:
+        _apply(db, _updates(*point, {"visits": 1}))
+
+
+def rating_recorded(db, pandal_id, rating_value):
+    try:
+        value = float(rating_value)
+    except (TypeError, ValueError):
+        return
+    point = _pandal_point(db, pandal_id)
+    if point:
+        _apply(db, _updates(*point, {"rating_sum": value, "rating_count": 1}))
+
+
+def cells(db, zoom, bbox):
+    """Non-empty cells of the level chosen for zoom within bbox"""
+    level = level_for(zoom, bbox)
+    min_lon, min_lat, max_lon, max_lat = bbox
+    low = _cell(level, min_lat, min_lon)
+    high = _cell(level, max_lat, max_lon)
+    result = []
+    for c in db.heatmap_cells.find({
+        "level": level,
+        "row": {"$gte": low[0], "$lte": high[0]},
+        "col": {"$gte": low[1], "$lte": high[1]},
+    }):
+        count = c.get("rating_count", 0)
+        if not (c.get("pandals", 0) or c.get("visits", 0) or count):
+            continue
+        result.append({
+            "lat": round(c["lat"], 6),
+            "lon": round(c["lon"], 6),
+            "pandals": c.get("pandals", 0),
+            "visits": c.get("visits", 0),
+            "avg_rating": round(c["rating_sum"] / count, 2) if count else None,
+        })
+    return {"level": level, "cell_degrees": LEVELS[level], "cells": result}
+
+
+def parse_bbox(value):
+    """"minLon,minLat,maxLon,maxLat" -> tuple of floats; raises ValueError"""
+    parts = [float(v) for v in (value or "").split(",")]
+    if len(parts) != 4:
+        raise ValueError("bbox must be minLon,minLat,maxLon,maxLat")
+    min_lon, min_lat, max_lon, max_lat = parts
+    if not (min_lon <= max_lon and min_lat <= max_lat):
+        raise ValueError("bbox minimums must not exceed maximums")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def rebuild(db):
+    """Recompute every cell from pandals, visits and ratings"""
+    activity = _activity(db)
+
+    totals = {}
+    for p in db.pandals.find({"location.coordinates": {"$exists": True}}, {"location": 1}):
+        lat, lon = _coordinates(p)
+        counts = activity.get(str(p["_id"]), {})
+        for level, size in enumerate(LEVELS):
+            row, col = _cell(level, lat, lon)
+            cell = totals.setdefault(f"{level}:{row}:{col}", {
+                "level": level, "row": row, "col": col,
+                "lat": (row + 0.5) * size, "lon": (col + 0.5) * size,
+                "pandals": 0, "visits": 0, "rating_sum": 0.0, "rating_count": 0})
+            cell["pandals"] += 1
+            cell["visits"] += counts.get("visits", 0)
+            cell["rating_sum"] += counts.get("rating_sum", 0.0)
+            cell["rating_count"] += counts.get("rating_count", 0)
+
+    db.heatmap_cells.delete_many({})
+    documents = [dict(cell, _id=key) for key, cell in totals.items()]
+    for start in range(0, len(documents), WRITE_BATCH):
+        db.heatmap_cells.insert_many(documents[start:start + WRITE_BATCH])
+    db.heatmap_cells.create_index([("level", 1), ("row", 1), ("col", 1)])
+    return {"cells": len(documents)}
+
+
+if __name__ == "__main__":
+    import pymongo
+    import config
+
+    db = pymongo.MongoClient(config.MONGO_URI).utsavdarshan
+    print(f"Rebuilt {rebuild(db)['cells']} heatmap cells")
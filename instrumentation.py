@@ -0,0 +1,205 @@
+"""Per-request instrumentation exposed on /metrics and in Server-Timing.
+
+For every request we record wall time, the count and duration of Mongo
+commands (pymongo CommandListener), outbound HTTP calls and their
+latency, and template render time. Totals go into Prometheus histograms
+labelled by route, and a Server-Timing header summarises the request for
+browser dev tools.
+
+The N+1 detector groups a request's Mongo commands by shape (command,
+collection and filter keys, values ignored) and logs a warning when one
+shape repeats more than N_PLUS_ONE_THRESHOLD times.
+"""
+import contextvars
+import os
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from flask import Response, before_render_template, current_app, g, request, template_rendered
+from pymongo import monitoring
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Histogram, REGISTRY,
+                               generate_latest)
+
+DEFAULT_N_PLUS_ONE_THRESHOLD = 10
+
+REQUEST_SECONDS = Histogram(
+    "utsav_request_duration_seconds", "Wall time per request",
+    ["route", "method", "status"])
+MONGO_COMMANDS = Histogram(
+    "utsav_mongo_commands_per_request", "Mongo commands issued per request",
+    ["route"], buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 500))
+MONGO_SECONDS = Histogram(
+    "utsav_mongo_command_duration_seconds", "Duration of individual Mongo commands",
+    ["route", "command"])
+HTTP_CALLS = Histogram(
+    "utsav_outbound_http_calls_per_request", "Outbound HTTP calls per request",
+    ["route"], buckets=(0, 1, 2, 3, 5, 10, 20, 50))
+HTTP_SECONDS = Histogram(
+    "utsav_outbound_http_duration_seconds", "Latency of outbound HTTP calls",
+    ["route", "host"])
+RENDER_SECONDS = Histogram(
+    "utsav_template_render_seconds", "Template render time per request",
+    ["route", "template"])
+
+_current = contextvars.ContextVar("utsav_request_metrics", default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.mongo_count = 0
+        self.mongo_seconds = 0.0
+        self.mongo_by_command = []  # (command name, seconds)
+        self.shapes = Counter()
+        self.http_calls = []  # (host, seconds)
+        self.render_depth = 0
+        self.render_started = 0.0
+        self.renders = []  # (template, seconds) for outermost renders only
+
+
+def query_shape(event):
+    """Query shape: command, collection and filter keys without values"""
+    command = event.command
+    name = event.command_name
+    collection = command.get(name)
+    if name in ("find", "count", "delete"):
+        keys = sorted((command.get("filter") or command.get("query") or {}).keys())
+    elif name == "aggregate":
+        keys = [next(iter(stage), "") for stage in command.get("pipeline", [])]
+    elif name == "update":
+        keys = sorted(key for u in command.get("updates", [])[:1] for key in u.get("q", {}))
+    else:
+        keys = []
+    return f"{name} {collection} {keys}"
+
+
+class MongoListener(monitoring.CommandListener):
+    def started(self, event):
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.mongo_count += 1
+            metrics.shapes[query_shape(event)] += 1
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
+
+    def _finished(self, event):
+        metrics = _current.get()
+        if metrics is not None:
+            seconds = event.duration_micros / 1e6
+            metrics.mongo_seconds += seconds
+            metrics.mongo_by_command.append((event.command_name, seconds))
+
+
+mongo_listener = MongoListener()
+
+
+def record_http(url, seconds):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.http_calls.append((urlsplit(str(url)).hostname or "unknown", seconds))
+
+
+def requests_hook(response, *args, **kwargs):
+    """`hooks={"response": requests_hook}` for calls made with requests"""
+    record_http(response.url, response.elapsed.total_seconds())
+
+
+async def _httpx_request_hook(http_request):
+    http_request.extensions["utsav_started"] = time.perf_counter()
+
+
+async def _httpx_response_hook(http_response):
+    started = http_response.request.extensions.get("utsav_started")
+    if started is not None:
+        record_http(http_response.request.url, time.perf_counter() - started)
+
+
+HTTPX_EVENT_HOOKS = {"request": [_httpx_request_hook], "response": [_httpx_response_hook]}
+
+
+def _before_render(sender, template, context, **extra):
+    metrics = _current.get()
+    if metrics is not None:
+        if metrics.render_depth == 0:
+            metrics.render_started = time.perf_counter()
+        metrics.render_depth += 1
+
+
+def _rendered(sender, template, context, **extra):
+    metrics = _current.get()
+    if metrics is not None and metrics.render_depth:
+        metrics.render_depth -= 1
+        if metrics.render_depth == 0:
+            metrics.renders.append((template.name, time.perf_counter() - metrics.render_started))
+
+
+def _start_request():
+    g.utsav_metrics_token = _current.set(RequestMetrics())
+
+
+def _finish_request(response):
+    metrics = _current.get()
+    if metrics is None:
+        return response
+    wall = time.perf_counter() - metrics.started
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+
+    REQUEST_SECONDS.labels(route, request.method, str(response.status_code)).observe(wall)
+    MONGO_COMMANDS.labels(route).observe(metrics.mongo_count)
+    for command, seconds in metrics.mongo_by_command:
+        MONGO_SECONDS.labels(route, command).observe(seconds)
+    HTTP_CALLS.labels(route).observe(len(metrics.http_calls))
+    for host, seconds in metrics.http_calls:
+        HTTP_SECONDS.labels(route, host).observe(seconds)
+    render_seconds = 0.0
+    for template, seconds in metrics.renders:
+        RENDER_SECONDS.labels(route, template).observe(seconds)
+        render_seconds += seconds
+
+    threshold = current_app.config.get("N_PLUS_ONE_THRESHOLD", DEFAULT_N_PLUS_ONE_THRESHOLD)
+    for shape, count in metrics.shapes.items():
+        if count > threshold:
+            current_app.logger.warning(
+                "Possible N+1: %s %s issued %d x %s", request.method, route, count, shape)
+
+    timing = [
+        f"app;dur={wall * 1000:.1f}",
+        f'mongo;dur={metrics.mongo_seconds * 1000:.1f};desc="{metrics.mongo_count} commands"',
+        f'http;dur={sum(s for _, s in metrics.http_calls) * 1000:.1f};desc="{len(metrics.http_calls)} calls"',
+        f"tpl;dur={render_seconds * 1000:.1f}",
+    ]
+    existing = response.headers.get("Server-Timing")
+    response.headers["Server-Timing"] = ", ".join(([existing] if existing else []) + timing)
+    return response
+
+
+def _end_request(exc):
+    token = g.pop("utsav_metrics_token", None)
+    if token is not None:
+        _current.reset(token)
+
+
+def metrics_view():
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        # Aggregate samples written by every gunicorn worker
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_app(app):
+    """Install request hooks and /metrics; pass mongo_listener to the MongoClient"""
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_end_request)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
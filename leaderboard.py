@@ -0,0 +1,200 @@
+"""Top-rated pandals, ranked by Bayesian average.
+
+    score = (C * m + sum of ratings) / (C + number of ratings)
+
+C (LEADERBOARD_PRIOR_WEIGHT) is how many "average" ratings every pandal
+starts with and m is the mean of all ratings at the last rebuild. A
+pandal with two 5-star reviews therefore doesn't outrank one with five
+hundred 4.8s. m is held fixed between rebuilds so that a new rating only
+moves its own pandal: the entry is removed and reinserted in a sorted
+list for the overall board, its area and its theme, O(log n) each.
+
+The boards live in process memory. Each worker rebuilds from Mongo on
+first use and again every LEADERBOARD_REBUILD_SECONDS, which also picks
+up ratings written by other workers. Pandal saves and deletes move or
+evict their entries through update_pandal and remove_pandal, and a
+rebuild leaves out ratings of pandals that no longer exist. `flask rebuild-leaderboard` and
+POST /admin/leaderboard/rebuild force a rebuild.
+
+A rebuild counts ratings up to the newest created_at it sees when it
+starts. Ratings this worker adds while it runs are logged and applied to
+the new boards before they replace the old ones, so they are not lost.
+"""
+import threading
+import time
+
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from sortedcontainers import SortedList
+
+DEFAULT_PRIOR_WEIGHT = 10
+DEFAULT_PRIOR_MEAN = 3.0
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+META_FIELDS = ("name", "area", "theme")
+
+
+def pandal_object_id(pandal_id):
+    try:
+        return ObjectId(pandal_id)
+    except (InvalidId, TypeError):
+        return pandal_id
+
+
+class Leaderboard:
+    def __init__(self, prior_weight=DEFAULT_PRIOR_WEIGHT, prior_mean=DEFAULT_PRIOR_MEAN):
+        self.prior_weight = prior_weight
+        self.prior_mean = prior_mean
+        self.built_at = None
+        self._stats = {}  # pandal_id -> [count, total]
+        self._meta = {}  # pandal_id -> {"name", "area", "theme"}
+        self._boards = {}  # None, ("area", x) or ("theme", x) -> SortedList of (-score, pandal_id)
+        self._logs = []  # one list per rebuild in progress, of add_rating calls to replay
+        self._lock = threading.Lock()
+
+    def score(self, count, total):
+        return (self.prior_weight * self.prior_mean + total) / (self.prior_weight + count)
+
+    def _board_keys(self, pandal_id):
+        meta = self._meta.get(pandal_id, {})
+        keys = [None]
+        if meta.get("area"):
+            keys.append(("area", meta["area"].lower()))
+        if meta.get("theme"):
+            keys.append(("theme", meta["theme"].lower()))
+        return keys
+
+    def _place(self, pandal_id, count, total):
+        old = self._stats.get(pandal_id)
+        keys = self._board_keys(pandal_id)
+        if old is not None:
+            entry = (-self.score(*old), pandal_id)
+            for key in keys:
+                self._boards[key].discard(entry)
+        self._stats[pandal_id] = [count, total]
+        entry = (-self.score(count, total), pandal_id)
+        for key in keys:
+            self._boards.setdefault(key, SortedList()).add(entry)
+
+    @property
+    def rebuilding(self):
+        return bool(self._logs)
+
+    def __contains__(self, pandal_id):
+        return pandal_id in self._meta
+
+    def add_rating(self, pandal_id, value, pandal=None, created_at=None):
+        """Fold one new rating in; `pandal` supplies name/area/theme if unseen"""
+        with self._lock:
+            for log in self._logs:
+                log.append((pandal_id, value, pandal, created_at))
+            self._add(pandal_id, value, pandal)
+
+    def _add(self, pandal_id, value, pandal):
+        if pandal_id not in self._meta:
+            if pandal is None:
+                return
+            self._meta[pandal_id] = {f: pandal.get(f) for f in META_FIELDS}
+        count, total = self._stats.get(pandal_id, (0, 0.0))
+        self._place(pandal_id, count + 1, total + value)
+
+    def _unplace(self, pandal_id):
+        stats = self._stats.pop(pandal_id, None)
+        if stats is not None:
+            entry = (-self.score(*stats), pandal_id)
+            for key in self._board_keys(pandal_id):
+                self._boards[key].discard(entry)
+        return stats
+
+    def update_pandal(self, pandal_id, pandal):
+        """Refresh name/area/theme after a save, moving the entry between boards"""
+        meta = {f: pandal.get(f) for f in META_FIELDS}
+        with self._lock:
+            if self._meta.get(pandal_id, meta) == meta:
+                return
+            stats = self._unplace(pandal_id)
+            self._meta[pandal_id] = meta
+            if stats is not None:
+                self._place(pandal_id, *stats)
+
+    def remove_pandal(self, pandal_id):
+        with self._lock:
+            self._unplace(pandal_id)
+            self._meta.pop(pandal_id, None)
+
+    def top(self, area=None, theme=None, limit=DEFAULT_LIMIT):
+        if area:
+            key = ("area", area.lower())
+        elif theme:
+            key = ("theme", theme.lower())
+        else:
+            key = None
+        wanted_theme = theme.lower() if area and theme else None
+        rows = []
+        with self._lock:
+            for neg_score, pandal_id in self._boards.get(key, ()):
+                meta = self._meta.get(pandal_id, {})
+                if wanted_theme and (meta.get("theme") or "").lower() != wanted_theme:
+                    continue
+                count, total = self._stats[pandal_id]
+                rows.append({
+                    "pandal_id": pandal_id,
+                    "name": meta.get("name"),
+                    "area": meta.get("area"),
+                    "theme": meta.get("theme"),
+                    "score": round(-neg_score, 3),
+                    "average": round(total / count, 2),
+                    "count": count,
+                })
+                if len(rows) >= limit:
+                    break
+        return rows
+
+    def rebuild(self, pandals, ratings):
+        """Recompute every board from the ratings and pandals collections"""
+        log = []
+        with self._lock:
+            self._logs.append(log)
+        try:
+            newest = ratings.find_one({"created_at": {"$ne": None}}, {"created_at": 1}, sort=[("created_at", -1)])
+            cutoff = newest["created_at"] if newest else None
+            match = {"rating": {"$ne": None}}
+            if cutoff is not None:
+                match["$or"] = [{"created_at": {"$lte": cutoff}}, {"created_at": None}]
+            totals = {
+                r["_id"]: (r["count"], r["total"]) for r in ratings.aggregate([
+                    {"$match": match},
+                    {"$group": {
+                        "_id": "$pandal_id",
+                        "count": {"$sum": 1},
+                        "total": {"$sum": {"$toDouble": "$rating"}},
+                    }},
+                ]) if r["_id"] is not None and r["count"]
+            }
+            meta = {
+                str(p["_id"]): {f: p.get(f) for f in META_FIELDS}
+                for p in pandals.find({"_id": {"$in": [pandal_object_id(i) for i in totals]}},
+                                      {"name": 1, "area": 1, "theme": 1})
+            }
+            # Ratings can outlive their pandal
+            totals = {pandal_id: stats for pandal_id, stats in totals.items() if pandal_id in meta}
+            count = sum(c for c, _ in totals.values())
+            with self._lock:
+                self.prior_mean = sum(t for _, t in totals.values()) / count if count else DEFAULT_PRIOR_MEAN
+                self._stats = {}
+                self._meta = meta
+                self._boards = {None: SortedList()}
+                for pandal_id, (c, t) in totals.items():
+                    self._place(pandal_id, c, t)
+                # Ratings added since the rebuild started that it did not count
+                for pandal_id, value, pandal, created_at in log:
+                    if created_at is not None and (cutoff is None or created_at > cutoff):
+                        self._add(pandal_id, value, pandal)
+                self.built_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._logs.remove(log)
+        return {"pandals": len(totals), "ratings": count, "prior_mean": round(self.prior_mean, 3)}
+
+    def is_stale(self, max_age):
+        return self.built_at is None or time.monotonic() - self.built_at > max_age
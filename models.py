@@ -1,6 +1,10 @@
 from flask_pymongo import PyMongo
 from bson.objectid import ObjectId
 import datetime
+import changes
+import heatmap
+import boundaries
+import opening_hours
 
 # MongoDB collections schema definitions:
 # 
@@ -50,12 +54,23 @@ import datetime
 
 class Database:
     def __init__(self, app):
+        self.app = app
         self.mongo = PyMongo(app)
         self.db = self.mongo.db
+        # Ward/taluka polygons that set a pandal's area from its location
+        path = app.config.get("AREA_BOUNDARIES")
+        self.areas = boundaries.AreaIndex.from_geojson(path, app.config.get("AREA_NAME_PROPERTY")) if path else None
         # Ensure the database connection is established
-        if not self.db:
+        if self.db is None:
             raise ConnectionError("Failed to connect to MongoDB database")
     
+    def _notify(self, event, pandal_list):
+        """Run the app's pandal hook for `event` (see create_app), if it set one"""
+        hook = self.app.extensions.get("pandal_hooks", {}).get(event)
+        if hook is not None and pandal_list:
+            with self.app.app_context():
+                hook(pandal_list)
+    
     # Pandal operations
     def get_all_pandals(self):
         return list(self.db.pandals.find())
@@ -67,16 +82,44 @@ class Database:
         return list(self.db.pandals.find({"properties.area": taluka}))
     
     def insert_pandal(self, pandal_data):
-        return self.db.pandals.insert_one(pandal_data)
+        if self.areas is not None:
+            self.areas.assign(pandal_data)
+        pandal_data.update(opening_hours.hours_update(pandal_data)[0])
+        with changes.reserved(self.db) as seq:
+            pandal_data.update(changes.stamp(seq, created=True))
+            result = self.db.pandals.insert_one(pandal_data)
+        heatmap.pandals_changed(self.db, [(None, pandal_data)])
+        self._notify("saved", [pandal_data])
+        return result
     
     def update_pandal(self, pandal_id, update_data):
-        return self.db.pandals.update_one(
-            {"_id": ObjectId(pandal_id)},
-            {"$set": update_data}
-        )
+        old = self.db.pandals.find_one({"_id": ObjectId(pandal_id)})
+        if "location" in update_data and self.areas is not None:
+            self.areas.assign(update_data)
+        # Keep open_minutes/close_minutes in step with the "HH:MM" strings
+        hours, stale_hours = opening_hours.hours_update(update_data, old)
+        with changes.reserved(self.db) as seq:
+            update = {"$set": dict(update_data, **hours, **changes.stamp(seq))}
+            if stale_hours:
+                update["$unset"] = stale_hours
+            result = self.db.pandals.update_one({"_id": ObjectId(pandal_id)}, update)
+        if old is not None and "location" in update_data:
+            heatmap.pandals_changed(self.db, [(old, update_data)])
+        if old is not None:
+            # The old copy too, so pages listing its previous area are dropped
+            self._notify("saved", [old, dict(old, **update_data)])
+        return result
     
     def delete_pandal(self, pandal_id):
-        return self.db.pandals.delete_one({"_id": ObjectId(pandal_id)})
+        old = self.db.pandals.find_one({"_id": ObjectId(pandal_id)}, {"location": 1, "area": 1})
+        with changes.reserved(self.db) as seq:
+            result = self.db.pandals.delete_one({"_id": ObjectId(pandal_id)})
+            if result.deleted_count:
+                changes.record_delete(self.db, str(pandal_id), seq)
+        if result.deleted_count:
+            heatmap.pandals_changed(self.db, [(old, None)])
+            self._notify("deleted", [old])
+        return result
     
     # User operations
     def get_user_by_id(self, user_id):
@@ -93,7 +136,9 @@ class Database:
             "pandal_id": ObjectId(pandal_id),
             "visited_at": datetime.datetime.utcnow()
         }
-        return self.db.visits.insert_one(visit_data)
+        result = self.db.visits.insert_one(visit_data)
+        heatmap.visit_recorded(self.db, pandal_id)
+        return result
     
     def get_user_visits(self, user_id):
         return list(self.db.visits.find({"user_id": user_id}))
@@ -107,7 +152,9 @@ class Database:
             "comment": comment,
             "created_at": datetime.datetime.utcnow()
         }
-        return self.db.ratings.insert_one(rating_data)
+        result = self.db.ratings.insert_one(rating_data)
+        heatmap.rating_recorded(self.db, pandal_id, rating)
+        return result
     
     def get_pandal_ratings(self, pandal_id):
         return list(self.db.ratings.find({"pandal_id": ObjectId(pandal_id)}))
@@ -146,23 +193,6 @@ class Database:
             }
         }))
     
-    def get_user_visits(self, user_id):
-        return list(self.db.visits.find({"user_id": user_id}))
-    
-    # Rating operations
-    def add_rating(self, user_id, pandal_id, rating, comment=None):
-        rating_data = {
-            "user_id": user_id,
-            "pandal_id": pandal_id,
-            "rating": rating,
-            "comment": comment,
-            "timestamp": datetime.datetime.utcnow()
-        }
-        return self.db.ratings.insert_one(rating_data)
-    
-    def get_pandal_ratings(self, pandal_id):
-        return list(self.db.ratings.find({"pandal_id": pandal_id}))
-    
     # Import GeoJSON data
     def import_geojson_features(self, features):
         """Import GeoJSON features into the pandals collection"""
@@ -172,5 +202,11 @@ class Database:
         # Clear existing data if needed
         # self.db.pandals.delete_many({})
         
-        result = self.db.pandals.insert_many(features)
+        if self.areas is not None:
+            for feature in features:
+                self.areas.assign(feature)
+        with changes.reserved(self.db, len(features)) as first:
+            result = self.db.pandals.insert_many(changes.stamp_many(features, first))
+        heatmap.pandals_changed(self.db, [(None, f) for f in features])
+        self._notify("saved", features)
         return {"inserted": len(result.inserted_ids)}
\ No newline at end of file
@@ -0,0 +1,253 @@
+"""In-memory repository with the same operations as models.Database.
+
+Pandals are held in a dict keyed by str(_id) with hash indexes on area,
+theme and idol_type and a fixed-size lat/lon grid for radius queries, so
+demos, tests and benchmarks can run without MongoDB. Write methods return
+pymongo result objects so callers can treat both backends alike.
+"""
+import datetime
+import json
+import math
+import threading
+from collections import defaultdict
+
+from bson.objectid import ObjectId
+from pymongo.results import DeleteResult, InsertOneResult, UpdateResult
+
+INDEXED_FIELDS = ("area", "theme", "idol_type")
+GRID_DEGREES = 0.01  # roughly 1.1 km cells around Mumbai
+EARTH_RADIUS_M = 6371008.8
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres"""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((p2 - p1) / 2) ** 2
+         + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(1.0, a)))
+
+
+def _coordinates(pandal):
+    try:
+        lon, lat = pandal["location"]["coordinates"][:2]
+        return float(lat), float(lon)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _cell(lat, lon):
+    return (math.floor(lat / GRID_DEGREES), math.floor(lon / GRID_DEGREES))
+
+
+class MemoryDatabase:
+    def __init__(self, pandals=()):
+        self._lock = threading.RLock()
+        self._pandals = {}
+        self._indexes = {field: defaultdict(set) for field in INDEXED_FIELDS}
+        self._grid = defaultdict(set)
+        self.users = {}
+        self.visits = []
+        self.ratings = defaultdict(list)  # str(pandal_id) -> ratings
+        self.badges = {}
+        self.user_badges = []
+        for pandal in pandals:
+            self.insert_pandal(pandal)
+
+    @classmethod
+    def from_geojson(cls, path):
+        """Load pandals from a GeoJSON FeatureCollection file"""
+        with open(path, "r") as f:
+            geojson_data = json.load(f)
+        db = cls()
+        db.import_geojson_features(geojson_data.get("features", []))
+        return db
+
+    # Index maintenance
+    def _index(self, key, pandal):
+        for field in INDEXED_FIELDS:
+            if pandal.get(field):
+                self._indexes[field][str(pandal[field]).lower()].add(key)
+        coords = _coordinates(pandal)
+        if coords:
+            self._grid[_cell(*coords)].add(key)
+
+    def _unindex(self, key, pandal):
+        for field in INDEXED_FIELDS:
+            if pandal.get(field):
+                keys = self._indexes[field].get(str(pandal[field]).lower())
+                if keys is not None:
+                    keys.discard(key)
+        coords = _coordinates(pandal)
+        if coords:
+            self._grid[_cell(*coords)].discard(key)
+
+    # Pandal operations
+    def get_all_pandals(self):
+        with self._lock:
+            return list(self._pandals.values())
+
+    def get_pandal_by_id(self, pandal_id):
+        return self._pandals.get(str(pandal_id))
+
+    def get_pandals_by_taluka(self, taluka):
+        return self.find_pandals(exact=True, area=taluka)
+
+    def find_pandals(self, exact=False, **criteria):
+        """Case-insensitive substring match on any of area, theme and idol_type.
+
+        Only the indexes' distinct values are scanned, not the pandals.
+        With exact=True the whole value must match.
+        """
+        with self._lock:
+            keys = None
+            for field, value in criteria.items():
+                if value is None:
+                    continue
+                needle = str(value).lower()
+                if exact:
+                    matches = self._indexes[field].get(needle, set())
+                else:
+                    matches = set()
+                    for indexed, indexed_keys in self._indexes[field].items():
+                        if needle in indexed:
+                            matches |= indexed_keys
+                keys = set(matches) if keys is None else keys & matches
+            if keys is None:
+                return list(self._pandals.values())
+            return [self._pandals[k] for k in keys]
+
+    def distinct(self, field):
+        """Distinct values of an indexed field, as originally written"""
+        with self._lock:
+            values = set()
+            for keys in self._indexes[field].values():
+                if keys:
+                    values.add(self._pandals[next(iter(keys))][field])
+            return sorted(values)
+
+    def insert_pandal(self, pandal_data):
+        with self._lock:
+            pandal_data.setdefault("_id", ObjectId())
+            key = str(pandal_data["_id"])
+            if key in self._pandals:
+                self._unindex(key, self._pandals[key])
+            self._pandals[key] = pandal_data
+            self._index(key, pandal_data)
+            return InsertOneResult(pandal_data["_id"], True)
+
+    def update_pandal(self, pandal_id, update_data):
+        with self._lock:
+            key = str(pandal_id)
+            pandal = self._pandals.get(key)
+            if pandal is None:
+                return UpdateResult({"n": 0, "nModified": 0}, True)
+            self._unindex(key, pandal)
+            pandal.update(update_data)
+            self._index(key, pandal)
+            return UpdateResult({"n": 1, "nModified": 1}, True)
+
+    def delete_pandal(self, pandal_id):
+        with self._lock:
+            key = str(pandal_id)
+            pandal = self._pandals.pop(key, None)
+            if pandal is None:
+                return DeleteResult({"n": 0}, True)
+            self._unindex(key, pandal)
+            return DeleteResult({"n": 1}, True)
+
+    # User operations
+    def get_user_by_id(self, user_id):
+        return self.users.get(str(user_id))
+
+    def create_user(self, user_data):
+        user_data["created_at"] = datetime.datetime.utcnow()
+        user_data.setdefault("_id", ObjectId())
+        self.users[str(user_data["_id"])] = user_data
+        return InsertOneResult(user_data["_id"], True)
+
+    # Visit operations
+    def record_visit(self, user_id, pandal_id):
+        visit_data = {
+            "_id": ObjectId(),
+            "user_id": user_id,
+            "pandal_id": pandal_id,
+            "visited_at": datetime.datetime.utcnow()
+        }
+        self.visits.append(visit_data)
+        return InsertOneResult(visit_data["_id"], True)
+
+    def get_user_visits(self, user_id):
+        return [v for v in self.visits if v["user_id"] == user_id]
+
+    # Rating operations
+    def add_rating(self, user_id, pandal_id, rating, comment=None):
+        rating_data = {
+            "_id": ObjectId(),
+            "user_id": user_id,
+            "pandal_id": pandal_id,
+            "rating": rating,
+            "comment": comment,
+            "created_at": datetime.datetime.utcnow()
+        }
+        self.ratings[str(pandal_id)].append(rating_data)
+        return InsertOneResult(rating_data["_id"], True)
+
+    def get_pandal_ratings(self, pandal_id):
+        return list(self.ratings.get(str(pandal_id), ()))
+
+    # Badge operations
+    def get_all_badges(self):
+        return list(self.badges.values())
+
+    def assign_badge_to_user(self, user_id, badge_id):
+        user_badge = {
+            "_id": ObjectId(),
+            "user_id": user_id,
+            "badge_id": badge_id,
+            "awarded_at": datetime.datetime.utcnow()
+        }
+        self.user_badges.append(user_badge)
+        return InsertOneResult(user_badge["_id"], True)
+
+    # Geospatial operations
+    def find_nearby_pandals(self, lon, lat, max_distance=2000):
+        """
+        Find pandals near a specific location, nearest first
+
+        Args:
+            lon: Longitude coordinate
+            lat: Latitude coordinate
+            max_distance: Maximum distance in meters (default 2000m/2km)
+
+        Returns:
+            List of pandals within the specified distance
+        """
+        lat_span = max_distance / 111320.0
+        lon_span = max_distance / (111320.0 * max(math.cos(math.radians(lat)), 1e-6))
+        min_cell = _cell(lat - lat_span, lon - lon_span)
+        max_cell = _cell(lat + lat_span, lon + lon_span)
+
+        with self._lock:
+            found = []
+            for row in range(min_cell[0], max_cell[0] + 1):
+                for col in range(min_cell[1], max_cell[1] + 1):
+                    for key in self._grid.get((row, col), ()):
+                        pandal = self._pandals[key]
+                        p_lat, p_lon = _coordinates(pandal)
+                        distance = haversine_m(lat, lon, p_lat, p_lon)
+                        if distance <= max_distance:
+                            found.append((distance, pandal))
+        found.sort(key=lambda item: item[0])
+        return [pandal for _, pandal in found]
+
+    # Import GeoJSON data
+    def import_geojson_features(self, features):
+        """Import GeoJSON features as pandal documents"""
+        if not features:
+            return {"inserted": 0}
+        for feature in features:
+            pandal = dict(feature.get("properties") or {})
+            if feature.get("geometry"):
+                pandal["location"] = feature["geometry"]
+            self.insert_pandal(pandal)
+        return {"inserted": len(features)}
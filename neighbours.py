@@ -0,0 +1,324 @@
+"""Precomputed nearest-neighbour table for pandals.
+
+The batch job writes two things into the neighbour directory:
+
+  index.json          row number -> pandal id, name and coordinates
+  neighbours-<N>.npy  (rows, k) records of (row int32, km float32)
+
+New pandals are appended and deleted ones dropped, so row numbers can
+shift between generations; readers always go through index.json. Every
+worker maps the same .npy file read-only, which makes a detail-page
+lookup a plain array slice. Writers hold an flock on the directory's
+.lock file, so saves in several workers don't interleave.
+"""
+import fcntl
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+DEFAULT_K = 8
+CHUNK_ROWS = 1024
+INDEX_FILE = "index.json"
+LOCK_FILE = ".lock"
+
+NEIGHBOUR_DTYPE = np.dtype([("row", "<i4"), ("km", "<f4")])
+
+
+def haversine_matrix(lat1, lon1, lat2, lon2):
+    """Pairwise great-circle distances in km between two sets of points"""
+    lat1 = np.radians(np.asarray(lat1, dtype=np.float64))[:, None]
+    lon1 = np.radians(np.asarray(lon1, dtype=np.float64))[:, None]
+    lat2 = np.radians(np.asarray(lat2, dtype=np.float64))[None, :]
+    lon2 = np.radians(np.asarray(lon2, dtype=np.float64))[None, :]
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _nearest(rows, dist, k):
+    """Keep the k smallest entries per row of `dist`, sorted ascending"""
+    out = np.empty((dist.shape[0], k), dtype=NEIGHBOUR_DTYPE)
+    out["row"] = -1
+    out["km"] = np.inf
+    take = min(k, dist.shape[1])
+    if take == 0:
+        return out
+    part = np.argpartition(dist, take - 1, axis=1)[:, :take]
+    part_dist = np.take_along_axis(dist, part, axis=1)
+    order = np.argsort(part_dist, axis=1, kind="stable")
+    best = np.take_along_axis(part, order, axis=1)
+    best_dist = np.take_along_axis(part_dist, order, axis=1)
+    valid = np.isfinite(best_dist)
+    out["row"][:, :take] = np.where(valid, np.take_along_axis(rows, best, axis=1), -1)
+    out["km"][:, :take] = best_dist
+    return out
+
+
+def _load_points(collection, query=None):
+    """Fetch id, name and coordinates of located pandals in _id order"""
+    ids, names, lats, lons = [], [], [], []
+    cursor = collection.find(
+        dict(query or {}, **{"location.coordinates": {"$exists": True}}),
+        {"name": 1, "location.coordinates": 1}
+    ).sort("_id", 1)
+    for p in cursor:
+        lon, lat = p["location"]["coordinates"][:2]
+        ids.append(str(p["_id"]))
+        names.append(p.get("name"))
+        lats.append(float(lat))
+        lons.append(float(lon))
+    return ids, names, np.array(lats), np.array(lons)
+
+
+@contextmanager
+def locked(directory):
+    """Exclusive lock for read-modify-write of a table directory"""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, LOCK_FILE), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def read_index(directory):
+    try:
+        with open(os.path.join(directory, INDEX_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_generation(directory, meta, matrix, prefix="neighbours", extra=None):
+    """Write a new matrix generation, then atomically swap index.json.
+
+    `extra` maps names to further arrays saved with the generation; the
+    index records each file under its name. Call it with locked(directory)
+    held.
+    """
+    os.makedirs(directory, exist_ok=True)
+    previous = read_index(directory) or {}
+    generation = previous.get("generation", 0) + 1
+    matrix_name = f"{prefix}-{generation}.npy"
+    np.save(os.path.join(directory, matrix_name), matrix)
+    files = {"matrix": matrix_name}
+    for name, array in (extra or {}).items():
+        files[name] = f"{prefix}-{name}-{generation}.npy"
+        np.save(os.path.join(directory, files[name]), array)
+
+    meta = dict(meta, generation=generation, **files)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=INDEX_FILE, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(directory, INDEX_FILE))
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    # Keep the previous generation for readers that are mid-reload
+    keep = set(files.values()) | {previous.get(name) for name in files}
+    for name in os.listdir(directory):
+        if name.startswith(prefix + "-") and name.endswith(".npy") and name not in keep:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+def build_neighbours(collection, directory, k=DEFAULT_K):
+    """Compute the k nearest neighbours of every pandal from scratch"""
+    with locked(directory):
+        return _build_neighbours(collection, directory, k)
+
+
+def _build_neighbours(collection, directory, k):
+    ids, names, lat, lon = _load_points(collection)
+    n = len(ids)
+    all_rows = np.broadcast_to(np.arange(n, dtype=np.int32), (min(CHUNK_ROWS, n), n))
+    matrix = np.empty((n, k), dtype=NEIGHBOUR_DTYPE)
+    for start in range(0, n, CHUNK_ROWS):
+        stop = min(start + CHUNK_ROWS, n)
+        dist = haversine_matrix(lat[start:stop], lon[start:stop], lat, lon)
+        dist[np.arange(stop - start), np.arange(start, stop)] = np.inf
+        matrix[start:stop] = _nearest(all_rows[:stop - start], dist, k)
+
+    write_generation(directory, {
+        "k": k,
+        "ids": ids,
+        "names": names,
+        "lat": lat.tolist(),
+        "lon": lon.tolist(),
+    }, matrix)
+    return {"rows": n, "added": n, "moved": 0, "deleted": 0}
+
+
+def update_neighbours(collection, directory, k=DEFAULT_K, changed_ids=None, deleted_ids=()):
+    """Bring the table up to date with added, moved and deleted pandals.
+
+    With `changed_ids` only those pandals are read back; one that is gone
+    or no longer located counts as deleted. Without it the whole
+    collection is compared against the table. Rows whose list mentions a
+    moved or deleted pandal are recomputed in full; every other row only
+    merges in distances to moved and new pandals, so the cost is O(n * m)
+    for m changes instead of a full O(n^2) rebuild.
+    """
+    with locked(directory):
+        meta = read_index(directory)
+        if meta is None:
+            return _build_neighbours(collection, directory, k)
+        return _update_neighbours(collection, directory, meta, changed_ids, deleted_ids)
+
+
+def _update_neighbours(collection, directory, meta, changed_ids, deleted_ids):
+    k = meta["k"]
+    old_row = {pid: r for r, pid in enumerate(meta["ids"])}
+    deleted = {str(i) for i in deleted_ids}
+    if changed_ids is None:
+        ids, names, lat, lon = _load_points(collection)
+        deleted |= set(meta["ids"]) - set(ids)
+    else:
+        changed_ids = list(changed_ids)
+        ids, names, lat, lon = _load_points(collection, {"_id": {"$in": changed_ids}})
+        deleted |= {str(i) for i in changed_ids} - set(ids)
+    deleted &= set(old_row)
+
+    loaded = {pid: (name, y, x) for pid, name, y, x in zip(ids, names, lat.tolist(), lon.tolist())}
+    added = [pid for pid in ids if pid not in old_row]
+    moved = [pid for pid in ids if pid in old_row
+             and (meta["lat"][old_row[pid]], meta["lon"][old_row[pid]]) != loaded[pid][1:]]
+    renamed = any(pid in old_row and meta["names"][old_row[pid]] != loaded[pid][0] for pid in ids)
+    if not (added or moved or deleted or renamed):
+        return {"rows": len(meta["ids"]), "added": 0, "moved": 0, "deleted": 0}
+
+    kept = [pid for pid in meta["ids"] if pid not in deleted]
+    new_ids = kept + added
+    row = {pid: r for r, pid in enumerate(new_ids)}
+    n = len(new_ids)
+
+    def field(pid, position, name):
+        return loaded[pid][position] if pid in loaded else meta[name][old_row[pid]]
+
+    all_lat = np.array([field(pid, 1, "lat") for pid in new_ids], dtype=np.float64)
+    all_lon = np.array([field(pid, 2, "lon") for pid in new_ids], dtype=np.float64)
+    all_names = [field(pid, 0, "names") for pid in new_ids]
+
+    # Old row numbers -> new ones; the extra last slot maps -1 to -1
+    renumber = np.full(len(meta["ids"]) + 1, -1, dtype=np.int32)
+    for pid, r in old_row.items():
+        renumber[r] = row.get(pid, -1)
+    old = np.load(os.path.join(directory, meta["matrix"]))
+    gone = np.array([old_row[pid] for pid in moved + sorted(deleted)], dtype=np.int32)
+
+    dirty = np.array([row[pid] for pid in moved + added], dtype=np.int32)
+    kept_old = np.array([old_row[pid] for pid in kept], dtype=np.int32)
+    stale = np.zeros(n, dtype=bool)
+    stale[dirty] = True
+    stale[:len(kept)] |= np.isin(old["row"][kept_old], gone).any(axis=1)
+
+    matrix = np.empty((n, k), dtype=NEIGHBOUR_DTYPE)
+    all_rows = np.arange(n, dtype=np.int32)
+
+    # Untouched rows: merge their current list with distances to moved and new pandals
+    merge = all_rows[~stale]
+    for start in range(0, len(merge), CHUNK_ROWS):
+        rows = merge[start:start + CHUNK_ROWS]
+        to_dirty = haversine_matrix(all_lat[rows], all_lon[rows], all_lat[dirty], all_lon[dirty])
+        previous = old[kept_old[rows]]
+        candidates = np.concatenate(
+            [renumber[previous["row"]], np.broadcast_to(dirty, to_dirty.shape)], axis=1)
+        dist = np.concatenate([previous["km"].astype(np.float64), to_dirty], axis=1)
+        dist[candidates < 0] = np.inf
+        matrix[rows] = _nearest(candidates, dist, k)
+
+    # Stale rows: full search against everything
+    redo = all_rows[stale]
+    for start in range(0, len(redo), CHUNK_ROWS):
+        rows = redo[start:start + CHUNK_ROWS]
+        dist = haversine_matrix(all_lat[rows], all_lon[rows], all_lat, all_lon)
+        dist[np.arange(len(rows)), rows] = np.inf
+        matrix[rows] = _nearest(np.broadcast_to(all_rows, dist.shape), dist, k)
+
+    write_generation(directory, {
+        "k": k,
+        "ids": new_ids,
+        "names": all_names,
+        "lat": all_lat.tolist(),
+        "lon": all_lon.tolist(),
+    }, matrix)
+    return {"rows": n, "added": len(added), "moved": len(moved), "deleted": len(deleted)}
+
+
+class NeighbourIndex:
+    """Read-only view of the neighbour table, shared via mmap across workers"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._mtime = None
+        self._matrix = None
+        self._meta = None
+        self._rows = {}
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(os.path.join(self.directory, INDEX_FILE)).st_mtime_ns
+        except OSError:
+            return False
+        if mtime != self._mtime:
+            meta = read_index(self.directory)
+            if meta is None:
+                return False
+            try:
+                matrix = np.load(os.path.join(self.directory, meta["matrix"]), mmap_mode="r")
+            except OSError:
+                return False
+            self._meta = meta
+            self._matrix = matrix
+            self._rows = {pid: i for i, pid in enumerate(meta["ids"])}
+            self._mtime = mtime
+        return True
+
+    def nearby(self, pandal_id, limit=None):
+        """Return [{"id", "name", "distance"}] for the closest pandals"""
+        if not self._refresh():
+            return []
+        row = self._rows.get(str(pandal_id))
+        if row is None:
+            return []
+        entries = self._matrix[row, :limit]
+        results = []
+        for neighbour, km in zip(entries["row"].tolist(), entries["km"].tolist()):
+            if neighbour < 0:
+                break
+            results.append({
+                "id": self._meta["ids"][neighbour],
+                "name": self._meta["names"][neighbour],
+                "distance": round(km, 2),
+            })
+        return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import pymongo
+    import config
+
+    parser = argparse.ArgumentParser(description="Rebuild the pandal neighbour table")
+    parser.add_argument("--full", action="store_true", help="rebuild from scratch")
+    parser.add_argument("-k", type=int, default=DEFAULT_K, help="neighbours per pandal")
+    parser.add_argument("--dir", default=getattr(config, "NEIGHBOUR_DIR", "instance/neighbours"))
+    args = parser.parse_args()
+
+    db = pymongo.MongoClient(config.MONGO_URI).utsavdarshan
+    if args.full:
+        result = build_neighbours(db.pandals, args.dir, args.k)
+    else:
+        result = update_neighbours(db.pandals, args.dir, args.k)
+    print(f"Neighbour table has {result['rows']} pandals "
+          f"({result['added']} added, {result['moved']} moved, {result['deleted']} deleted)")
@@ -0,0 +1,98 @@
+"""Opening hours as minutes since midnight.
+
+Pandals store "HH:MM" strings. On write we also store
+
+  open_minutes   0..1439
+  close_minutes  open_minutes < close_minutes <= open_minutes + 1440
+
+so a closing time past midnight ("06:00" - "02:00") becomes 360 - 1560.
+With a compound index on both fields, "open at T" is a pure range query
+and no document's strings need to be parsed at read time.
+
+Times are local to the pandals, so "now" is taken in TIMEZONE rather
+than in the server's zone (often UTC).
+"""
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+MINUTES_PER_DAY = 24 * 60
+TIMEZONE = ZoneInfo("Asia/Kolkata")
+
+
+def parse_hhmm(value):
+    """Convert "HH:MM" to minutes since midnight, or None if malformed"""
+    try:
+        hours, minutes = value.strip().split(":")
+        hours, minutes = int(hours), int(minutes)
+    except (AttributeError, ValueError):
+        return None
+    if not (0 <= hours <= 24 and 0 <= minutes < 60) or hours * 60 + minutes > MINUTES_PER_DAY:
+        return None
+    return (hours * 60 + minutes) % MINUTES_PER_DAY
+
+
+def hours_fields(opening_time, closing_time):
+    """Normalized fields to $set alongside opening_time/closing_time"""
+    opens = parse_hhmm(opening_time)
+    closes = parse_hhmm(closing_time)
+    if opens is None or closes is None:
+        return {}
+    if closes <= opens:
+        # Closes after midnight, or equal times meaning open round the clock
+        closes += MINUTES_PER_DAY
+    return {"open_minutes": opens, "close_minutes": closes}
+
+
+def hours_update(changes, current=None):
+    """($set, $unset) that keep the minutes in step with a write of `changes`.
+
+    `current` is the stored pandal, for whichever time is not being written.
+    Both are empty when neither time is; times that no longer parse drop
+    the minutes rather than leave stale ones behind.
+    """
+    if "opening_time" not in changes and "closing_time" not in changes:
+        return {}, {}
+    current = current or {}
+    fields = hours_fields(changes.get("opening_time", current.get("opening_time")),
+                          changes.get("closing_time", current.get("closing_time")))
+    if fields:
+        return fields, {}
+    return {}, {"open_minutes": "", "close_minutes": ""}
+
+
+def parse_open_at(value):
+    """Parse an `open_at` query argument ("HH:MM" or "now").
+
+    Returns None when the argument is absent and raises ValueError when it
+    cannot be understood.
+    """
+    if not value:
+        return None
+    if value.strip().lower() == "now":
+        now = datetime.now(TIMEZONE)
+        return now.hour * 60 + now.minute
+    minute = parse_hhmm(value)
+    if minute is None:
+        raise ValueError("open_at must be HH:MM or 'now'")
+    return minute
+
+
+def open_at_filter(minute):
+    """Mongo filter matching pandals open at `minute` since midnight"""
+    return {"$or": [
+        {"open_minutes": {"$lte": minute}, "close_minutes": {"$gt": minute}},
+        # Still open from the previous day's past-midnight session
+        {"close_minutes": {"$gt": minute + MINUTES_PER_DAY}},
+    ]}
+
+
+def backfill_opening_hours(collection):
+    """Store normalized fields on pandals written before they existed"""
+    updated = 0
+    for p in collection.find({"open_minutes": {"$exists": False}},
+                             {"opening_time": 1, "closing_time": 1}):
+        fields = hours_fields(p.get("opening_time"), p.get("closing_time"))
+        if fields:
+            collection.update_one({"_id": p["_id"]}, {"$set": fields})
+            updated += 1
+    return {"updated": updated}
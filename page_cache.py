@@ -0,0 +1,302 @@
+"""Rendered page and fragment cache with tag-based invalidation.
+
+Each entry is stored with a list of dependency tags, for example
+["pandals", "area:Lalbaug", "pandal:<id>"]. Writes call invalidate() with
+the tags of the pandal that changed and every entry carrying one of
+those tags is dropped.
+
+Two backends are available:
+
+  LRUBackend    in-process, bounded
+  RedisBackend  a local Redis-compatible server shared by all workers
+
+With the LRU backend each worker has its own copy of a page, so
+invalidate() also records the tags in a Mongo collection
+(page_cache_invalidations). Before reading from its LRU a worker applies
+what other workers recorded, at most every PAGE_CACHE_SYNC_SECONDS, so a
+page edited in one worker is stale in the others for about that long
+rather than for the whole TTL.
+
+Values are plain strings (rendered HTML). Pages and fragments (pandal
+cards) are kept in separate PageCache instances, configured with
+PAGE_CACHE_* and FRAGMENT_CACHE_* settings, so one cannot evict the other.
+"""
+import datetime
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request
+from flask_login import current_user
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+DEFAULT_TTL = 300
+DEFAULT_MAXSIZE = 2048
+DEFAULT_FRAGMENT_MAXSIZE = 8192
+DEFAULT_SYNC_SECONDS = 1
+# Records written this long before the last sync are looked at again, in
+# case their insert had not committed when that sync ran
+SYNC_SLACK = datetime.timedelta(seconds=10)
+
+
+class LRUBackend:
+    def __init__(self, maxsize=DEFAULT_MAXSIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # key -> (value, tags, expires_at)
+        self._tags = {}  # tag -> set of keys
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] < time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, tags=(), ttl=DEFAULT_TTL):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, tuple(tags), time.monotonic() + ttl)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, tags):
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def _drop(self, key):
+        value, tags, _ = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+class RedisBackend:
+    """Entries live under page:<key>, tag membership in sets under tag:<tag>"""
+
+    def __init__(self, url, prefix="utsav:"):
+        # prefix keeps caches sharing one server apart
+        if redis is None:
+            raise RuntimeError("The redis package is required for a Redis page cache")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + "page:" + key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key, value, tags=(), ttl=DEFAULT_TTL):
+        page_key = self.prefix + "page:" + key
+        pipe = self.client.pipeline()
+        pipe.set(page_key, value.encode("utf-8"), ex=ttl)
+        for tag in tags:
+            pipe.sadd(self.prefix + "tag:" + tag, page_key)
+            pipe.expire(self.prefix + "tag:" + tag, ttl)
+        pipe.execute()
+
+    def invalidate(self, tags):
+        for tag in tags:
+            tag_key = self.prefix + "tag:" + tag
+            keys = self.client.smembers(tag_key)
+            pipe = self.client.pipeline()
+            if keys:
+                pipe.delete(*keys)
+            pipe.delete(tag_key)
+            pipe.execute()
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+class Broadcast:
+    """Invalidations shared between workers through a Mongo collection"""
+
+    def __init__(self, collection, interval=DEFAULT_SYNC_SECONDS):
+        self.collection = collection
+        self.interval = interval
+        self._next_sync = 0
+        self._synced_at = datetime.datetime.utcnow()
+        self._applied = {}  # record id -> its "at", for records inside the slack window
+        self._lock = threading.Lock()
+
+    def publish(self, tags):
+        record = self.collection.insert_one({"tags": list(tags), "at": datetime.datetime.utcnow()})
+        with self._lock:
+            self._applied[record.inserted_id] = datetime.datetime.utcnow()
+
+    def sync(self, backend):
+        """Apply other workers' invalidations to `backend` if it is time to look"""
+        if time.monotonic() < self._next_sync or not self._lock.acquire(blocking=False):
+            return
+        try:
+            started = datetime.datetime.utcnow()
+            for record in self.collection.find({"at": {"$gte": self._synced_at - SYNC_SLACK}}):
+                if record["_id"] not in self._applied:
+                    backend.invalidate(record["tags"])
+                    self._applied[record["_id"]] = record["at"]
+            cutoff = started - 2 * SYNC_SLACK
+            self._applied = {key: at for key, at in self._applied.items() if at >= cutoff}
+            self._synced_at = started
+            self._next_sync = time.monotonic() + self.interval
+        finally:
+            self._lock.release()
+
+
+class PageCache:
+    def __init__(self, url=None, ttl=DEFAULT_TTL, maxsize=DEFAULT_MAXSIZE, name="PAGE"):
+        self.name = name
+        self.default_maxsize = maxsize
+        self.configure(url, ttl, maxsize)
+
+    def configure(self, url=None, ttl=DEFAULT_TTL, maxsize=DEFAULT_MAXSIZE, broadcast=None):
+        """`broadcast` (a Broadcast) is only used with the LRU backend"""
+        self.ttl = ttl
+        if url and url.startswith(("redis://", "rediss://", "unix://")):
+            self.backend = RedisBackend(url, "utsav:" if self.name == "PAGE" else f"utsav:{self.name.lower()}:")
+            self.broadcast = None
+        else:
+            self.backend = LRUBackend(maxsize)
+            self.broadcast = broadcast
+
+    def init_app(self, app, collection=None):
+        """Pick the backend from <name>_CACHE_URL, _TTL and _SIZE (PAGE_CACHE_URL, ...).
+
+        Without Redis, invalidations are shared through `collection` every
+        <name>_CACHE_SYNC_SECONDS (0 turns that off, for a single worker).
+        A FRAGMENT cache without its own URL uses PAGE_CACHE_URL.
+        """
+        prefix = self.name + "_CACHE_"
+        interval = app.config.get(prefix + "SYNC_SECONDS", DEFAULT_SYNC_SECONDS)
+        self.configure(
+            app.config.get(prefix + "URL", app.config.get("PAGE_CACHE_URL")),
+            app.config.get(prefix + "TTL", DEFAULT_TTL),
+            app.config.get(prefix + "SIZE", self.default_maxsize),
+            Broadcast(collection, interval) if collection is not None and interval else None,
+        )
+
+    def get(self, key):
+        try:
+            if self.broadcast is not None:
+                self.broadcast.sync(self.backend)
+            return self.backend.get(key)
+        except Exception as e:
+            print(f"Failed to read page cache: {str(e)}")
+            return None
+
+    def set(self, key, value, tags=()):
+        try:
+            self.backend.set(key, value, tags, self.ttl)
+        except Exception as e:
+            print(f"Failed to store page in cache: {str(e)}")
+
+    def invalidate(self, tags):
+        tags = list(tags)
+        try:
+            self.backend.invalidate(tags)
+            if self.broadcast is not None and tags:
+                self.broadcast.publish(tags)
+        except Exception as e:
+            print(f"Failed to invalidate page cache: {str(e)}")
+
+    def cached(self, tags, vary_user=False):
+        """Cache a view's rendered HTML.
+
+        `tags` receives the view's keyword arguments and returns the
+        dependency tags for the page. Views returning anything other than
+        a string (redirects, errors) are never cached.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                key = "view:" + request.full_path
+                if vary_user:
+                    user_id = current_user.get_id() if current_user.is_authenticated else ""
+                    key += "|user:" + user_id
+                body = self.get(key)
+                if body is not None:
+                    return body
+
+                body = view(**kwargs)
+                if isinstance(body, str):
+                    self.set(key, body, tags(**kwargs))
+                return body
+            return wrapper
+        return decorator
+
+
+class FragmentStats:
+    """Per-process fragment hit rate and render timings for one page"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.hits = 0
+        self.misses = 0
+        self.fragment_seconds = 0.0
+        self.pages = 0
+        self.page_seconds = 0.0
+        self.last_page_seconds = 0.0
+
+    def hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def miss(self, render_seconds):
+        with self._lock:
+            self.misses += 1
+            self.fragment_seconds += render_seconds
+
+    def page(self, seconds):
+        with self._lock:
+            self.pages += 1
+            self.page_seconds += seconds
+            self.last_page_seconds = seconds
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "fragment_render_ms_avg": round(1000 * self.fragment_seconds / self.misses, 3) if self.misses else None,
+                "pages": self.pages,
+                "page_render_ms_avg": round(1000 * self.page_seconds / self.pages, 3) if self.pages else None,
+                "last_page_render_ms": round(1000 * self.last_page_seconds, 3),
+            }
+
+
+def pandal_tags(pandal):
+    """Dependency tags touched by inserting or updating `pandal`"""
+    tags = ["pandals"]
+    if pandal.get("area"):
+        tags.append(f"area:{pandal['area']}")
+    if pandal.get("_id") is not None:
+        tags.append(f"pandal:{pandal['_id']}")
+    return tags
@@ -0,0 +1,185 @@
+"""On-demand sampling profiler for single requests.
+
+An admin (see admin.py) adds an `X-Profile: 1` header or `?__profile=1`
+to a request. The before_request hook notes the thread serving it, and
+a background thread samples that thread's stack (from
+sys._current_frames()) every PROFILE_INTERVAL seconds until the response
+is ready. Requests served at the same time on other threads stay out of
+the profile.
+
+Views do their work on the request thread (see app.run_upstream), so
+that is where Mongo, CPU and rendering time shows up. Upstream HTTP calls
+are awaited elsewhere, on the server's event loop or a helper thread, and
+appear as time the request thread spends waiting in run_upstream; what
+other threads do meanwhile is not sampled.
+
+Each profile is written to PROFILE_DIR as
+
+  <id>.collapsed  one "frame;frame;frame count" line per stack, ready for
+                  flamegraph.pl or speedscope
+  <id>.json       route, duration, sample count and the top functions
+
+Only the newest PROFILE_KEEP profiles are kept. /admin/profiles lists
+them.
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import abort, current_app, g, render_template, request, send_from_directory
+
+from admin import admin_required, is_admin
+
+DEFAULT_INTERVAL = 0.005
+DEFAULT_KEEP = 50
+TOP_FUNCTIONS = 25
+
+
+def _label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame):
+    stack = []
+    while frame is not None:
+        stack.append(_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+class Sampler(threading.Thread):
+    def __init__(self, target_thread_id, interval=DEFAULT_INTERVAL):
+        super().__init__(daemon=True)
+        self.target = target_thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            if frame is not None:
+                self.samples[_collapse(frame)] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def summarize(samples):
+    """Top functions by self (leaf) and total (anywhere on stack) samples"""
+    self_counts = Counter()
+    total_counts = Counter()
+    for stack, count in samples.items():
+        frames = stack.split(";")
+        self_counts[frames[-1]] += count
+        for name in set(frames):
+            total_counts[name] += count
+    return [
+        {"function": name, "self": self_counts[name], "total": total_counts[name]}
+        for name, _ in sorted(total_counts.items(),
+                              key=lambda item: (self_counts[item[0]], item[1]),
+                              reverse=True)[:TOP_FUNCTIONS]
+    ]
+
+
+def _profile_dir():
+    return current_app.config.setdefault(
+        "PROFILE_DIR", os.path.join(current_app.root_path, "instance", "profiles"))
+
+
+def _wanted():
+    return request.headers.get("X-Profile") == "1" or request.args.get("__profile") == "1"
+
+
+def _start():
+    if _wanted() and is_admin():
+        # The thread running this hook is the one serving the request
+        sampler = Sampler(threading.get_ident(), current_app.config.get("PROFILE_INTERVAL", DEFAULT_INTERVAL))
+        g.profiler = (sampler, time.perf_counter())
+        sampler.start()
+
+
+def _finish(response):
+    profile = g.pop("profiler", None)
+    if profile is None:
+        return response
+    sampler, started = profile
+    sampler.stop()
+    duration = time.perf_counter() - started
+
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", request.path).strip("-") or "root"
+    profile_id = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}-{slug[:60]}"
+    directory = _profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, profile_id + ".collapsed"), "w") as f:
+        for stack, count in sampler.samples.most_common():
+            f.write(f"{stack} {count}\n")
+    with open(os.path.join(directory, profile_id + ".json"), "w") as f:
+        json.dump({
+            "id": profile_id,
+            "method": request.method,
+            "path": request.full_path,
+            "status": response.status_code,
+            "duration_ms": round(duration * 1000, 2),
+            "samples": sum(sampler.samples.values()),
+            "interval_ms": sampler.interval * 1000,
+            "top": summarize(sampler.samples),
+        }, f, indent=2)
+    _prune(directory, current_app.config.get("PROFILE_KEEP", DEFAULT_KEEP))
+
+    response.headers["X-Profile-Id"] = profile_id
+    return response
+
+
+def _abandon(exc):
+    profile = g.pop("profiler", None)
+    if profile is not None:
+        profile[0].stop()
+
+
+def _prune(directory, keep):
+    ids = sorted(name[:-5] for name in os.listdir(directory) if name.endswith(".json"))
+    for profile_id in ids[:-keep] if keep else ids:
+        for suffix in (".json", ".collapsed"):
+            try:
+                os.remove(os.path.join(directory, profile_id + suffix))
+            except OSError:
+                pass
+
+
+def recent_profiles():
+    directory = _profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if name.endswith(".json"):
+            with open(os.path.join(directory, name)) as f:
+                profiles.append(json.load(f))
+    return profiles
+
+
+@admin_required
+def profiles_index():
+    return render_template("profiles.html", profiles=recent_profiles())
+
+
+@admin_required
+def profile_file(filename):
+    if not filename.endswith((".json", ".collapsed")) or "/" in filename:
+        abort(404)
+    return send_from_directory(_profile_dir(), filename, mimetype="text/plain")
+
+
+def init_app(app):
+    app.before_request(_start)
+    app.after_request(_finish)
+    app.teardown_request(_abandon)
+    app.add_url_rule("/admin/profiles", "profiles_index", profiles_index)
+    app.add_url_rule("/admin/profiles/<filename>", "profile_file", profile_file)
@@ -0,0 +1,185 @@
+"""Item-item collaborative filtering from visits and ratings.
+
+An offline job that builds a sparse user x pandal matrix. A visit counts
+as 1.0 and a rating as rating / 2.5, so a 5-star rating weighs 2.0 and a
+1-star 0.4. When a user both visited and rated a pandal, the larger
+weight is kept. Columns are L2-normalised and item-item cosine similarity
+is computed a block of pandals at a time, keeping only each pandal's
+NEIGHBOURS best matches. Each active user's scores are then their row
+times that sparse neighbour matrix, again in blocks, with pandals they
+already know removed. The top N go into the `recommendations` collection.
+
+Dense intermediates are capped at MAX_BLOCK_CELLS, so memory grows with
+the number of interactions and not with users x pandals. Serving is a
+single find_one by user id.
+"""
+from array import array
+from datetime import datetime, timedelta
+
+import numpy as np
+from pymongo import ReplaceOne
+from scipy import sparse
+
+DEFAULT_NEIGHBOURS = 50
+DEFAULT_TOP_N = 20
+DEFAULT_ACTIVE_DAYS = 180
+VISIT_WEIGHT = 1.0
+RATING_SCALE = 2.5
+MAX_BLOCK_CELLS = 8_000_000
+WRITE_BATCH = 1000
+READ_BATCH = 10000
+
+
+class _Interactions:
+    def __init__(self, since):
+        self.since = since
+        self.users = {}
+        self.items = {}
+        self.active = set()
+        self.rows = array("i")
+        self.cols = array("i")
+        self.weights = array("f")
+
+    def add(self, user_id, pandal_id, weight, when):
+        if user_id is None or pandal_id is None or weight <= 0:
+            return
+        row = self.users.setdefault(str(user_id), len(self.users))
+        self.rows.append(row)
+        self.cols.append(self.items.setdefault(str(pandal_id), len(self.items)))
+        self.weights.append(weight)
+        if when is None or when >= self.since:
+            self.active.add(row)
+
+    def matrix(self):
+        """users x items CSR matrix, keeping the max weight per pair"""
+        shape = (len(self.users), len(self.items))
+        rows = np.frombuffer(self.rows, dtype=np.int32)
+        cols = np.frombuffer(self.cols, dtype=np.int32)
+        weights = np.frombuffer(self.weights, dtype=np.float32)
+        keys, inverse = np.unique(rows.astype(np.int64) * shape[1] + cols, return_inverse=True)
+        best = np.zeros(len(keys), dtype=np.float32)
+        np.maximum.at(best, inverse, weights)
+        return sparse.csr_matrix((best, (keys // shape[1], keys % shape[1])), shape=shape)
+
+
+def load_interactions(visits, ratings, active_days=DEFAULT_ACTIVE_DAYS):
+    data = _Interactions(datetime.utcnow() - timedelta(days=active_days))
+    for v in visits.find({}, {"user_id": 1, "pandal_id": 1, "visited_at": 1}).batch_size(READ_BATCH):
+        data.add(v.get("user_id"), v.get("pandal_id"), VISIT_WEIGHT, v.get("visited_at"))
+    for r in ratings.find({"rating": {"$ne": None}},
+                          {"user_id": 1, "pandal_id": 1, "rating": 1, "created_at": 1}).batch_size(READ_BATCH):
+        try:
+            weight = float(r["rating"]) / RATING_SCALE
+        except (TypeError, ValueError):
+            continue
+        data.add(r.get("user_id"), r.get("pandal_id"), weight, r.get("created_at"))
+    return data
+
+
+def _block_size(width):
+    return max(1, MAX_BLOCK_CELLS // max(width, 1))
+
+
+def _top_columns(dense, n):
+    """Column indices and values of the n largest positive entries per row"""
+    take = min(n, dense.shape[1])
+    part = np.argpartition(-dense, take - 1, axis=1)[:, :take]
+    values = np.take_along_axis(dense, part, axis=1)
+    order = np.argsort(-values, axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(values, order, axis=1)
+
+
+def item_neighbours(matrix, neighbours=DEFAULT_NEIGHBOURS):
+    """Sparse items x items matrix of each item's top cosine neighbours"""
+    n_items = matrix.shape[1]
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    scale = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    normalised = (matrix @ sparse.diags(scale.astype(np.float32))).tocsc()
+    by_item = normalised.T.tocsr()
+
+    rows, cols, values = [], [], []
+    block = _block_size(n_items)
+    for start in range(0, n_items, block):
+        stop = min(start + block, n_items)
+        sims = (by_item[start:stop] @ normalised).toarray()
+        sims[np.arange(stop - start), np.arange(start, stop)] = 0
+        top, top_values = _top_columns(sims, neighbours)
+        keep = top_values > 0
+        rows.append(np.broadcast_to(np.arange(start, stop)[:, None], top.shape)[keep])
+        cols.append(top[keep])
+        values.append(top_values[keep])
+    if not rows:
+        return sparse.csr_matrix((n_items, n_items), dtype=np.float32)
+    return sparse.csr_matrix(
+        (np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(n_items, n_items), dtype=np.float32)
+
+
+def recommend(matrix, similarity, users, top_n=DEFAULT_TOP_N):
+    """Yield (row, [(item, score)]) for each row index in `users`"""
+    block = _block_size(matrix.shape[1])
+    for start in range(0, len(users), block):
+        rows = users[start:start + block]
+        known = matrix[rows]
+        scores = (known @ similarity).toarray()
+        seen_rows, seen_cols = known.nonzero()
+        scores[seen_rows, seen_cols] = 0
+        top, top_values = _top_columns(scores, top_n)
+        for i, row in enumerate(rows):
+            yield row, [(int(c), float(v)) for c, v in zip(top[i], top_values[i]) if v > 0]
+
+
+def build_recommendations(db, neighbours=DEFAULT_NEIGHBOURS, top_n=DEFAULT_TOP_N,
+                          active_days=DEFAULT_ACTIVE_DAYS):
+    """Recompute and store recommendations for every active user"""
+    data = load_interactions(db.visits, db.ratings, active_days)
+    if not data.users or not data.items:
+        return {"users": 0, "pandals": 0, "interactions": 0, "written": 0}
+    matrix = data.matrix()
+    similarity = item_neighbours(matrix, neighbours)
+
+    user_ids = list(data.users)
+    item_ids = list(data.items)
+    names = {}
+    for p in db.pandals.find({}, {"name": 1}).batch_size(READ_BATCH):
+        names[str(p["_id"])] = p.get("name")
+
+    generation = datetime.utcnow()
+    written = 0
+    batch = []
+    for row, items in recommend(matrix, similarity, np.array(sorted(data.active), dtype=np.int64), top_n):
+        if not items:
+            continue
+        batch.append(ReplaceOne({"_id": user_ids[row]}, {
+            "generated_at": generation,
+            "items": [{"pandal_id": item_ids[c], "name": names.get(item_ids[c]), "score": round(s, 4)}
+                      for c, s in items],
+        }, upsert=True))
+        written += 1
+        if len(batch) >= WRITE_BATCH:
+            db.recommendations.bulk_write(batch, ordered=False)
+            batch = []
+    if batch:
+        db.recommendations.bulk_write(batch, ordered=False)
+    # Users who are no longer active keep no stale recommendations
+    db.recommendations.delete_many({"generated_at": {"$ne": generation}})
+    return {"users": len(user_ids), "pandals": len(item_ids), "interactions": matrix.nnz, "written": written}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import pymongo
+    import config
+
+    parser = argparse.ArgumentParser(description="Rebuild per-user pandal recommendations")
+    parser.add_argument("--neighbours", type=int, default=DEFAULT_NEIGHBOURS, help="neighbours kept per pandal")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP_N, help="recommendations per user")
+    parser.add_argument("--active-days", type=int, default=DEFAULT_ACTIVE_DAYS,
+                        help="only users with activity in this many days")
+    args = parser.parse_args()
+
+    db = pymongo.MongoClient(config.MONGO_URI).utsavdarshan
+    result = build_recommendations(db, args.neighbours, args.top, args.active_days)
+    print(f"Wrote recommendations for {result['written']} users "
+          f"({result['users']} users, {result['pandals']} pandals, {result['interactions']} interactions)")
@@ -0,0 +1,86 @@
+"""Paged ratings feed and per-pandal rating summary.
+
+Ratings are read newest first, ordered by (created_at, _id) descending,
+which the (pandal_id, created_at, _id) index serves directly. A page
+cursor is the sort key of the last rating returned, so fetching any page
+costs one index seek plus `limit` documents however many ratings the
+pandal has. Ratings without created_at sort after all dated ones.
+"""
+import base64
+import json
+from datetime import datetime, timedelta
+
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+SORT = [("created_at", -1), ("_id", -1)]
+INDEX = [("pandal_id", 1), ("created_at", -1), ("_id", -1)]
+_EPOCH = datetime(1970, 1, 1)
+
+
+def encode_cursor(rating):
+    created = rating.get("created_at")
+    millis = None if created is None else int((created.replace(tzinfo=None) - _EPOCH) / timedelta(milliseconds=1))
+    raw = json.dumps([millis, str(rating["_id"])]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for a malformed cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        millis, rating_id = json.loads(raw)
+        created = None if millis is None else _EPOCH + timedelta(milliseconds=int(millis))
+        return created, ObjectId(rating_id)
+    except (ValueError, TypeError, InvalidId):
+        raise ValueError("Invalid cursor")
+
+
+def page_filter(pandal_id, cursor=None):
+    query = {"pandal_id": pandal_id}
+    if cursor:
+        created, rating_id = decode_cursor(cursor)
+        if created is None:
+            query.update({"created_at": None, "_id": {"$lt": rating_id}})
+        else:
+            query["$or"] = [
+                {"created_at": {"$lt": created}},
+                {"created_at": created, "_id": {"$lt": rating_id}},
+                {"created_at": None},
+            ]
+    return query
+
+
+def rating_page(collection, pandal_id, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """Return (ratings, next_cursor); next_cursor is None on the last page"""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    page = list(collection.find(page_filter(pandal_id, cursor)).sort(SORT).limit(limit + 1))
+    next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+    return page[:limit], next_cursor
+
+
+def rating_summary(collection, pandal_id):
+    """Star histogram, count and average from one aggregation"""
+    histogram = {str(star): 0 for star in range(1, 6)}
+    count = 0
+    total = 0.0
+    for bucket in collection.aggregate([
+        {"$match": {"pandal_id": pandal_id}},
+        {"$group": {
+            "_id": {"$round": [{"$toDouble": "$rating"}, 0]},
+            "count": {"$sum": 1},
+            "total": {"$sum": {"$toDouble": "$rating"}},
+        }},
+    ]):
+        if bucket["_id"] is None:
+            continue
+        histogram[str(int(bucket["_id"]))] = bucket["count"]
+        count += bucket["count"]
+        total += bucket["total"]
+    return {
+        "count": count,
+        "average": round(total / count, 2) if count else None,
+        "histogram": histogram,
+    }
@@ -0,0 +1,425 @@
+"""Local road router answering OSRM /route/v1 queries.
+
+`python router.py extract.osm instance/roads.npz` turns an OpenStreetMap
+XML extract (.osm, .osm.gz or .osm.bz2; convert .pbf files with osmium
+first) into a compact graph file:
+
+  lat, lon                      node coordinates (float64)
+  offsets, targets              CSR adjacency, outgoing edges per node
+  seconds, metres               edge travel time and length (float32)
+  landmark_from, landmark_to    ALT tables, travel time from/to each landmark
+
+Only the largest strongly connected part of the network is kept, so
+every pair of snapped points has a route. Edge times come from maxspeed
+or a default speed per highway type.
+
+Point-to-point routes use A* with landmark lower bounds (ALT). The
+nearby-pandal durations run a single Dijkstra from the user until every
+pandal is reached. Query points snap to the nearest graph node, not the
+nearest point on a road, so short routes can differ slightly from OSRM.
+
+Set ROAD_GRAPH to the graph file and the app serves
+/route/v1/<profile>/<lon,lat;lon,lat...> in OSRM's response format.
+"""
+import bz2
+import gzip
+import heapq
+import math
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+DEFAULT_LANDMARKS = 8
+# Landmarks used per query, picked by their bound at the source
+ACTIVE_LANDMARKS = 4
+DEFAULT_SNAP_RADIUS_M = 1000
+EARTH_RADIUS_M = 6371008.8
+MIN_EDGE_SECONDS = 0.01
+
+# km/h for ways without a usable maxspeed
+SPEEDS = {
+    "motorway": 90, "motorway_link": 45,
+    "trunk": 70, "trunk_link": 40,
+    "primary": 50, "primary_link": 30,
+    "secondary": 40, "secondary_link": 25,
+    "tertiary": 30, "tertiary_link": 20,
+    "unclassified": 25, "residential": 20, "road": 20,
+    "living_street": 10, "service": 15,
+}
+IMPLIED_ONEWAY = {"motorway", "motorway_link"}
+GRAPH_ARRAYS = ("lat", "lon", "offsets", "targets", "seconds", "metres",
+                "landmark_from", "landmark_to")
+
+
+def _open(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    return open(path, "rb")
+
+
+def _drivable(tags):
+    return (tags.get("highway") in SPEEDS
+            and tags.get("access") not in ("no", "private")
+            and tags.get("motor_vehicle") not in ("no", "private")
+            and tags.get("area") != "yes")
+
+
+def _speed(tags):
+    value = tags.get("maxspeed", "").strip()
+    try:
+        speed = float(value[:-3]) * 1.609 if value.endswith("mph") else float(value)
+    except ValueError:
+        speed = 0
+    return speed if speed > 0 else SPEEDS[tags["highway"]]
+
+
+def read_osm(path):
+    """Node coordinates and drivable ways of an OSM XML extract"""
+    coords = {}
+    ways = []
+    tags = {}
+    refs = []
+    with _open(path) as f:
+        context = ET.iterparse(f, events=("start", "end"))
+        _, root = next(context)
+        for event, elem in context:
+            if event != "end":
+                continue
+            if elem.tag == "tag":
+                tags[elem.get("k")] = elem.get("v")
+            elif elem.tag == "nd":
+                refs.append(int(elem.get("ref")))
+            elif elem.tag in ("node", "way", "relation"):
+                if elem.tag == "node":
+                    coords[int(elem.get("id"))] = (float(elem.get("lat")), float(elem.get("lon")))
+                elif elem.tag == "way" and _drivable(tags):
+                    ways.append((refs, tags))
+                tags = {}
+                refs = []
+                root.clear()
+    return coords, ways
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres; works on scalars or numpy arrays"""
+    lat1, lon1, lat2, lon2 = (np.radians(v) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def graph_from_osm(coords, ways, landmarks=DEFAULT_LANDMARKS):
+    index = {}
+    sources, targets, speeds = [], [], []
+    for refs, tags in ways:
+        refs = [r for r in refs if r in coords]
+        oneway = tags.get("oneway", "")
+        if oneway == "-1":
+            refs.reverse()
+        forward_only = oneway in ("yes", "1", "true", "-1") or (
+            oneway != "no" and (tags["highway"] in IMPLIED_ONEWAY
+                                or tags.get("junction") in ("roundabout", "circular")))
+        speed = _speed(tags)
+        nodes = [index.setdefault(r, len(index)) for r in refs]
+        for a, b in zip(nodes, nodes[1:]):
+            if a == b:
+                continue
+            sources.append(a)
+            targets.append(b)
+            speeds.append(speed)
+            if not forward_only:
+                sources.append(b)
+                targets.append(a)
+                speeds.append(speed)
+    if not sources:
+        raise ValueError("No drivable roads in the extract")
+
+    lat = np.array([coords[r][0] for r in index])
+    lon = np.array([coords[r][1] for r in index])
+    sources = np.array(sources, dtype=np.int64)
+    targets = np.array(targets, dtype=np.int64)
+    metres = haversine(lat[sources], lon[sources], lat[targets], lon[targets])
+    seconds = metres / (np.array(speeds) / 3.6)
+    return RoadGraph.from_edges(lat, lon, sources, targets, metres, seconds, landmarks)
+
+
+def encode_polyline(coordinates, precision=5):
+    """Google encoded polyline of [lon, lat] pairs, as OSRM returns by default"""
+    factor = 10 ** precision
+    chunks = []
+    previous = (0, 0)
+    for lon, lat in coordinates:
+        point = (round(lat * factor), round(lon * factor))
+        for delta in (point[0] - previous[0], point[1] - previous[1]):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+        previous = point
+    return "".join(chunks)
+
+
+def parse_coordinates(text):
+    """'lon,lat;lon,lat;...' from an OSRM URL as a list of (lon, lat)"""
+    points = []
+    for pair in text.split(";"):
+        try:
+            lon, lat = (float(v) for v in pair.split(","))
+        except ValueError:
+            raise ValueError(f"Invalid coordinate {pair!r}")
+        if not (-180 <= lon <= 180 and -90 <= lat <= 90):
+            raise ValueError(f"Coordinate out of range {pair!r}")
+        points.append((lon, lat))
+    if len(points) < 2:
+        raise ValueError("At least two coordinates are required")
+    return points
+
+
+class RoadGraph:
+    def __init__(self, lat, lon, offsets, targets, seconds, metres, landmark_from, landmark_to):
+        from scipy.spatial import cKDTree
+
+        self.lat, self.lon = lat, lon
+        self.offsets, self.targets = offsets, targets
+        self.seconds, self.metres = seconds, metres
+        # (landmarks, nodes) travel time from each landmark / to each landmark
+        self.landmark_from, self.landmark_to = landmark_from, landmark_to
+
+        # memoryviews index like lists without a Python object per element
+        self._adjacency = (memoryview(offsets), memoryview(targets), memoryview(seconds))
+        self._from = [memoryview(row) for row in landmark_from]
+        self._to = [memoryview(row) for row in landmark_to]
+
+        self._cos_lat = math.cos(math.radians(float(lat.mean())))
+        self._tree = cKDTree(self._project(lon, lat))
+
+    @classmethod
+    def from_edges(cls, lat, lon, sources, targets, metres, seconds, landmarks=DEFAULT_LANDMARKS):
+        from scipy.sparse import csr_matrix
+        from scipy.sparse.csgraph import connected_components
+
+        # Keep the largest strongly connected component
+        n = len(lat)
+        adjacency = csr_matrix((np.ones(len(sources)), (sources, targets)), shape=(n, n))
+        _, labels = connected_components(adjacency, directed=True, connection="strong")
+        keep = labels == np.bincount(labels).argmax()
+        if keep.sum() < 2:
+            raise ValueError("Road network has no connected component with two or more nodes")
+        remap = np.full(n, -1, dtype=np.int64)
+        remap[keep] = np.arange(keep.sum())
+        edges = keep[sources] & keep[targets]
+        sources, targets = remap[sources[edges]], remap[targets[edges]]
+        metres = metres[edges]
+        seconds = np.maximum(seconds[edges], MIN_EDGE_SECONDS)
+
+        # Sort by source for CSR; of parallel edges keep the fastest
+        order = np.lexsort((seconds, targets, sources))
+        sources, targets, metres, seconds = sources[order], targets[order], metres[order], seconds[order]
+        first = np.ones(len(sources), dtype=bool)
+        first[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+        sources, targets, metres, seconds = sources[first], targets[first], metres[first], seconds[first]
+
+        n = int(keep.sum())
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=n), out=offsets[1:])
+        landmark_from, landmark_to = _landmark_tables(n, sources, targets, seconds, landmarks)
+        return cls(lat[keep], lon[keep], offsets, targets.astype(np.int32),
+                   seconds.astype(np.float32), metres.astype(np.float32),
+                   landmark_from, landmark_to)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(*(data[name] for name in GRAPH_ARRAYS))
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            np.savez(f, **{name: getattr(self, name) for name in GRAPH_ARRAYS})
+
+    def __len__(self):
+        return len(self.lat)
+
+    def _project(self, lon, lat):
+        """Equirectangular metres, accurate enough within a city"""
+        x = np.radians(lon) * EARTH_RADIUS_M * self._cos_lat
+        y = np.radians(lat) * EARTH_RADIUS_M
+        return np.column_stack((x, y))
+
+    def snap(self, points, radius=DEFAULT_SNAP_RADIUS_M):
+        """Nearest node and distance in metres for each (lon, lat); node is None past radius"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        distance, nodes = self._tree.query(self._project(points[:, 0], points[:, 1]))
+        return [(int(node) if d <= radius else None, float(d)) for node, d in zip(nodes, distance)]
+
+    def _potential(self, source, target):
+        """ALT lower bound on travel time from a node to target"""
+        bounds = []
+        for k, (lm_from, lm_to) in enumerate(zip(self._from, self._to)):
+            bounds.append((max(lm_from[target] - lm_from[source], lm_to[source] - lm_to[target]), k))
+        active = [(self._from[k], self._to[k]) for _, k in sorted(bounds, reverse=True)[:ACTIVE_LANDMARKS]]
+        pairs = [(lm_from, lm_from[target], lm_to, lm_to[target]) for lm_from, lm_to in active]
+
+        def potential(node):
+            best = 0.0
+            for lm_from, from_target, lm_to, to_target in pairs:
+                bound = from_target - lm_from[node]
+                if bound > best:
+                    best = bound
+                bound = lm_to[node] - to_target
+                if bound > best:
+                    best = bound
+            return best
+
+        return potential
+
+    def shortest_path(self, source, target):
+        """(seconds, [node, ...]) of the fastest route between two nodes, or None"""
+        if source == target:
+            return 0.0, [source]
+        offsets, targets, seconds = self._adjacency
+        potential = self._potential(source, target)
+        best = {source: 0.0}
+        parent = {source: -1}
+        heap = [(potential(source), 0.0, source)]
+        while heap:
+            _, cost, node = heapq.heappop(heap)
+            if node == target:
+                path = [node]
+                while parent[node] != -1:
+                    node = parent[node]
+                    path.append(node)
+                return cost, path[::-1]
+            if cost > best[node]:
+                continue
+            for edge in range(offsets[node], offsets[node + 1]):
+                neighbour = targets[edge]
+                candidate = cost + seconds[edge]
+                if candidate < best.get(neighbour, math.inf):
+                    best[neighbour] = candidate
+                    parent[neighbour] = node
+                    heapq.heappush(heap, (candidate + potential(neighbour), candidate, neighbour))
+        return None
+
+    def path_metres(self, path):
+        offsets, targets, _ = self._adjacency
+        total = 0.0
+        for a, b in zip(path, path[1:]):
+            for edge in range(offsets[a], offsets[a + 1]):
+                if targets[edge] == b:
+                    total += float(self.metres[edge])
+                    break
+        return total
+
+    def durations(self, origin, destinations, radius=DEFAULT_SNAP_RADIUS_M):
+        """Driving seconds from one (lon, lat) to many, None where a point doesn't snap"""
+        results = [None] * len(destinations)
+        if not destinations:
+            return results
+        snapped = self.snap([origin] + list(destinations), radius)
+        source = snapped[0][0]
+        if source is None:
+            return results
+        wanted = {}
+        for i, (node, _) in enumerate(snapped[1:]):
+            if node is not None:
+                wanted.setdefault(node, []).append(i)
+
+        offsets, targets, seconds = self._adjacency
+        best = {source: 0.0}
+        heap = [(0.0, source)]
+        while heap and wanted:
+            cost, node = heapq.heappop(heap)
+            if cost > best[node]:
+                continue
+            for i in wanted.pop(node, ()):
+                results[i] = cost
+            for edge in range(offsets[node], offsets[node + 1]):
+                neighbour = targets[edge]
+                candidate = cost + seconds[edge]
+                if candidate < best.get(neighbour, math.inf):
+                    best[neighbour] = candidate
+                    heapq.heappush(heap, (candidate, neighbour))
+        return results
+
+    def route(self, points, overview="simplified", geometries="polyline", radius=DEFAULT_SNAP_RADIUS_M):
+        """OSRM /route/v1 response body for a list of (lon, lat) waypoints"""
+        snapped = self.snap(points, radius)
+        if any(node is None for node, _ in snapped):
+            return {"code": "NoSegment", "message": "Could not find a matching segment for coordinate"}
+
+        legs = []
+        nodes = [snapped[0][0]]
+        for (source, _), (target, _) in zip(snapped, snapped[1:]):
+            found = self.shortest_path(source, target)
+            if found is None:
+                return {"code": "NoRoute", "message": "Impossible route between points"}
+            seconds, path = found
+            metres = self.path_metres(path)
+            legs.append({"steps": [], "summary": "", "weight": round(seconds, 1),
+                         "duration": round(seconds, 1), "distance": round(metres, 1)})
+            nodes.extend(path[1:])
+
+        duration = round(sum(leg["duration"] for leg in legs), 1)
+        route = {
+            "legs": legs,
+            "weight_name": "duration",
+            "weight": duration,
+            "duration": duration,
+            "distance": round(sum(leg["distance"] for leg in legs), 1),
+        }
+        if overview != "false":
+            # "simplified" gets the full geometry; city routes are short
+            coordinates = [[round(float(self.lon[n]), 6), round(float(self.lat[n]), 6)] for n in nodes]
+            if geometries == "geojson":
+                route["geometry"] = {"type": "LineString", "coordinates": coordinates}
+            else:
+                route["geometry"] = encode_polyline(coordinates, 6 if geometries == "polyline6" else 5)
+        waypoints = [
+            {"hint": "", "name": "", "distance": round(distance, 1),
+             "location": [round(float(self.lon[node]), 6), round(float(self.lat[node]), 6)]}
+            for node, distance in snapped
+        ]
+        return {"code": "Ok", "routes": [route], "waypoints": waypoints}
+
+
+def _landmark_tables(n, sources, targets, seconds, count):
+    """Farthest-point landmarks and their (count, n) from/to travel time tables"""
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import dijkstra
+
+    matrix = csr_matrix((seconds, (sources, targets)), shape=(n, n))
+    chosen = []
+    rows = []
+    closest = np.full(n, np.inf)
+    candidate = int(dijkstra(matrix, indices=0).argmax())
+    for _ in range(min(count, n)):
+        distances = dijkstra(matrix, indices=candidate)
+        chosen.append(candidate)
+        rows.append(distances)
+        closest = np.minimum(closest, distances)
+        candidate = int(closest.argmax())
+        if closest[candidate] == 0:
+            break
+    landmark_from = np.array(rows, dtype=np.float32)
+    landmark_to = dijkstra(matrix.T.tocsr(), indices=chosen).astype(np.float32)
+    return landmark_from, landmark_to.reshape(len(chosen), n)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Build a road graph for the local router")
+    parser.add_argument("extract", help="OpenStreetMap XML extract (.osm, .osm.gz, .osm.bz2)")
+    parser.add_argument("output", nargs="?", default="instance/roads.npz")
+    parser.add_argument("--landmarks", type=int, default=DEFAULT_LANDMARKS)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    coords, ways = read_osm(args.extract)
+    graph = graph_from_osm(coords, ways, args.landmarks)
+    graph.save(args.output)
+    print(f"Wrote {args.output}: {len(graph)} nodes, {len(graph.targets)} edges, "
+          f"{len(graph.landmark_from)} landmarks in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,284 @@
+"""Precomputed "similar pandals" table from pandal content.
+
+Each pandal is encoded as a fixed-length vector of hashed blocks:
+
+  theme, idol_type, area  one-hot
+  keywords                log term frequency of description words
+  location                its 0.02 degree grid cell, half weight on the 8 around it
+
+Every block is L2-normalised and then weighted, and the whole vector is
+normalised, so cosine similarity is a plain dot product. Hashing keeps
+the layout fixed, so new themes or words don't change existing vectors.
+
+Storage mirrors neighbours.py: index.json plus similar-<N>.npy holding
+(rows, k) records of (row int32, score float32), and
+similar-vectors-<N>.npy with every pandal's feature vector. index.json
+also keeps a fingerprint of each pandal's feature fields.
+
+update_similar is given the ids that were saved or deleted. It reads
+back only those pandals, reuses the stored vectors for everyone else,
+and recomputes just the rows of changed pandals and the rows that
+pointed at a changed or deleted one. Called without ids (the CLI), it
+compares the whole collection with the table instead.
+"""
+import hashlib
+import json
+import math
+import os
+import re
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from neighbours import CHUNK_ROWS, NeighbourIndex, locked, read_index, write_generation
+
+DEFAULT_K = 8
+GRID_DEGREES = 0.02
+FEATURE_FIELDS = ("theme", "idol_type", "area", "description", "location")
+# (name, hashed width, weight)
+BLOCKS = (
+    ("theme", 32, 1.0),
+    ("idol_type", 16, 0.8),
+    ("area", 64, 0.6),
+    ("keywords", 512, 1.0),
+    ("location", 128, 0.6),
+)
+STOPWORDS = frozenset("""
+    the and for with this that from are was were has have had its our your their
+    you all any can will into also more most very such than then there here which
+    who whom what when where how pandal ganpati ganapati ganesh year years
+""".split())
+
+DIMENSIONS = sum(width for _, width, _ in BLOCKS)
+SIMILAR_DTYPE = np.dtype([("row", "<i4"), ("score", "<f4")])
+
+
+def _bucket(token, width):
+    return zlib.crc32(token.encode("utf-8")) % width
+
+
+def _keywords(text):
+    return [w for w in re.findall(r"[a-z]{3,}", (text or "").lower()) if w not in STOPWORDS]
+
+
+def feature_vector(pandal):
+    blocks = []
+    for name, width, weight in BLOCKS:
+        block = np.zeros(width, dtype=np.float32)
+        if name == "keywords":
+            for word, count in Counter(_keywords(pandal.get("description"))).items():
+                block[_bucket(word, width)] += 1 + math.log(count)
+        elif name == "location":
+            coordinates = (pandal.get("location") or {}).get("coordinates")
+            if coordinates:
+                cx = math.floor(float(coordinates[0]) / GRID_DEGREES)
+                cy = math.floor(float(coordinates[1]) / GRID_DEGREES)
+                for dx in (-1, 0, 1):
+                    for dy in (-1, 0, 1):
+                        block[_bucket(f"{cx + dx}:{cy + dy}", width)] += 0.5 if dx or dy else 1.0
+        else:
+            value = pandal.get(name)
+            if isinstance(value, str) and value.strip():
+                block[_bucket(value.strip().lower(), width)] = 1.0
+        norm = np.linalg.norm(block)
+        if norm:
+            block *= weight / norm
+        blocks.append(block)
+    vector = np.concatenate(blocks)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def fingerprint(pandal):
+    raw = json.dumps([pandal.get(f) for f in FEATURE_FIELDS], sort_keys=True, default=str)
+    return hashlib.md5(raw.encode("utf-8")).hexdigest()
+
+
+def _load(collection, query=None):
+    """Return {id: (name, fingerprint, vector)} for matching pandals"""
+    projection = {f: 1 for f in FEATURE_FIELDS + ("name",)}
+    return {
+        str(p["_id"]): (p.get("name"), fingerprint(p), feature_vector(p))
+        for p in collection.find(query or {}, projection).sort("_id", 1)
+    }
+
+
+def _top_k(vectors, rows, candidate_rows, k, extra=None):
+    """Best k candidates by dot product for each of `rows`, self excluded.
+
+    `extra` is an optional (rows, scores) pair of already known entries to
+    merge in.
+    """
+    scores = vectors[rows] @ vectors[candidate_rows].T
+    scores[candidate_rows[None, :] == rows[:, None]] = -np.inf
+    ids = np.broadcast_to(candidate_rows, scores.shape)
+    if extra is not None:
+        extra_rows, extra_scores = extra
+        ids = np.concatenate([extra_rows, ids], axis=1)
+        scores = np.concatenate([np.where(extra_rows >= 0, extra_scores, -np.inf), scores], axis=1)
+    scores[scores <= 0] = -np.inf
+
+    out = np.empty((len(rows), k), dtype=SIMILAR_DTYPE)
+    out["row"] = -1
+    out["score"] = 0
+    take = min(k, scores.shape[1])
+    if take == 0:
+        return out
+    part = np.argpartition(-scores, take - 1, axis=1)[:, :take]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind="stable")
+    best = np.take_along_axis(part, order, axis=1)
+    best_scores = np.take_along_axis(part_scores, order, axis=1)
+    valid = np.isfinite(best_scores)
+    out["row"][:, :take] = np.where(valid, np.take_along_axis(ids, best, axis=1), -1)
+    out["score"][:, :take] = np.where(valid, best_scores, 0)
+    return out
+
+
+def _save(directory, ids, names, fingerprints, vectors, matrix, k):
+    write_generation(directory, {
+        "k": k,
+        "ids": ids,
+        "names": names,
+        "fingerprints": fingerprints,
+    }, matrix, prefix="similar", extra={"vectors": vectors})
+
+
+def build_similar(collection, directory, k=DEFAULT_K):
+    """Compute the k most similar pandals for every pandal from scratch"""
+    with locked(directory):
+        return _build_similar(collection, directory, k)
+
+
+def _build_similar(collection, directory, k):
+    pandals = _load(collection)
+    ids = list(pandals)
+    vectors = np.array([pandals[i][2] for i in ids], dtype=np.float32).reshape(len(ids), DIMENSIONS)
+    all_rows = np.arange(len(ids), dtype=np.int32)
+    matrix = np.empty((len(ids), k), dtype=SIMILAR_DTYPE)
+    for start in range(0, len(ids), CHUNK_ROWS):
+        rows = all_rows[start:start + CHUNK_ROWS]
+        matrix[rows] = _top_k(vectors, rows, all_rows, k)
+    _save(directory, ids, [pandals[i][0] for i in ids], [pandals[i][1] for i in ids], vectors, matrix, k)
+    return {"rows": len(ids), "recomputed": len(ids)}
+
+
+def update_similar(collection, directory, k=DEFAULT_K, changed_ids=None, deleted_ids=()):
+    """Bring the table up to date with new, changed and deleted pandals.
+
+    Rows that pointed at a changed or deleted pandal are recomputed in
+    full; every other row merges its stored list with scores against the
+    changed pandals, which gives the same result as a rebuild.
+    """
+    with locked(directory):
+        meta = read_index(directory)
+        if meta is None or "vectors" not in meta:
+            return _build_similar(collection, directory, k)
+        return _update_similar(collection, directory, meta, changed_ids, deleted_ids)
+
+
+def _update_similar(collection, directory, meta, changed_ids, deleted_ids):
+    k = meta["k"]
+    old_row = {pid: r for r, pid in enumerate(meta["ids"])}
+    deleted = {str(i) for i in deleted_ids}
+    if changed_ids is None:
+        loaded = _load(collection)
+        deleted |= set(meta["ids"]) - set(loaded)
+    else:
+        changed_ids = list(changed_ids)
+        loaded = _load(collection, {"_id": {"$in": changed_ids}})
+        deleted |= {str(i) for i in changed_ids} - set(loaded)
+    deleted &= set(old_row)
+
+    changed = [pid for pid, (_, fp, _) in loaded.items()
+               if pid not in old_row or meta["fingerprints"][old_row[pid]] != fp]
+    renamed = any(pid in old_row and meta["names"][old_row[pid]] != name
+                  for pid, (name, _, _) in loaded.items())
+    if not (changed or deleted or renamed):
+        return {"rows": len(meta["ids"]), "recomputed": 0}
+
+    kept = [pid for pid in meta["ids"] if pid not in deleted]
+    ids = kept + [pid for pid in loaded if pid not in old_row]
+    row = {pid: r for r, pid in enumerate(ids)}
+    n = len(ids)
+    names = [loaded[pid][0] if pid in loaded else meta["names"][old_row[pid]] for pid in ids]
+    fingerprints = [loaded[pid][1] if pid in loaded else meta["fingerprints"][old_row[pid]] for pid in ids]
+
+    kept_old = np.array([old_row[pid] for pid in kept], dtype=np.int32)
+    vectors = np.empty((n, DIMENSIONS), dtype=np.float32)
+    vectors[:len(kept)] = np.load(os.path.join(directory, meta["vectors"]))[kept_old]
+    for pid in changed:
+        vectors[row[pid]] = loaded[pid][2]
+
+    # Old row numbers -> new ones; the extra last slot maps -1 to -1
+    renumber = np.full(len(meta["ids"]) + 1, -1, dtype=np.int32)
+    for pid, r in old_row.items():
+        renumber[r] = row.get(pid, -1)
+    old = np.load(os.path.join(directory, meta["matrix"]))
+    gone = np.array([old_row[pid] for pid in changed if pid in old_row]
+                    + [old_row[pid] for pid in deleted], dtype=np.int32)
+
+    dirty = np.array(sorted(row[pid] for pid in changed), dtype=np.int32)
+    stale = np.zeros(n, dtype=bool)
+    stale[dirty] = True
+    stale[:len(kept)] |= np.isin(old["row"][kept_old], gone).any(axis=1)
+
+    matrix = np.empty((n, k), dtype=SIMILAR_DTYPE)
+    all_rows = np.arange(n, dtype=np.int32)
+    merge = all_rows[~stale]
+    for start in range(0, len(merge), CHUNK_ROWS):
+        rows = merge[start:start + CHUNK_ROWS]
+        previous = old[kept_old[rows]]
+        matrix[rows] = _top_k(vectors, rows, dirty, k,
+                              extra=(renumber[previous["row"]], previous["score"]))
+    redo = all_rows[stale]
+    for start in range(0, len(redo), CHUNK_ROWS):
+        rows = redo[start:start + CHUNK_ROWS]
+        matrix[rows] = _top_k(vectors, rows, all_rows, k)
+
+    _save(directory, ids, names, fingerprints, vectors, matrix, k)
+    return {"rows": n, "recomputed": int(stale.sum())}
+
+
+class SimilarIndex(NeighbourIndex):
+    """Read-only view of the similarity table, shared via mmap across workers"""
+
+    def similar(self, pandal_id, limit=None):
+        """Return [{"id", "name", "score"}] for the most similar pandals"""
+        if not self._refresh():
+            return []
+        row = self._rows.get(str(pandal_id))
+        if row is None:
+            return []
+        entries = self._matrix[row, :limit]
+        results = []
+        for other, score in zip(entries["row"].tolist(), entries["score"].tolist()):
+            if other < 0:
+                break
+            results.append({
+                "id": self._meta["ids"][other],
+                "name": self._meta["names"][other],
+                "score": round(score, 3),
+            })
+        return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import pymongo
+    import config
+
+    parser = argparse.ArgumentParser(description="Rebuild the similar-pandals table")
+    parser.add_argument("--full", action="store_true", help="rebuild from scratch")
+    parser.add_argument("-k", type=int, default=DEFAULT_K, help="similar pandals kept per pandal")
+    parser.add_argument("--dir", default=getattr(config, "SIMILAR_DIR", "instance/similar"))
+    args = parser.parse_args()
+
+    db = pymongo.MongoClient(config.MONGO_URI).utsavdarshan
+    if args.full:
+        result = build_similar(db.pandals, args.dir, args.k)
+    else:
+        result = update_similar(db.pandals, args.dir, args.k)
+    print(f"Similarity table has {result['rows']} pandals ({result['recomputed']} recomputed)")
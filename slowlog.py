@@ -0,0 +1,146 @@
+"""Slow-query log built on pymongo command monitoring.
+
+Commands slower than SLOW_QUERY_MS are grouped by query shape (see
+instrumentation.query_shape) with a count, total and max duration and the
+latest example command. The first time a shape is seen its query plan is
+fetched with `explain` on a background thread, so the request that was
+slow is not made slower. Plans that contain a COLLSCAN are flagged.
+
+At most SLOW_QUERY_MAX shapes are kept; the least recently seen is
+dropped first. /admin/slow-queries returns the log as JSON.
+"""
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from bson import json_util
+from flask import jsonify, request
+from pymongo import monitoring
+
+from admin import admin_required
+from instrumentation import query_shape
+
+DEFAULT_THRESHOLD_MS = 100
+DEFAULT_MAX_SHAPES = 200
+EXPLAINABLE = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+# Driver-added fields that explain rejects or that say nothing about the query
+_DRIVER_FIELDS = {"lsid", "$db", "$clusterTime", "$readPreference", "txnNumber",
+                  "readConcern", "writeConcern", "cursor", "batchSize"}
+
+
+def _plan_stages(node, stages):
+    if isinstance(node, dict):
+        if "stage" in node:
+            stages.append(node["stage"])
+        for key, value in node.items():
+            if key not in ("rejectedPlans", "allPlansExecution"):
+                _plan_stages(value, stages)
+    elif isinstance(node, list):
+        for item in node:
+            _plan_stages(item, stages)
+    return stages
+
+
+class SlowQueryLog(monitoring.CommandListener):
+    def __init__(self, threshold_ms=DEFAULT_THRESHOLD_MS, max_shapes=DEFAULT_MAX_SHAPES):
+        self.threshold_ms = threshold_ms
+        self.max_shapes = max_shapes
+        self.client = None
+        self._pending = {}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._explain_queue = queue.Queue(maxsize=100)
+        self._worker = None
+
+    def configure(self, client, threshold_ms, max_shapes):
+        self.client = client
+        self.threshold_ms = threshold_ms
+        self.max_shapes = max_shapes
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._explain_loop, daemon=True)
+            self._worker.start()
+
+    def started(self, event):
+        # Only the event is kept; shape and command copy are made if it turns out slow
+        if event.command_name in EXPLAINABLE:
+            self._pending[(event.connection_id, event.request_id)] = event
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
+
+    def _finished(self, event):
+        started = self._pending.pop((event.connection_id, event.request_id), None)
+        if started is None:
+            return
+        millis = event.duration_micros / 1000
+        if millis < self.threshold_ms:
+            return
+        shape = query_shape(started)
+        database = started.database_name
+        command = {k: v for k, v in started.command.items() if k not in _DRIVER_FIELDS}
+        with self._lock:
+            entry = self._entries.pop(shape, None)
+            is_new = entry is None
+            if is_new:
+                entry = {"shape": shape, "database": database, "count": 0,
+                         "total_ms": 0.0, "max_ms": 0.0, "explain": None}
+            entry["count"] += 1
+            entry["total_ms"] += millis
+            entry["max_ms"] = max(entry["max_ms"], millis)
+            entry["last_seen"] = time.time()
+            entry["example"] = json_util.dumps(command)[:2000]
+            self._entries[shape] = entry
+            while len(self._entries) > self.max_shapes:
+                self._entries.popitem(last=False)
+        if is_new:
+            try:
+                self._explain_queue.put_nowait((shape, database, command))
+            except queue.Full:
+                pass
+
+    def _explain_loop(self):
+        while True:
+            shape, database, command = self._explain_queue.get()
+            try:
+                plan = self.client[database].command({"explain": command, "verbosity": "queryPlanner"})
+                stages = _plan_stages(plan.get("queryPlanner", plan), [])
+                explain = {"stages": stages, "collscan": "COLLSCAN" in stages}
+            except Exception as e:
+                explain = {"error": str(e)}
+            with self._lock:
+                if shape in self._entries:
+                    self._entries[shape]["explain"] = explain
+
+    def snapshot(self):
+        with self._lock:
+            entries = [dict(entry) for entry in self._entries.values()]
+        for entry in entries:
+            entry["avg_ms"] = round(entry["total_ms"] / entry["count"], 2)
+        return sorted(entries, key=lambda entry: entry["total_ms"], reverse=True)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+slow_queries = SlowQueryLog()
+
+
+@admin_required
+def slow_queries_view():
+    if request.method == "DELETE":
+        slow_queries.clear()
+        return jsonify({"cleared": True})
+    return jsonify({"threshold_ms": slow_queries.threshold_ms, "queries": slow_queries.snapshot()})
+
+
+def init_app(app, client):
+    """Pass slow_queries to the MongoClient's event_listeners, then call this"""
+    slow_queries.configure(client,
+                           app.config.get("SLOW_QUERY_MS", DEFAULT_THRESHOLD_MS),
+                           app.config.get("SLOW_QUERY_MAX", DEFAULT_MAX_SHAPES))
+    app.add_url_rule("/admin/slow-queries", "slow_queries", slow_queries_view, methods=["GET", "DELETE"])
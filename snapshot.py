@@ -0,0 +1,232 @@
+"""Static snapshot of the public site for CDN or offline serving.
+
+`python snapshot.py OUT_DIR` renders the public pages through the app
+and writes them as directory indexes, so the output can be served by
+any static host at the same URLs:
+
+  index.html, locations/, all-pandals/, taluka/<area>/, pandal/<id>/
+  api/pandals.json   the /api/pandals catalog
+  api/pandals/changes  the whole catalog as one /api/pandals/changes page
+  api/pandals/<id>   what /api/pandals/<id> returns, for the detail modal
+  pandals.geojson    the same pandals as a FeatureCollection
+  static/, assets/   copies of static files and the fingerprinted bundle
+
+The map and the detail modal keep fetching the same URLs they use against
+the app. A static host ignores the query string, so every sync of the map
+gets the full changes page, and its "reset" flag makes the browser
+replace whatever catalog it had cached. Nearby search still needs the
+app.
+
+OUT_DIR/.snapshot.json records a fingerprint of every pandal, including
+its rating count and average, plus one of the templates and asset
+manifest. The next export only re-renders the pages of changed, new or
+deleted pandals and their areas, and the listing pages when anything
+changed. A template or asset change, or --full, re-renders everything.
+Files are only rewritten when their content differs, so CDN syncs
+upload just the changes. Nearby and similar lists on unchanged pandal
+pages can lag until the next --full export.
+"""
+import hashlib
+import json
+import os
+import shutil
+from urllib.parse import unquote
+
+MANIFEST_FILE = ".snapshot.json"
+
+
+def _digest(value):
+    return hashlib.md5(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _site_fingerprint(app):
+    import assets
+
+    digest = hashlib.md5()
+    folder = os.path.join(app.root_path, app.template_folder)
+    for name in sorted(os.listdir(folder)):
+        with open(os.path.join(folder, name), "rb") as f:
+            digest.update(name.encode("utf-8") + f.read())
+    try:
+        with open(os.path.join(app.config["ASSETS_DIR"], assets.MANIFEST_FILE), "rb") as f:
+            digest.update(f.read())
+    except OSError:
+        pass
+    return digest.hexdigest()
+
+
+def _pandal_fingerprints(pandals, ratings):
+    summary = {
+        r["_id"]: [r["count"], r["avg"]] for r in ratings.aggregate([
+            {"$group": {
+                "_id": "$pandal_id",
+                "avg": {"$avg": {"$toDouble": "$rating"}},
+                "count": {"$sum": 1},
+            }}
+        ])
+    }
+    return {
+        str(p["_id"]): {"area": p.get("area"), "hash": _digest([p, summary.get(str(p["_id"]))])}
+        for p in pandals.find()
+    }
+
+
+def _write_if_changed(out_dir, relpath, data):
+    path = os.path.normpath(os.path.join(out_dir, relpath))
+    if os.path.commonpath([out_dir, path]) != out_dir:
+        raise ValueError(f"Refusing to write outside the snapshot: {relpath}")
+    try:
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return False
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return True
+
+
+def _page_file(url):
+    """Where `url` lives in the snapshot: API responses as-is, pages as directory indexes"""
+    path = unquote(url).strip("/")
+    if path.startswith("api/"):
+        return path
+    return os.path.join(path, "index.html") if path else "index.html"
+
+
+def _copy_tree(src, dest, skip=()):
+    copied = 0
+    for root, dirs, files in os.walk(src):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) not in skip]
+        for name in files:
+            source = os.path.join(root, name)
+            target = os.path.join(dest, os.path.relpath(source, src))
+            try:
+                stat = os.stat(target)
+                if stat.st_size == os.path.getsize(source) and stat.st_mtime >= os.path.getmtime(source):
+                    continue
+            except OSError:
+                pass
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(source, target)
+            copied += 1
+    return copied
+
+
+def _geojson(catalog):
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "id": p["id"],
+                "geometry": {"type": "Point", "coordinates": [p["lon"], p["lat"]]},
+                "properties": {k: v for k, v in p.items() if k not in ("lat", "lon")},
+            }
+            for p in catalog if p.get("lat") is not None and p.get("lon") is not None
+        ],
+    }
+
+
+def _full_feed(client, changes_url):
+    """Every /api/pandals/changes page from 0, as one page that resets the client"""
+    merged = []
+    since = "0"
+    while True:
+        page = client.get(changes_url, query_string={"since": since, "limit": 5000}).get_json()
+        merged += page["changes"]
+        since = page["next"]
+        if not page["has_more"]:
+            break
+    return {"epoch": page["epoch"], "reset": True, "changes": merged, "next": since, "has_more": False}
+
+
+def export_snapshot(app, out_dir, full=False):
+    """Render changed pages into out_dir; returns counts of what was done"""
+    from flask import url_for
+
+    import app as site
+
+    out_dir = os.path.abspath(out_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    try:
+        with open(os.path.join(out_dir, MANIFEST_FILE)) as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        previous = {}
+
+    with app.app_context():
+        current = _pandal_fingerprints(site.pandals, site.ratings)
+        site_hash = _site_fingerprint(app)
+        old = {} if full or previous.get("site") != site_hash else previous.get("pandals", {})
+
+        changed = {pid for pid, entry in current.items() if old.get(pid, {}).get("hash") != entry["hash"]}
+        deleted = set(old) - set(current)
+        areas = {current[pid]["area"] for pid in changed} | {old[pid]["area"] for pid in changed | deleted if pid in old}
+        areas.discard(None)
+        live_areas = {entry["area"] for entry in current.values()}
+
+        with app.test_request_context():
+            pages = [url_for("pandal_detail", pandal_id=pid) for pid in sorted(changed)]
+            pages += [url_for("taluka_pandals", taluka_name=area) for area in sorted(areas & live_areas)]
+            stale = [url_for("pandal_detail", pandal_id=pid) for pid in sorted(deleted)]
+            stale += [url_for("api_get_pandal", pandal_id=pid) for pid in sorted(deleted)]
+            stale += [url_for("taluka_pandals", taluka_name=area) for area in sorted(areas - live_areas)]
+            if changed or deleted or not previous:
+                pages += [url_for("index"), url_for("locations"), url_for("all_pandals")]
+            catalog_url = url_for("api_get_pandals")
+            changes_url = url_for("api_pandal_changes")
+            pages += [url_for("api_get_pandal", pandal_id=pid) for pid in sorted(changed)]
+        # Pages that failed last time are retried even if nothing changed
+        pages += [url for url in previous.get("failed", []) if url not in pages and url not in stale]
+
+    client = app.test_client()
+    written = 0
+    failed = []
+    for url in pages:
+        response = client.get(url)
+        if response.status_code != 200:
+            print(f"Skipping {url}: HTTP {response.status_code}")
+            failed.append(url)
+            continue
+        written += _write_if_changed(out_dir, _page_file(url), response.get_data())
+
+    if changed or deleted or not previous:
+        catalog = client.get(catalog_url).get_json()
+        written += _write_if_changed(out_dir, "api/pandals.json", json.dumps(catalog).encode("utf-8"))
+        written += _write_if_changed(out_dir, "pandals.geojson", json.dumps(_geojson(catalog)).encode("utf-8"))
+        feed = _full_feed(client, changes_url)
+        written += _write_if_changed(out_dir, _page_file(changes_url), json.dumps(feed).encode("utf-8"))
+
+    removed = 0
+    for url in stale:
+        path = os.path.join(out_dir, _page_file(url))
+        if os.path.exists(path):
+            os.remove(path)
+            removed += 1
+
+    dist = app.config["ASSETS_DIR"]
+    copied = _copy_tree(app.static_folder, os.path.join(out_dir, "static"), skip={dist})
+    if os.path.isdir(dist):
+        copied += _copy_tree(dist, os.path.join(out_dir, "assets"))
+
+    with open(os.path.join(out_dir, MANIFEST_FILE), "w") as f:
+        json.dump({"site": site_hash, "pandals": current, "failed": failed}, f)
+    return {"rendered": len(pages) - len(failed), "failed": len(failed), "written": written,
+            "removed": removed, "copied": copied}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from wsgi import app
+
+    parser = argparse.ArgumentParser(description="Export a static snapshot of the site")
+    parser.add_argument("out_dir", help="directory to write the snapshot into")
+    parser.add_argument("--full", action="store_true", help="re-render every page")
+    args = parser.parse_args()
+
+    result = export_snapshot(app, args.out_dir, args.full)
+    print(f"Rendered {result['rendered']} pages ({result['failed']} failed), wrote {result['written']} files, "
+          f"removed {result['removed']}, copied {result['copied']} static files")
@@ -8,6 +8,9 @@ let currentPandalRoute = null;
 let layerControl;
 let heatmapLayer;
 
+// OSRM-compatible route service; pages set window.ROUTING_URL from routing_url()
+const routingUrl = window.ROUTING_URL || 'https://router.project-osrm.org/route/v1/driving';
+
 // Custom icons for markers
 const icons = {
     user: L.icon({
@@ -197,11 +200,52 @@ function getUserLocation(startWatch=false) {
     }
 }
 
+// The catalog is kept in localStorage and brought up to date from
+// /api/pandals/changes, so repeat visits only download what changed
+const CATALOG_KEY = 'utsavdarshan.pandals';
+
+function syncCatalog(catalog) {
+    const params = new URLSearchParams({ since: catalog.token });
+    if (catalog.epoch) {
+        params.set('epoch', catalog.epoch);
+    }
+    return fetch(`/api/pandals/changes?${params}`)
+        .then(response => response.json())
+        .then(page => {
+            if (page.reset) {
+                // The server's catalog was reset or re-seeded; this page starts over
+                catalog.pandals = {};
+            }
+            catalog.epoch = page.epoch;
+            page.changes.forEach(change => {
+                if (change.op === 'delete') {
+                    delete catalog.pandals[change.id];
+                } else {
+                    catalog.pandals[change.id] = change.pandal;
+                }
+            });
+            catalog.token = page.next;
+            return page.has_more ? syncCatalog(catalog) : catalog;
+        });
+}
+
 // Fetch pandals from the backend
 function fetchPandals() {
-    fetch('/api/pandals')
-        .then(response => response.json())
-        .then(pandals => {
+    let cached = null;
+    try {
+        cached = JSON.parse(localStorage.getItem(CATALOG_KEY));
+    } catch (e) {
+        cached = null;
+    }
+    syncCatalog(cached || { token: '0', pandals: {} })
+        .then(catalog => {
+            try {
+                localStorage.setItem(CATALOG_KEY, JSON.stringify(catalog));
+            } catch (e) {
+                // Storage full or disabled; the next visit syncs from scratch
+            }
+            const pandals = Object.values(catalog.pandals);
+
             // Clear existing markers
             markers.forEach(marker => map.removeLayer(marker));
             markers = [];
@@ -274,8 +318,8 @@ function getDirections(lat, lon) {
         map.removeLayer(currentPandalRoute);
     }
 
-    // Using OSRM public instance
-    fetch(`https://router.project-osrm.org/route/v1/driving/${origin};${destination}?overview=full&geometries=geojson`)
+    // Using OSRM (or the local road graph, see routing_url())
+    fetch(`${routingUrl}/${origin};${destination}?overview=full&geometries=geojson`)
         .then(response => response.json())
         .then(data => {
             if (data.routes && data.routes.length > 0) {
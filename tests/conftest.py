@@ -0,0 +1,36 @@
+import os
+import random
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def mock_db():
+    """A mongomock database with the operators the app needs filled in"""
+    import mongomock
+
+    from benchmarks import mongomock_compat
+
+    mongomock_compat.install()
+    return mongomock.MongoClient().utsavdarshan_test
+
+
+@pytest.fixture
+def app_env(tmp_path):
+    """(app module, Flask app, database, seeded pandals) on mongomock, as the benchmarks run it"""
+    from benchmarks import endpoints
+
+    settings = endpoints.make_config(str(tmp_path), page_cache=False)
+    import app as app_module
+
+    client, db, _ = endpoints.connect(None, endpoints.OperationCounter())
+    flask_app = app_module.create_app(settings)
+    app_module.mongo.cx = client
+    app_module.mongo.db = db
+    docs = endpoints.seed(db, 30, 1, random.Random(1))
+    return app_module, flask_app, db, docs
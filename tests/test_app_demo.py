@@ -0,0 +1,30 @@
+import pytest
+
+
+@pytest.fixture
+def demo():
+    import app_demo
+
+    return app_demo.app.test_client()
+
+
+def test_filters_match_substrings_case_insensitively(demo):
+    friendly = demo.get("/api/pandals/filtered?idol_type=friendly").get_json()
+    assert friendly and all("friendly" in p["idol_type"].lower() for p in friendly)
+    assert demo.get("/api/pandals/filtered?area=LALB").get_json()[0]["area"] == "Lalbaug"
+    assert demo.get("/api/pandals/filtered?area=nowhere").get_json() == []
+
+
+def test_one_malformed_place_does_not_fail_the_request(demo, monkeypatch):
+    import upstream
+
+    async def places(http, lat, lon, radius, place_type, api_key):
+        if place_type == "police":
+            return [{"name": "no geometry"}]
+        return [{"place_id": place_type, "name": place_type,
+                 "geometry": {"location": {"lat": lat, "lng": lon}}}]
+
+    monkeypatch.setattr(upstream, "google_places", places)
+    response = demo.get("/api/nearby-pois?lat=19.0&lon=72.8&types=hospital,police")
+    assert response.status_code == 200
+    assert [p["type"] for p in response.get_json()] == ["hospital"]
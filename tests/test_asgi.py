@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+BLOCK_SECONDS = 0.5
+REQUESTS = 4
+
+
+class SlowCollection:
+    """Delegates to a collection, sleeping (blocking the thread) on every read"""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name not in ("find", "find_one"):
+            return attr
+
+        def slow(*args, **kwargs):
+            time.sleep(BLOCK_SECONDS)
+            return attr(*args, **kwargs)
+        return slow
+
+
+class SlowDatabase:
+    def __init__(self, db):
+        self._db = db
+
+    def __getattr__(self, name):
+        if name == "pandals":
+            return SlowCollection(self._db.pandals)
+        return getattr(self._db, name)
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+
+@pytest.fixture
+def stubs(monkeypatch):
+    import upstream
+    from benchmarks.stubs import start_stubs
+
+    servers = start_stubs()
+    monkeypatch.setattr(upstream, "OSRM_URL", servers["osrm"].url + "/route/v1/driving")
+    monkeypatch.setattr(upstream, "OVERPASS_URL", servers["overpass"].url + "/api/interpreter")
+    yield servers
+    for server in servers.values():
+        server.stop()
+
+
+async def _concurrent_get(asgi_app, paths):
+    transport = httpx.ASGITransport(app=asgi_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        started = time.perf_counter()
+        responses = await asyncio.gather(*(client.get(path) for path in paths))
+        return time.perf_counter() - started, responses
+
+
+@pytest.mark.parametrize("path", ["/api/pandals/nearby?lat={lat}&lon={lon}&radius=500", "/map/pandal/{id}"])
+def test_blocking_views_run_concurrently_under_asgi(app_env, stubs, path):
+    from asgi import FlaskAsgi
+
+    app_module, flask_app, db, docs = app_env
+    app_module.mongo.db = SlowDatabase(db)
+    lon, lat = docs[0]["location"]["coordinates"]
+    paths = [path.format(lat=lat, lon=lon, id=docs[0]["_id"])] * REQUESTS
+
+    elapsed, responses = asyncio.run(_concurrent_get(FlaskAsgi(flask_app), paths))
+
+    assert [r.status_code for r in responses] == [200] * REQUESTS
+    # One after another would take REQUESTS * BLOCK_SECONDS
+    assert elapsed < (REQUESTS - 1) * BLOCK_SECONDS
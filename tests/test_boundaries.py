@@ -0,0 +1,64 @@
+import json
+import random
+
+import pytest
+
+import boundaries
+
+
+def square(x0, y0, x1, y1):
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]]
+
+
+def feature(name, *rings):
+    return {"type": "Feature", "properties": {"name": name},
+            "geometry": {"type": "Polygon", "coordinates": list(rings)}}
+
+
+@pytest.fixture
+def area_file(tmp_path):
+    """Two wards inside a taluka, one of them with a hole holding a third ward"""
+    features = [
+        feature("Ward A", square(72.82, 19.02, 72.86, 19.06)),
+        feature("Ward B", square(72.90, 19.02, 72.96, 19.08), square(72.92, 19.04, 72.94, 19.06)),
+        feature("Ward C", square(72.925, 19.045, 72.935, 19.055)),
+        feature("Taluka", square(72.80, 19.00, 73.00, 19.10)),
+    ]
+    path = tmp_path / "areas.geojson"
+    path.write_text(json.dumps({"type": "FeatureCollection", "features": features}))
+    return str(path), features
+
+
+def expected(features, lon, lat):
+    """First feature whose rings contain the point, by a plain even-odd test"""
+    for f in features:
+        if boundaries._contains(boundaries._edges(f["geometry"]["coordinates"]), lon, lat):
+            return f["properties"]["name"]
+    return None
+
+
+def test_nested_polygons(area_file):
+    path, features = area_file
+    areas = boundaries.AreaIndex.from_geojson(path, cell_degrees=0.004)
+
+    assert areas.area_at(72.84, 19.04) == "Ward A"
+    assert areas.area_at(72.91, 19.03) == "Ward B"
+    assert areas.area_at(72.922, 19.05) == "Taluka"  # in B's hole, outside C
+    assert areas.area_at(72.93, 19.05) == "Ward C"
+    assert areas.area_at(72.81, 19.09) == "Taluka"
+    assert areas.area_at(73.05, 19.05) is None
+
+    rng = random.Random(1)
+    for _ in range(3000):
+        lon, lat = rng.uniform(72.79, 73.01), rng.uniform(18.99, 19.11)
+        assert areas.area_at(lon, lat) == expected(features, lon, lat), (lon, lat)
+
+
+def test_outer_polygon_listed_first_wins(area_file, tmp_path):
+    _, features = area_file
+    path = tmp_path / "taluka-first.geojson"
+    path.write_text(json.dumps({"type": "FeatureCollection", "features": features[::-1]}))
+    areas = boundaries.AreaIndex.from_geojson(str(path), cell_degrees=0.004)
+
+    assert areas.area_at(72.84, 19.04) == "Taluka"
+    assert areas.area_at(72.93, 19.05) == "Taluka"
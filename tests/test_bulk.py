@@ -0,0 +1,54 @@
+import re
+
+import pytest
+
+import bulk
+
+
+@pytest.mark.parametrize("line, error", [
+    ('{"op": "upsert"', "not valid JSON"),
+    ('["upsert"]', "record must be an object"),
+    ('{"op": "delete", "id": "64b7f0c2a1b2c3d4e5f60718"}', 'op must be "upsert" or "patch"'),
+    ('{"op": "patch", "id": "nope", "set": {"name": "X"}}', "id is not a valid pandal id"),
+    ('{"op": "patch", "permit_id": "  ", "set": {"name": "X"}}', "record needs an id or permit_id"),
+    ('{"op": "upsert", "permit_id": "P1", "pandal": {"name": "X", "area": "Dadar", "lat": 19.0}}',
+     "missing fields: lon"),
+    ('{"op": "patch", "permit_id": "P1", "set": {}}', "pandal fields must be a non-empty object"),
+    ('{"op": "patch", "permit_id": "P1", "set": {"crowd": "high"}}', "unknown fields: crowd"),
+    ('{"op": "patch", "permit_id": "P1", "set": {"name": 7}}', "name must be a string"),
+    ('{"op": "patch", "permit_id": "P1", "set": {"lat": 19.0}}', "lat and lon must be given together"),
+    ('{"op": "patch", "permit_id": "P1", "set": {"lat": true, "lon": 72.8}}', "lat and lon must be numbers"),
+    ('{"op": "patch", "permit_id": "P1", "set": {"lat": 91, "lon": 72.8}}', "lat/lon out of range"),
+    ('{"op": "patch", "permit_id": "P1", "set": {"opening_time": "08:00"}}',
+     "opening_time and closing_time must be given together"),
+    ('{"op": "patch", "permit_id": "P1", "set": {"opening_time": "8am", "closing_time": "22:00"}}',
+     "opening_time and closing_time must be HH:MM"),
+])
+def test_invalid_lines_are_rejected(line, error):
+    with pytest.raises(ValueError, match="^" + re.escape(error) + "$"):
+        bulk.parse_record(line)
+
+
+def test_valid_upsert_is_converted_to_the_stored_shape():
+    op, key, fields = bulk.parse_record(
+        '{"op": "upsert", "permit_id": " P1 ", "pandal": {"name": " Raja ", "area": "Dadar", '
+        '"lat": 19, "lon": 72.8, "opening_time": "08:00", "closing_time": "01:00"}}')
+
+    assert (op, key) == ("upsert", {"permit_id": "P1"})
+    assert fields["name"] == "Raja" and fields["permit_id"] == "P1"
+    assert fields["location"] == {"type": "Point", "coordinates": [72.8, 19.0]}
+    assert (fields["open_minutes"], fields["close_minutes"]) == (480, 1500)
+
+
+def test_bad_records_do_not_stop_the_batch(mock_db):
+    lines = [
+        '{"op": "upsert", "permit_id": "P1", "pandal": {"name": "Raja", "area": "Dadar", "lat": 19, "lon": 72.8}}',
+        '{"op": "patch", "permit_id": "P2", "set": {"name": "Nobody"}}',
+    ]
+    batch = [(number, *bulk.parse_record(line)) for number, line in enumerate(lines, 1)]
+
+    results, _ = bulk.apply_batch(mock_db, batch)
+
+    assert [r["status"] for r in results] == ["inserted", "error"]
+    assert results[1]["error"] == "no pandal matches this record"
+    assert mock_db.pandals.count_documents({}) == 1
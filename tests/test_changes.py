@@ -0,0 +1,99 @@
+import changes
+
+
+def insert(db, seq, name):
+    db.pandals.insert_one(dict(name=name, **changes.stamp(seq, created=True)))
+
+
+def names(page):
+    return [payload["name"] for _, _, payload in page]
+
+
+def test_feed_stops_below_a_reservation_still_being_written(mock_db):
+    slow = changes.reserved(mock_db)
+    slow_seq = slow.__enter__()
+    with changes.reserved(mock_db) as fast_seq:
+        insert(mock_db, fast_seq, "fast")
+    assert fast_seq > slow_seq
+
+    page, token, has_more = changes.changes_since(mock_db, 0)
+    assert (page, token, has_more) == ([], 0, False)
+
+    insert(mock_db, slow_seq, "slow")
+    slow.__exit__(None, None, None)
+    page, token, _ = changes.changes_since(mock_db, 0)
+    assert names(page) == ["slow", "fast"]
+    assert token == fast_seq
+
+
+def test_failed_write_releases_its_reservation(mock_db):
+    try:
+        with changes.reserved(mock_db):
+            raise RuntimeError
+    except RuntimeError:
+        pass
+    with changes.reserved(mock_db) as seq:
+        insert(mock_db, seq, "after")
+    assert names(changes.changes_since(mock_db, 0)[0]) == ["after"]
+
+
+def test_abandoned_marker_expires(mock_db, monkeypatch):
+    stuck = changes.reserved(mock_db)
+    stuck.__enter__()  # a writer that never finishes
+    with changes.reserved(mock_db) as seq:
+        insert(mock_db, seq, "later")
+    assert changes.changes_since(mock_db, 0)[0] == []
+
+    monkeypatch.setattr(changes, "PENDING_TIMEOUT", changes.datetime.timedelta(0))
+    assert names(changes.changes_since(mock_db, 0)[0]) == ["later"]
+    stuck.__exit__(None, None, None)
+
+
+def test_deletes_and_updates_merge_in_sequence_order(mock_db):
+    with changes.reserved(mock_db, 2) as first:
+        insert(mock_db, first, "a")
+        insert(mock_db, first + 1, "b")
+    with changes.reserved(mock_db) as seq:
+        mock_db.pandals.update_one({"name": "a"}, {"$set": changes.stamp(seq)})
+    with changes.reserved(mock_db) as seq:
+        pandal = mock_db.pandals.find_one_and_delete({"name": "b"})
+        changes.record_delete(mock_db, str(pandal["_id"]), seq)
+
+    page, token, _ = changes.changes_since(mock_db, 1)
+    assert [(seq, op) for seq, op, _ in page] == [(3, "update"), (4, "delete")]
+    # "a" was rewritten at 3, so from scratch it arrives once, as an insert
+    page, token, has_more = changes.changes_since(mock_db, 0, limit=1)
+    assert [(seq, op) for seq, op, _ in page] == [(3, "insert")]
+    assert (token, has_more) == (3, True)
+
+
+def test_backfill_stamps_rows_written_outside_the_app(mock_db):
+    mock_db.pandals.insert_many([{"name": "legacy"}, {"name": "seeded"}])
+    assert changes.backfill_change_seq(mock_db) == {"updated": 2}
+    assert changes.backfill_change_seq(mock_db) == {"updated": 0}
+    assert sorted(names(changes.changes_since(mock_db, 0)[0])) == ["legacy", "seeded"]
+
+
+def test_tokens_from_another_catalog_restart_from_zero(mock_db):
+    with changes.reserved(mock_db, 3):
+        pass
+    epoch, since, reset = changes.resume(mock_db, 2)
+    assert (since, reset) == (2, False)
+    assert changes.resume(mock_db, 2, epoch) == (epoch, 2, False)
+    assert changes.resume(mock_db, 9, epoch) == (epoch, 0, True)
+
+    mock_db.counters.drop()  # the database was reset and re-seeded
+    new_epoch, since, reset = changes.resume(mock_db, 2, epoch)
+    assert new_epoch != epoch and (since, reset) == (0, True)
+
+
+def test_feed_serves_seeded_rows_and_resets_stale_clients(app_env):
+    _, flask_app, db, docs = app_env  # seeded straight into the collection, unstamped
+    client = flask_app.test_client()
+
+    page = client.get("/api/pandals/changes").get_json()
+    assert len(page["changes"]) == len(docs) and not page["reset"]
+
+    db.counters.delete_many({})
+    stale = client.get(f"/api/pandals/changes?since={page['next']}&epoch={page['epoch']}").get_json()
+    assert stale["reset"] and stale["epoch"] != page["epoch"]
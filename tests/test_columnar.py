@@ -0,0 +1,24 @@
+import msgpack
+import pytest
+
+import columnar
+
+
+def rounded(rows):
+    return [dict(row, **{f: None if row[f] is None else round(row[f], columnar.COORDINATE_PLACES)
+                         for f in ("lat", "lon")})
+            for row in rows]
+
+
+@pytest.mark.parametrize("fmt", ["columnar", "msgpack"])
+def test_decoded_columns_match_the_json_catalog(app_env, fmt):
+    _, flask_app, db, _ = app_env
+    db.pandals.insert_one({"name": "No theme, no location", "area": "Dadar"})
+    client = flask_app.test_client()
+
+    rows = client.get("/api/pandals").get_json()
+    response = client.get("/api/pandals", query_string={"format": fmt})
+    columns = response.get_json() if fmt == "columnar" else msgpack.unpackb(response.get_data())
+
+    assert columns["count"] == len(rows) == 31
+    assert columnar.decode_columns(columns) == rounded(rows)
@@ -0,0 +1,69 @@
+import geofence
+
+LAT, LON = 19.0, 72.8
+
+
+def north(metres):
+    return LAT + metres / geofence.METRES_PER_DEGREE
+
+
+def fences(mock_db):
+    index = geofence.GeofenceIndex(radius_m=100)
+    mock_db.pandals.insert_many([
+        {"name": "Raja", "location": {"type": "Point", "coordinates": [LON, LAT]}},
+        # Straddles a grid line, so its fence spans several cells
+        {"name": "Edge", "location": {"type": "Point", "coordinates": [72.85, 19.1]}, "geofence_m": 50},
+    ])
+    index.build(mock_db.pandals)
+    return index
+
+
+def names(events):
+    return [(e["event"], e["name"]) for e in events]
+
+
+def test_enter_and_exit_with_hysteresis(mock_db):
+    index = fences(mock_db)
+    steps = [
+        (150, []),                     # outside
+        (90, [("enter", "Raja")]),
+        (110, []),                     # past the radius but inside the exit margin
+        (90, []),                      # still inside: no second enter
+        (130, [("exit", "Raja")]),     # beyond 1.2 x radius
+        (130, []),
+        (0, [("enter", "Raja")]),
+    ]
+    for ts, (metres, expected) in enumerate(steps):
+        assert names(index.process_batch([("u1", north(metres), LON, ts)])) == expected
+
+
+def test_fence_is_found_from_a_neighbouring_cell(mock_db):
+    index = fences(mock_db)
+    just_below = 19.1 - 40 / geofence.METRES_PER_DEGREE
+    assert geofence._cell(just_below, 72.85) != geofence._cell(19.1, 72.85)
+
+    assert names(index.process_batch([("u1", just_below, 72.85, 1)])) == [("enter", "Edge")]
+
+
+def test_late_pings_and_batches_are_ordered_by_timestamp(mock_db):
+    index = fences(mock_db)
+    # Delivered out of order in one batch: sorted, so the enter comes before the exit
+    events = index.process_batch([("u1", north(200), LON, 20), ("u1", north(0), LON, 10)])
+    assert [(e["event"], e["ts"]) for e in events] == [("enter", 10), ("exit", 20)]
+    # A ping older than the last one is ignored
+    assert index.process_batch([("u1", north(0), LON, 15)]) == []
+
+
+def test_state_expires_by_server_time(mock_db, monkeypatch):
+    index = fences(mock_db)
+    clock = [1000.0]
+    monkeypatch.setattr(geofence.time, "monotonic", lambda: clock[0])
+    index._last_sweep = clock[0]
+    index.process_batch([("u1", north(0), LON, 5)])
+
+    clock[0] += geofence.STATE_TTL + geofence.SWEEP_INTERVAL + 1
+    index.process_batch([("u2", north(500), LON, 6)])
+
+    assert "u1" not in index._users
+    # The device's clock went backwards, but the forgotten user starts over
+    assert names(index.process_batch([("u1", north(0), LON, 1)])) == [("enter", "Raja")]
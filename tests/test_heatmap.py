@@ -0,0 +1,52 @@
+import random
+
+import heatmap
+
+
+def cells(db):
+    """Non-empty cells; a cell emptied by $inc stays behind as zeros"""
+    result = {}
+    for c in db.heatmap_cells.find():
+        values = (c.get("pandals", 0), c.get("visits", 0), round(c.get("rating_sum", 0), 6), c.get("rating_count", 0))
+        if any(values):
+            result[c["_id"]] = values
+    return result
+
+
+def point(rng):
+    return {"type": "Point", "coordinates": [72.8 + rng.random() * 0.1, 19.0 + rng.random() * 0.1]}
+
+
+def test_moves_and_deletes_match_a_rebuild(mock_db):
+    rng = random.Random(11)
+    db = mock_db
+    ids = db.pandals.insert_many([{"name": f"P{i}", "location": point(rng)} for i in range(20)]).inserted_ids
+    for pandal_id in ids:
+        # The app stores pandal_id as a string, models.Database as an ObjectId
+        db.visits.insert_many([{"pandal_id": str(pandal_id)}, {"pandal_id": pandal_id}])
+        db.ratings.insert_many([{"pandal_id": str(pandal_id), "rating": rng.randint(1, 5)},
+                                {"pandal_id": pandal_id, "rating": str(rng.randint(1, 5))}])
+    heatmap.rebuild(db)
+
+    for pandal_id in ids[:6]:
+        old = db.pandals.find_one({"_id": pandal_id})
+        new = dict(old, location=point(rng))
+        db.pandals.replace_one({"_id": pandal_id}, new)
+        heatmap.pandals_changed(db, [(old, new)])
+    for pandal_id in ids[6:9]:
+        old = db.pandals.find_one({"_id": pandal_id})
+        db.pandals.delete_one({"_id": pandal_id})
+        heatmap.pandals_changed(db, [(old, None)])
+    added = {"name": "New", "location": point(rng)}
+    db.pandals.insert_one(added)
+    heatmap.pandals_changed(db, [(None, added)])
+    db.visits.insert_one({"pandal_id": str(added["_id"])})
+    heatmap.visit_recorded(db, str(added["_id"]))
+    db.ratings.insert_one({"pandal_id": str(ids[0]), "rating": 4})
+    heatmap.rating_recorded(db, str(ids[0]), 4)
+
+    incremental = cells(db)
+    # Ratings and visits of deleted pandals are left out of a rebuild too
+    heatmap.rebuild(db)
+    assert incremental == cells(db)
+    assert sum(v[0] for k, v in incremental.items() if k.startswith("0:")) == 18
@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta
+
+import leaderboard
+
+
+class RatingsDuringRebuild:
+    """The ratings collection, with a rating written around the aggregate"""
+
+    def __init__(self, ratings, before, after):
+        self.ratings = ratings
+        self.before = before
+        self.after = after
+
+    def find_one(self, *args, **kwargs):
+        return self.ratings.find_one(*args, **kwargs)
+
+    def aggregate(self, pipeline):
+        self.before()
+        result = list(self.ratings.aggregate(pipeline))
+        self.after()
+        return result
+
+
+def test_ratings_added_during_a_rebuild_are_kept(app_env):
+    _, _, db, docs = app_env
+    board = leaderboard.Leaderboard()
+    board.rebuild(db.pandals, db.ratings)
+    pandal_id = str(docs[0]["_id"])
+    before = {row["pandal_id"]: row["count"] for row in board.top(limit=100)}[pandal_id]
+
+    def rate():
+        rating = {"pandal_id": pandal_id, "rating": 5, "created_at": datetime.utcnow() + timedelta(seconds=1)}
+        db.ratings.insert_one(rating)
+        board.add_rating(pandal_id, 5.0, created_at=rating["created_at"])
+
+    board.rebuild(db.pandals, RatingsDuringRebuild(db.ratings, rate, rate))
+
+    counts = {row["pandal_id"]: row["count"] for row in board.top(limit=100)}
+    assert counts[pandal_id] == before + 2
+    assert not board.rebuilding
+    # A later rebuild from Mongo agrees
+    board.rebuild(db.pandals, db.ratings)
+    assert {row["pandal_id"]: row["count"] for row in board.top(limit=100)}[pandal_id] == before + 2
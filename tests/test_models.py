@@ -0,0 +1,65 @@
+import importlib.util
+import os
+
+import pytest
+
+
+@pytest.fixture
+def database(app_env):
+    """models.Database on the test app (models.py sits beside the models package)"""
+    app_module, flask_app, db, docs = app_env
+    spec = importlib.util.spec_from_file_location(
+        "models_database", os.path.join(os.path.dirname(app_module.__file__), "models.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    database = module.Database(flask_app)
+    database.db = db
+    return database
+
+
+def test_delete_drops_the_pandal_from_derived_data(app_env, database):
+    import neighbours
+
+    app_module, flask_app, db, docs = app_env
+    with flask_app.app_context():
+        neighbours.build_neighbours(db.pandals, flask_app.config["NEIGHBOUR_DIR"])
+        board = app_module.get_leaderboard()
+    gone = str(docs[0]["_id"])
+    assert gone in board
+
+    database.delete_pandal(gone)
+
+    assert gone not in board
+    assert gone not in neighbours.read_index(flask_app.config["NEIGHBOUR_DIR"])["ids"]
+    other = str(docs[1]["_id"])
+    table = neighbours.NeighbourIndex(flask_app.config["NEIGHBOUR_DIR"])
+    assert gone not in [n["id"] for n in table.nearby(other)]
+
+
+def test_changing_one_time_recomputes_the_open_at_fields(app_env, database):
+    import opening_hours
+
+    _, _, db, docs = app_env
+    pandal_id = docs[0]["_id"]
+    db.pandals.update_one({"_id": pandal_id}, {"$set": dict(
+        opening_time="06:00", closing_time="22:00", **opening_hours.hours_fields("06:00", "22:00"))})
+
+    database.update_pandal(str(pandal_id), {"closing_time": "02:00"})
+
+    after_midnight = opening_hours.open_at_filter(60)
+    assert db.pandals.count_documents(dict(after_midnight, _id=pandal_id)) == 1
+    stored = db.pandals.find_one({"_id": pandal_id})
+    assert (stored["open_minutes"], stored["close_minutes"]) == (360, 1560)
+
+
+def test_update_invalidates_cached_pages_of_both_areas(app_env, database):
+    app_module, _, db, docs = app_env
+    pandal = docs[0]
+    app_module.cache.configure(maxsize=100)
+    app_module.cache.set("view:/taluka/old?", "old", [f"area:{pandal['area']}"])
+    app_module.cache.set("view:/taluka/New?", "new", ["area:New"])
+
+    database.update_pandal(str(pandal["_id"]), {"area": "New"})
+
+    assert app_module.cache.get("view:/taluka/old?") is None
+    assert app_module.cache.get("view:/taluka/New?") is None
@@ -0,0 +1,41 @@
+import random
+
+import numpy as np
+
+import neighbours
+
+
+def table(directory):
+    meta = neighbours.read_index(directory)
+    matrix = np.load(f"{directory}/{meta['matrix']}")
+    return {
+        pid: [(meta["ids"][r], round(float(km), 4)) for r, km in zip(entries["row"], entries["km"]) if r >= 0]
+        for pid, entries in zip(meta["ids"], matrix)
+    }
+
+
+def point(rng):
+    return {"type": "Point", "coordinates": [72.8 + rng.random() * 0.2, 19.0 + rng.random() * 0.2]}
+
+
+def test_incremental_updates_match_a_rebuild(mock_db, tmp_path):
+    rng = random.Random(7)
+    pandals = mock_db.pandals
+    pandals.insert_many([{"name": f"P{i}", "location": point(rng)} for i in range(60)])
+    live = str(tmp_path / "live")
+    neighbours.build_neighbours(pandals, live, k=5)
+
+    for step in range(8):
+        ids = [p["_id"] for p in pandals.find({}, {"_id": 1})]
+        moved = rng.sample(ids, 3)
+        deleted = rng.sample([i for i in ids if i not in moved], 2)
+        for pandal_id in moved:
+            pandals.update_one({"_id": pandal_id}, {"$set": {"location": point(rng)}})
+        pandals.delete_many({"_id": {"$in": deleted}})
+        added = pandals.insert_many([{"name": f"N{step}-{i}", "location": point(rng)} for i in range(3)]).inserted_ids
+
+        neighbours.update_neighbours(pandals, live, changed_ids=moved + added, deleted_ids=deleted)
+
+        fresh = str(tmp_path / f"fresh-{step}")
+        neighbours.build_neighbours(pandals, fresh, k=5)
+        assert table(live) == table(fresh)
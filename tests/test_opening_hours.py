@@ -0,0 +1,23 @@
+from datetime import datetime, timezone
+
+import opening_hours
+
+
+def test_update_recomputes_minutes_from_the_stored_other_time():
+    stored = {"opening_time": "06:00", "closing_time": "22:00"}
+    assert opening_hours.hours_update({"closing_time": "02:00"}, stored) == (
+        {"open_minutes": 360, "close_minutes": 1560}, {})
+    assert opening_hours.hours_update({"name": "renamed"}, stored) == ({}, {})
+    assert opening_hours.hours_update({"opening_time": "late"}, stored) == (
+        {}, {"open_minutes": "", "close_minutes": ""})
+
+
+def test_now_is_taken_in_india(monkeypatch):
+    class Clock(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime(2025, 9, 20, 20, 0, tzinfo=timezone.utc).astimezone(tz)
+
+    monkeypatch.setattr(opening_hours, "datetime", Clock)
+    # 20:00 UTC is 01:30 the next morning in Mumbai
+    assert opening_hours.parse_open_at("now") == 90
@@ -0,0 +1,36 @@
+import page_cache
+
+
+def test_invalidation_reaches_other_workers(mock_db):
+    workers = [page_cache.PageCache() for _ in range(2)]
+    for cache in workers:
+        cache.configure(broadcast=page_cache.Broadcast(mock_db.page_cache_invalidations, interval=0))
+        cache.set("view:/taluka/Dadar?", "<html>Dadar</html>", ["area:Dadar"])
+        cache.set("view:/taluka/Worli?", "<html>Worli</html>", ["area:Worli"])
+
+    workers[0].invalidate(["area:Dadar"])
+
+    assert workers[1].get("view:/taluka/Dadar?") is None
+    assert workers[1].get("view:/taluka/Worli?") == "<html>Worli</html>"
+    # Applied once: a page cached again afterwards is not dropped by the same record
+    workers[1].set("view:/taluka/Dadar?", "<html>Dadar 2</html>", ["area:Dadar"])
+    assert workers[1].get("view:/taluka/Dadar?") == "<html>Dadar 2</html>"
+    workers[0].set("view:/taluka/Dadar?", "<html>Dadar 2</html>", ["area:Dadar"])
+    assert workers[0].get("view:/taluka/Dadar?") == "<html>Dadar 2</html>"
+
+
+def test_cards_keep_one_entry_per_pandal_apart_from_pages(app_env):
+    app_module, flask_app, db, docs = app_env
+    app_module.cache.configure(maxsize=1)
+    app_module.fragments.configure(maxsize=100)
+    app_module.cache.set("view:/?", "<html>home</html>", ["pandals"])
+    pandal = dict(docs[0], avg_rating=4.0, review_count=1)
+
+    with flask_app.test_request_context():
+        app_module.render_pandal_cards([pandal])
+        cards, hits = app_module.render_pandal_cards([pandal])
+        assert hits == 1
+        app_module.render_pandal_cards([dict(pandal, avg_rating=5.0, review_count=2)])
+
+    assert len(app_module.fragments.backend._entries) == 1
+    assert app_module.cache.get("view:/?") == "<html>home</html>"
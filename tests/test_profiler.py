@@ -0,0 +1,26 @@
+import threading
+import time
+
+import profiler
+
+
+def busy(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_sampler_only_sees_its_thread():
+    stop = threading.Event()
+    other = threading.Thread(target=busy, args=(stop,), daemon=True)
+    other.start()
+    sampler = profiler.Sampler(threading.get_ident(), 0.001)
+    sampler.start()
+    deadline = time.perf_counter() + 0.2
+    while time.perf_counter() < deadline:
+        sum(range(1000))
+    sampler.stop()
+    stop.set()
+    other.join()
+
+    assert sampler.samples
+    assert all("test_sampler_only_sees_its_thread" in stack for stack in sampler.samples)
@@ -0,0 +1,66 @@
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import recommender
+
+
+def seed(db, rng):
+    visits = []
+    ratings = []
+    for user in range(40):
+        # u0 was last active 400 days ago
+        when = datetime.utcnow() - timedelta(days=400 if user == 0 else 1)
+        for pandal in rng.sample(range(25), 6):
+            visits.append({"user_id": f"u{user}", "pandal_id": f"p{pandal}", "visited_at": when})
+        for pandal in rng.sample(range(25), 3):
+            ratings.append({"user_id": f"u{user}", "pandal_id": f"p{pandal}", "rating": rng.randint(1, 5),
+                            "created_at": when})
+    db.visits.insert_many(visits)
+    db.ratings.insert_many(ratings)
+    db.pandals.insert_many([{"_id": f"p{i}", "name": f"Pandal {i}"} for i in range(25)])
+
+
+def dense_recommendations(db, top_n):
+    """The same scores computed densely, without blocks or neighbour pruning"""
+    weights = {}
+    for v in db.visits.find():
+        key = (v["user_id"], v["pandal_id"])
+        weights[key] = max(weights.get(key, 0), recommender.VISIT_WEIGHT)
+    for r in db.ratings.find():
+        key = (r["user_id"], r["pandal_id"])
+        weights[key] = max(weights.get(key, 0), r["rating"] / recommender.RATING_SCALE)
+    users = sorted({u for u, _ in weights})
+    items = sorted({p for _, p in weights})
+    matrix = np.zeros((len(users), len(items)))
+    for (u, p), w in weights.items():
+        matrix[users.index(u), items.index(p)] = w
+    normalised = matrix / np.linalg.norm(matrix, axis=0)
+    similarity = normalised.T @ normalised
+    np.fill_diagonal(similarity, 0)
+    scores = matrix @ similarity
+    scores[matrix > 0] = 0
+    result = {}
+    for i, user in enumerate(users):
+        ranked = sorted(((round(s, 4), items[j]) for j, s in enumerate(scores[i]) if s > 0), reverse=True)
+        result[user] = [s for s, _ in ranked[:top_n]]
+    return result
+
+
+def test_blocked_build_matches_dense_scores(mock_db, monkeypatch):
+    seed(mock_db, random.Random(5))
+    # Blocks of a few rows, so every loop runs many times
+    monkeypatch.setattr(recommender, "MAX_BLOCK_CELLS", 100)
+
+    result = recommender.build_recommendations(mock_db, neighbours=25, top_n=5, active_days=30)
+
+    expected = dense_recommendations(mock_db, 5)
+    stored = {doc["_id"]: doc for doc in mock_db.recommendations.find()}
+    assert result["written"] == len(stored) == 39
+    assert "u0" not in stored
+    for user, doc in stored.items():
+        assert [item["score"] for item in doc["items"]] == expected[user]
+        known = {v["pandal_id"] for v in mock_db.visits.find({"user_id": user})}
+        known |= {r["pandal_id"] for r in mock_db.ratings.find({"user_id": user})}
+        assert not known & {item["pandal_id"] for item in doc["items"]}
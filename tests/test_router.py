@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from scipy import sparse
+from scipy.sparse import csgraph
+
+import router
+
+
+@pytest.fixture
+def graph():
+    """A 12 x 12 street grid with random speeds and some one-way streets"""
+    rng = np.random.default_rng(4)
+    size = 12
+    node = np.arange(size * size).reshape(size, size)
+    pairs = np.concatenate([
+        np.column_stack([node[:, :-1].ravel(), node[:, 1:].ravel()]),
+        np.column_stack([node[:-1, :].ravel(), node[1:, :].ravel()]),
+    ])
+    one_way = rng.random(len(pairs)) < 0.2
+    sources = np.concatenate([pairs[:, 0], pairs[~one_way, 1]])
+    targets = np.concatenate([pairs[:, 1], pairs[~one_way, 0]])
+    metres = np.full(len(sources), 100.0)
+    seconds = metres / rng.uniform(3, 15, len(sources))
+    lat = 19.0 + (node // size).ravel() * 0.001
+    lon = 72.8 + (node % size).ravel() * 0.001
+    return router.RoadGraph.from_edges(lat, lon, sources, targets, metres, seconds, landmarks=4)
+
+
+def true_seconds(graph):
+    n = len(graph)
+    sources = np.repeat(np.arange(n), np.diff(graph.offsets))
+    matrix = sparse.csr_matrix((graph.seconds.astype(np.float64), (sources, graph.targets)), shape=(n, n))
+    return csgraph.dijkstra(matrix)
+
+
+def test_landmark_bound_never_overestimates(graph):
+    exact = true_seconds(graph)
+    rng = np.random.default_rng(9)
+    for target in rng.choice(len(graph), 15, replace=False):
+        for source in rng.choice(len(graph), 5, replace=False):
+            potential = graph._potential(int(source), int(target))
+            bounds = np.array([potential(node) for node in range(len(graph))])
+            # float32 tables: allow their rounding, nothing more
+            assert (bounds <= exact[:, target] * (1 + 1e-6) + 1e-3).all()
+
+
+def test_a_star_finds_the_dijkstra_optimum(graph):
+    exact = true_seconds(graph)
+    rng = np.random.default_rng(2)
+    for source, target in rng.choice(len(graph), (40, 2)):
+        seconds, path = graph.shortest_path(int(source), int(target))
+        assert seconds == pytest.approx(exact[source, target], rel=1e-5)
+        assert path[0] == source and path[-1] == target
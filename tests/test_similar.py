@@ -0,0 +1,53 @@
+import random
+
+import numpy as np
+
+import similar
+
+THEMES = ["Eco", "Traditional", "Mythology", "Social"]
+AREAS = ["Dadar", "Worli", "Lalbaug", "Girgaon"]
+WORDS = "clay lights river fort temple drums flowers paper bamboo mirrors".split()
+
+
+def scores(directory):
+    """Each pandal's top-k scores; ties make the order of equal scores arbitrary"""
+    meta = similar.read_index(directory)
+    matrix = np.load(f"{directory}/{meta['matrix']}")
+    return {
+        pid: sorted((round(float(s), 4) for r, s in zip(entries["row"], entries["score"]) if r >= 0), reverse=True)
+        for pid, entries in zip(meta["ids"], matrix)
+    }
+
+
+def pandal(rng, name):
+    return {
+        "name": name,
+        "theme": rng.choice(THEMES),
+        "area": rng.choice(AREAS),
+        "description": " ".join(rng.sample(WORDS, 3)),
+        "location": {"type": "Point", "coordinates": [72.8 + rng.random() * 0.1, 19.0 + rng.random() * 0.1]},
+    }
+
+
+def test_incremental_updates_match_a_rebuild(mock_db, tmp_path):
+    rng = random.Random(3)
+    pandals = mock_db.pandals
+    pandals.insert_many([pandal(rng, f"P{i}") for i in range(50)])
+    live = str(tmp_path / "live")
+    similar.build_similar(pandals, live, k=5)
+
+    for step in range(8):
+        ids = [p["_id"] for p in pandals.find({}, {"_id": 1})]
+        changed = rng.sample(ids, 3)
+        deleted = rng.sample([i for i in ids if i not in changed], 2)
+        for pandal_id in changed:
+            pandals.update_one({"_id": pandal_id}, {"$set": {
+                "theme": rng.choice(THEMES), "description": " ".join(rng.sample(WORDS, 3))}})
+        pandals.delete_many({"_id": {"$in": deleted}})
+        added = pandals.insert_many([pandal(rng, f"N{step}-{i}") for i in range(3)]).inserted_ids
+
+        similar.update_similar(pandals, live, changed_ids=changed + added, deleted_ids=deleted)
+
+        fresh = str(tmp_path / f"fresh-{step}")
+        similar.build_similar(pandals, fresh, k=5)
+        assert scores(live) == scores(fresh)
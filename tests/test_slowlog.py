@@ -0,0 +1,27 @@
+from types import SimpleNamespace
+
+import slowlog
+
+
+def run(log, request_id, millis, pandal_filter):
+    command = {"find": "pandals", "filter": pandal_filter, "lsid": {"id": 1}}
+    log.started(SimpleNamespace(command_name="find", command=command, database_name="utsav",
+                                connection_id=("localhost", 27017), request_id=request_id))
+    log.succeeded(SimpleNamespace(connection_id=("localhost", 27017), request_id=request_id,
+                                  duration_micros=millis * 1000))
+
+
+def test_only_slow_commands_are_shaped_and_copied(monkeypatch):
+    shaped = []
+    monkeypatch.setattr(slowlog, "query_shape", lambda event: shaped.append(event) or "find pandals ['area']")
+    log = slowlog.SlowQueryLog(threshold_ms=100)
+
+    for request_id in range(50):
+        run(log, request_id, 5, {"area": "Dadar"})
+    run(log, 50, 250, {"area": "Worli"})
+
+    assert len(shaped) == 1
+    [entry] = log.snapshot()
+    assert (entry["shape"], entry["count"], entry["max_ms"]) == ("find pandals ['area']", 1, 250)
+    assert "lsid" not in entry["example"] and "Worli" in entry["example"]
+    assert not log._pending
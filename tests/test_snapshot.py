@@ -0,0 +1,69 @@
+import functools
+import json
+import threading
+import urllib.request
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+@pytest.fixture
+def static_host(tmp_path):
+    """Serve a directory the way a static host would, with no app behind it"""
+    servers = []
+
+    def serve(directory):
+        handler = functools.partial(SimpleHTTPRequestHandler, directory=str(directory))
+        handler.log_message = lambda *args: None
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return "http://%s:%d" % server.server_address
+
+    yield serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def get(url):
+    with urllib.request.urlopen(url) as response:
+        return response.read()
+
+
+def test_bundle_serves_the_map_and_detail_data_without_the_app(app_env, static_host, tmp_path):
+    import snapshot
+
+    app_module, flask_app, db, docs = app_env
+    out_dir = tmp_path / "site"
+    result = snapshot.export_snapshot(flask_app, out_dir)
+    assert result["failed"] == 0
+    app_module.mongo.db = None  # nothing below may reach the app's database
+
+    base = static_host(out_dir)
+    assert b"maps.js" in get(base + "/all-pandals/")
+
+    # The URLs maps.js and the detail modal fetch, query string and all
+    feed = json.loads(get(base + "/api/pandals/changes?since=42&epoch=stale"))
+    assert feed["reset"] and not feed["has_more"]
+    assert {c["id"] for c in feed["changes"]} == {str(d["_id"]) for d in docs}
+
+    pandal_id = str(docs[0]["_id"])
+    assert json.loads(get(f"{base}/api/pandals/{pandal_id}"))["name"] == docs[0]["name"]
+
+
+def test_deleted_pandal_data_is_removed(app_env, tmp_path):
+    import snapshot
+
+    _, flask_app, db, docs = app_env
+    out_dir = tmp_path / "site"
+    snapshot.export_snapshot(flask_app, out_dir)
+    gone = docs[0]["_id"]
+    assert (out_dir / "api" / "pandals" / str(gone)).exists()
+
+    db.pandals.delete_one({"_id": gone})
+    snapshot.export_snapshot(flask_app, out_dir)
+
+    assert not (out_dir / "api" / "pandals" / str(gone)).exists()
+    feed = json.loads((out_dir / "api" / "pandals" / "changes").read_text())
+    assert str(gone) not in {c["id"] for c in feed["changes"] if c["op"] != "delete"}
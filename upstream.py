@@ -0,0 +1,93 @@
+"""Async clients for the external services used by the map endpoints.
+
+Every helper takes an httpx.AsyncClient so a view can open one client,
+fan out its upstream calls with asyncio.gather and wait for the slowest
+call instead of the sum of all of them. Failures are reported as None,
+matching how the synchronous code treated upstream errors.
+"""
+import asyncio
+import os
+
+import httpx
+
+from instrumentation import HTTPX_EVENT_HOOKS
+
+# Each endpoint can be pointed elsewhere (local stubs, a self-hosted OSRM)
+# through an environment variable of the same name.
+OSRM_URL = os.environ.get("OSRM_URL", "https://router.project-osrm.org/route/v1/driving")
+OVERPASS_URL = os.environ.get("OVERPASS_URL", "http://overpass-api.de/api/interpreter")
+NOMINATIM_URL = os.environ.get("NOMINATIM_URL", "https://nominatim.openstreetmap.org/search")
+GOOGLE_PLACES_URL = os.environ.get("GOOGLE_PLACES_URL", "https://maps.googleapis.com/maps/api/place/nearbysearch/json")
+
+DEFAULT_TIMEOUT = 10.0
+# The public OSRM demo server rate-limits aggressively
+OSRM_CONCURRENCY = 4
+
+
+def client(timeout=DEFAULT_TIMEOUT, user_agent=None):
+    headers = {"User-Agent": user_agent} if user_agent else None
+    return httpx.AsyncClient(timeout=timeout, headers=headers, event_hooks=HTTPX_EVENT_HOOKS)
+
+
+async def gather_limited(coros, limit):
+    """asyncio.gather with at most `limit` coroutines in flight"""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(run(c) for c in coros))
+
+
+async def osrm_duration(http, origin, destination):
+    """Driving time in seconds between two (lon, lat) points"""
+    url = f"{OSRM_URL}/{origin[0]},{origin[1]};{destination[0]},{destination[1]}"
+    try:
+        response = await http.get(url, params={"overview": "false"})
+        if response.status_code != 200:
+            return None
+        routes = response.json().get("routes")
+        return routes[0]["duration"] if routes else None
+    except (httpx.HTTPError, ValueError, KeyError):
+        return None
+
+
+async def overpass_elements(http, query):
+    try:
+        response = await http.post(OVERPASS_URL, data={"data": query})
+        if response.status_code != 200:
+            return []
+        return response.json().get("elements", [])
+    except (httpx.HTTPError, ValueError):
+        return []
+
+
+async def nominatim_geocode(http, address):
+    """Return {"lat", "lon", "formatted_address"} or None"""
+    response = await http.get(NOMINATIM_URL, params={"q": address, "format": "json", "limit": 1})
+    response.raise_for_status()
+    matches = response.json()
+    if not matches:
+        return None
+    return {
+        "lat": float(matches[0]["lat"]),
+        "lon": float(matches[0]["lon"]),
+        "formatted_address": matches[0].get("display_name"),
+    }
+
+
+async def google_places(http, lat, lon, radius, place_type, api_key):
+    try:
+        response = await http.get(GOOGLE_PLACES_URL, params={
+            "location": f"{lat},{lon}",
+            "radius": radius,
+            "type": place_type,
+            "key": api_key,
+        })
+        if response.status_code != 200:
+            return []
+        return response.json().get("results", [])
+    except (httpx.HTTPError, ValueError) as e:
+        print(f"Error fetching {place_type}: {str(e)}")
+        return []
@@ -0,0 +1,9 @@
+"""WSGI entry point, e.g. `gunicorn wsgi:app`.
+
+Set WARM_UP = True in config to preload caches in each worker before it
+starts accepting requests. asgi.py serves the same app under uvicorn,
+where the async views share the server's event loop.
+"""
+from app import create_app
+
+app = create_app()